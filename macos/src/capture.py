@@ -0,0 +1,92 @@
+"""
+EBook Converter Pro - conversion output capture
+Reads a Calibre run's output line by line as it is written. Only the
+last few lines stay in memory, the rest is spooled to a temp file that
+is kept as a log if the conversion fails. Calibre's "NN% stage" lines
+are turned into live progress
+"""
+
+import re
+import shutil
+import tempfile
+from collections import deque
+from pathlib import Path
+from typing import BinaryIO, Callable, Deque, Optional
+
+
+# 1a. lines kept in memory, and bytes of full output held before spilling to disk
+TAIL_LINES = 40
+SPOOL_BYTES = 256 * 1024
+
+# 1b. ebook-convert prints e.g. "34% Converting input to HTML..."
+PROGRESS_RE = re.compile(r"^\s*(\d{1,3})%\s*(.*)$")
+
+
+class OutputCapture:
+    """
+    2a. the output of one conversion
+    on_progress(percent, stage) is called whenever the percentage moves
+    """
+    
+    def __init__(self, on_progress: Optional[Callable[[int, str], None]] = None):
+        self.on_progress = on_progress
+        self.percent = -1
+        self._tail: Deque[str] = deque(maxlen=TAIL_LINES)
+        self._spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+        self._partial = b""
+    
+    def feed_line(self, raw: bytes):
+        """
+        2b. one complete line, newline included or not
+        """
+        self._spool.write(raw if raw.endswith(b"\n") else raw + b"\n")
+        line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+        match = PROGRESS_RE.match(line)
+        if match:
+            percent = min(100, int(match.group(1)))
+            if percent != self.percent:
+                self.percent = percent
+                if self.on_progress:
+                    self.on_progress(percent, match.group(2).strip())
+            return
+        if line.strip():
+            self._tail.append(line)
+    
+    def feed(self, data: bytes):
+        """
+        2c. an arbitrary chunk, for output read from a growing file
+        """
+        lines = (self._partial + data).split(b"\n")
+        self._partial = lines.pop()
+        for raw in lines:
+            self.feed_line(raw)
+    
+    def read_stream(self, stream: BinaryIO):
+        """
+        2d. consumes a pipe until the process closes it
+        """
+        for raw in iter(lambda: stream.readline(SPOOL_BYTES), b""):
+            self.feed_line(raw)
+    
+    def finish(self):
+        if self._partial:
+            self.feed_line(self._partial)
+            self._partial = b""
+    
+    def tail(self, limit: int = 200) -> str:
+        """
+        2e. the end of the non-progress output, where errors are
+        """
+        return "\n".join(self._tail)[-limit:]
+    
+    def save(self, path: Path):
+        """
+        2f. writes the full output to a log file
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._spool.seek(0)
+        with open(path, "wb") as f:
+            shutil.copyfileobj(self._spool, f)
+    
+    def close(self):
+        self._spool.close()
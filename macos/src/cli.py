@@ -0,0 +1,584 @@
+#!/usr/bin/env python3
+"""
+EBook Converter Pro - command line
+Headless batch conversion for servers, cron jobs and containers
+Only imports the conversion engine, never customtkinter
+"""
+
+import argparse
+import os
+import queue
+import signal
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from cache import DEFAULT_CACHE_BYTES, ConversionCache
+from comics import DEFAULT_QUALITY, ComicOptions, parse_size, pillow_available
+from dedup import DEDUP_MODES
+from governor import DEFAULT_NICE, ResourceLimits
+from history import DEFAULT_TIMEOUT_CEILING, DEFAULT_TIMEOUT_FLOOR
+from library_index import LibraryIndex
+from converter import APP_NAME, APP_VERSION, INCREMENTAL_MODES, ConversionWorker, target_formats
+from formats import EBOOK_FORMATS
+from journal import load_journal
+
+
+# 1a. exit codes
+EXIT_OK = 0
+EXIT_FAILED = 1          # at least one file failed to convert
+EXIT_USAGE = 2           # bad arguments (argparse uses this too)
+EXIT_NO_CALIBRE = 3      # ebook-convert not found
+EXIT_INTERRUPTED = 130   # stopped with Ctrl+C
+
+
+def _format_list(value: str) -> List[str]:
+    """
+    1b. parses "epub,pdf" style format lists
+    """
+    formats = [v.strip().upper() for v in value.split(",") if v.strip()]
+    unknown = [f for f in formats if f not in EBOOK_FORMATS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown format(s): {', '.join(unknown)}")
+    return formats
+
+
+def _size(value: str):
+    """
+    1c. parses "1072x1448" page sizes
+    """
+    try:
+        return parse_size(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    2a. command line options
+    """
+    parser = argparse.ArgumentParser(
+        prog="ebook-converter-cli",
+        description=f"{APP_NAME} - batch convert a folder of ebooks without the GUI",
+    )
+    parser.add_argument("source", type=Path, help="folder containing ebooks")
+    parser.add_argument("output", type=Path, help="folder to write converted files to")
+    parser.add_argument(
+        "-t", "--to", dest="output_formats", type=_format_list, required=True,
+        help=f"target format ({', '.join(EBOOK_FORMATS)}), or several comma separated, "
+             f"converted once to EPUB or AZW3 when listed and derived from it",
+    )
+    parser.add_argument(
+        "-f", "--from", dest="source_formats", type=_format_list,
+        default=list(EBOOK_FORMATS.keys()),
+        help="comma separated source formats to pick up (default: all)",
+    )
+    parser.add_argument(
+        "-r", "--recursive", action="store_true",
+        help="include subfolders, mirrored under the output folder",
+    )
+    parser.add_argument(
+        "--max-depth", type=int, default=None,
+        help="with --recursive, how many folder levels to descend (default: no limit)",
+    )
+    parser.add_argument(
+        "--follow-symlinks", action="store_true",
+        help="with --recursive, descend into symlinked folders (loops are skipped)",
+    )
+    parser.add_argument(
+        "--index", action="store_true",
+        help="scan through the library index, only folders that changed are listed again",
+    )
+    parser.add_argument(
+        "--index-db", type=Path, default=None,
+        help="library index database (default: in the per-user config folder)",
+    )
+    parser.add_argument(
+        "-i", "--incremental", nargs="?", const="mtime", choices=INCREMENTAL_MODES,
+        default=None,
+        help="skip outputs that are up to date, by 'mtime' (default) or content 'hash'",
+    )
+    parser.add_argument(
+        "--dedup", nargs="?", const="copy", choices=DEDUP_MODES, default=None,
+        help="convert identical files once, then 'copy' (default) or hard-'link' "
+             "the result to the other copies",
+    )
+    parser.add_argument(
+        "--dedup-report", type=Path, default=None, metavar="FILE",
+        help="with --dedup, write the groups of identical files to FILE as json",
+    )
+    parser.add_argument(
+        "--calibre-option", dest="convert_options", action="append", default=[],
+        metavar="ARG",
+        help="extra ebook-convert argument, repeatable (use --calibre-option=--flag)",
+    )
+    parser.add_argument(
+        "--no-native", dest="native", action="store_false",
+        help="send every file to calibre, even pairs the built-in converters handle "
+             "(they are also off with --calibre-option)",
+    )
+    parser.add_argument(
+        "--comic-size", type=_size, default=None, metavar="WxH",
+        help="shrink comic pages to fit WxH pixels, e.g. 1072x1448 for a 300 ppi "
+             "e-reader (needs Pillow), also rewrites CBZ to CBZ",
+    )
+    parser.add_argument(
+        "--comic-grayscale", action="store_true",
+        help="make comic pages grayscale (needs Pillow)",
+    )
+    parser.add_argument(
+        "--comic-quality", type=int, default=DEFAULT_QUALITY, metavar="N",
+        help=f"JPEG quality of pages --comic-size or --comic-grayscale touched (default: {DEFAULT_QUALITY})",
+    )
+    _add_run_options(parser)
+    parser.add_argument("--version", action="version", version=f"{APP_NAME} {APP_VERSION}")
+    return parser
+
+
+def build_resume_parser() -> argparse.ArgumentParser:
+    """
+    2b. options for "resume OUTPUT", format and calibre options come from the journal
+    """
+    parser = argparse.ArgumentParser(
+        prog="ebook-converter-cli resume",
+        description="continue an interrupted batch from its journal in the output folder",
+    )
+    parser.add_argument("output", type=Path, help="output folder of the interrupted batch")
+    _add_run_options(parser)
+    return parser
+
+
+def build_serve_parser() -> argparse.ArgumentParser:
+    """
+    2c. options for "serve", the local HTTP conversion service
+    service.py (and http.server) only loads for it, like asyncio for --asyncio
+    """
+    from service import (
+        DEFAULT_CLIENT_QUEUE, DEFAULT_HOST, DEFAULT_KEEP, DEFAULT_MAX_UPLOAD, DEFAULT_PORT, DEFAULT_QUEUE_SIZE
+    )
+    
+    parser = argparse.ArgumentParser(
+        prog="ebook-converter-cli serve",
+        description="serve conversions over HTTP to other tools on this machine: "
+                    "POST /jobs?to=EPUB&name=book.pdf with the book as the body, "
+                    "then GET /jobs/ID for its status and /jobs/ID/output for the result",
+    )
+    parser.add_argument(
+        "--host", default=DEFAULT_HOST,
+        help=f"address to listen on (default: {DEFAULT_HOST}, this machine only)",
+    )
+    parser.add_argument(
+        "--port", type=int, default=DEFAULT_PORT,
+        help=f"port to listen on, 0 picks a free one (default: {DEFAULT_PORT})",
+    )
+    parser.add_argument(
+        "--spool", type=Path, default=None, metavar="DIR",
+        help="folder for uploads and results (default: a temp folder removed on exit)",
+    )
+    parser.add_argument(
+        "--queue-size", type=int, default=DEFAULT_QUEUE_SIZE, metavar="N",
+        help=f"jobs that may wait in all, more are refused with 503 (default: {DEFAULT_QUEUE_SIZE})",
+    )
+    parser.add_argument(
+        "--client-queue", type=int, default=DEFAULT_CLIENT_QUEUE, metavar="N",
+        help=f"jobs one client may have waiting, more are refused with 429 (default: {DEFAULT_CLIENT_QUEUE})",
+    )
+    parser.add_argument(
+        "--max-upload", type=int, default=DEFAULT_MAX_UPLOAD // (1024 * 1024), metavar="MB",
+        help=f"largest book accepted (default: {DEFAULT_MAX_UPLOAD // (1024 * 1024)} MB)",
+    )
+    parser.add_argument(
+        "--keep", type=float, default=DEFAULT_KEEP, metavar="SECONDS",
+        help=f"how long finished jobs are kept for download (default: {DEFAULT_KEEP:.0f})",
+    )
+    parser.add_argument(
+        "--no-native", dest="native", action="store_false",
+        help="send every file to calibre, even pairs the built-in converters handle",
+    )
+    _add_run_options(parser)
+    return parser
+
+
+def _add_run_options(parser: argparse.ArgumentParser):
+    """
+    2d. options that only change how a batch runs, shared with "resume"
+    """
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count() or 1,
+        help="number of parallel conversions (default: CPU count)",
+    )
+    parser.add_argument(
+        "--cache", action="store_true",
+        help="reuse earlier conversions of identical content",
+    )
+    parser.add_argument(
+        "--cache-dir", type=Path, default=None,
+        help="cache location (default: the per-user cache folder)",
+    )
+    parser.add_argument(
+        "--cache-size", type=int, default=DEFAULT_CACHE_BYTES // (1024 * 1024),
+        help="cache size limit in MB, least recently used entries go first",
+    )
+    parser.add_argument(
+        "--cache-link", action="store_true",
+        help="hard-link cached files into the output folder instead of copying",
+    )
+    parser.add_argument(
+        "--memory-budget", type=int, default=None, metavar="MB",
+        help="predicted memory all running conversions may use together "
+             "(default: 75%% of RAM, 0 for no limit)",
+    )
+    parser.add_argument(
+        "--memory-limit", type=int, default=0, metavar="MB",
+        help="hard memory limit for each conversion process (default: none)",
+    )
+    parser.add_argument(
+        "--nice", type=int, default=DEFAULT_NICE,
+        help=f"CPU priority niceness for conversions (default: {DEFAULT_NICE})",
+    )
+    parser.add_argument(
+        "--warm", action="store_true",
+        help="keep calibre-debug workers loaded between files instead of "
+             "starting ebook-convert for each one",
+    )
+    parser.add_argument(
+        "--asyncio", action="store_true",
+        help="run conversions as asyncio subprocesses on one event loop instead "
+             "of a thread each, -j can then go well past the CPU count",
+    )
+    parser.add_argument(
+        "--timeout-floor", type=float, default=DEFAULT_TIMEOUT_FLOOR, metavar="SECONDS",
+        help="shortest time any file gets before it counts as hung",
+    )
+    parser.add_argument(
+        "--timeout-ceiling", type=float, default=DEFAULT_TIMEOUT_CEILING, metavar="SECONDS",
+        help="longest time any file gets, however large",
+    )
+    parser.add_argument(
+        "--ebook-convert", dest="ebook_convert", default=None,
+        help="path to calibre's ebook-convert (default: auto-detect)",
+    )
+    parser.add_argument(
+        "-q", "--quiet", action="store_true",
+        help="only print the final summary",
+    )
+
+
+def _print_update(msg_type: str, data, state: dict, quiet: bool):
+    """
+    3a. turns worker updates into stdout lines
+    """
+    if msg_type == "progress":
+        state["progress"] = data
+    elif msg_type == "stats":
+        state["stats"] = data
+    elif msg_type == "status":
+        if not quiet:
+            # 3b. streamed scans have no total, so no percentage either
+            prefix = f"[{state['progress']:3.0f}%] " if state["progress"] is not None else ""
+            suffix = f"  ({state['stats'].describe()})" if state["stats"] else ""
+            print(f"{prefix}{data}{suffix}", flush=True)
+    elif msg_type == "log":
+        # 3c. the summary block starts with a blank line, always show it
+        if not quiet or state["summary"] or data.startswith("\n"):
+            state["summary"] = state["summary"] or data.startswith("\n")
+            print(data, flush=True)
+    elif msg_type == "complete":
+        state["results"] = data
+
+
+def _check_run_options(args: argparse.Namespace) -> Optional[str]:
+    """
+    3d. problems with the shared options, None if they are fine
+    """
+    if args.jobs < 1:
+        return "--jobs must be at least 1"
+    if not 0 < args.timeout_floor <= args.timeout_ceiling:
+        return "need 0 < --timeout-floor <= --timeout-ceiling"
+    if args.asyncio and args.warm:
+        return "--warm can't be used with --asyncio"
+    return None
+
+
+def _find_calibre(
+    args: argparse.Namespace,
+    worker: ConversionWorker,
+    targets: List[str],
+    native: bool = True
+) -> Tuple[Optional[str], int]:
+    """
+    3e. (ebook-convert path, exit code), the path is None on errors
+    with native, targets only the built-in converters write are accepted too
+    """
+    ebook_convert = args.ebook_convert or worker.find_ebook_convert()
+    if not ebook_convert:
+        print("error: Calibre's ebook-convert was not found, "
+              "install it from https://calibre-ebook.com/download", file=sys.stderr)
+        return None, EXIT_NO_CALIBRE
+    calibre = worker.calibre if not args.ebook_convert else None
+    unsupported = [fmt for fmt in targets if calibre and not worker.can_write(fmt, native=native)]
+    if unsupported:
+        choices = dict.fromkeys(calibre.output_formats + (worker.registry.target_formats if native else []))
+        print(f"error: Calibre {calibre.version_string} cannot write {', '.join(unsupported)}, "
+              f"choose from: {', '.join(choices)}", file=sys.stderr)
+        return None, EXIT_USAGE
+    return ebook_convert, EXIT_OK
+
+
+def _new_worker(args: argparse.Namespace) -> ConversionWorker:
+    """
+    3f. the thread pool worker, or the asyncio one with --asyncio, both
+    report through the same callback queue
+    """
+    if args.asyncio:
+        from async_engine import AsyncConversionWorker
+        return AsyncConversionWorker(queue.Queue(), max_workers=args.jobs)
+    return ConversionWorker(queue.Queue(), max_workers=args.jobs)
+
+
+def _run_options(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    3g. convert_files keyword arguments from the shared options
+    """
+    cache = None
+    if args.cache or args.cache_dir:
+        cache = ConversionCache(args.cache_dir, args.cache_size * 1024 * 1024, args.cache_link)
+    
+    limits = ResourceLimits.default()
+    if args.memory_budget is not None:
+        limits.memory_budget = args.memory_budget * 1024 * 1024 or None
+    limits.process_memory = args.memory_limit * 1024 * 1024 or None
+    limits.nice = args.nice
+    
+    return {
+        "max_workers": args.jobs,
+        "cache": cache,
+        "warm": args.warm,
+        "timeout_floor": args.timeout_floor,
+        "timeout_ceiling": args.timeout_ceiling,
+        "limits": limits,
+    }
+
+
+def _drive(args: argparse.Namespace, worker: ConversionWorker, thread: threading.Thread, counted: bool) -> int:
+    """
+    3h. drains updates on the main thread so Ctrl+C lands here
+    """
+    thread.start()
+    callback_queue = worker.callback_queue
+    state = {
+        "progress": 0.0 if counted else None,
+        "summary": False,
+        "results": None,
+        "stats": None,
+    }
+    interrupted = False
+    while thread.is_alive() or not callback_queue.empty():
+        try:
+            msg_type, data = callback_queue.get(timeout=0.2)
+        except queue.Empty:
+            continue
+        except KeyboardInterrupt:
+            if not interrupted:
+                interrupted = True
+                print("Stopping conversion...", file=sys.stderr, flush=True)
+                worker.stop()
+            continue
+        _print_update(msg_type, data, state, args.quiet)
+    
+    if interrupted:
+        return EXIT_INTERRUPTED
+    results = state["results"] or {}
+    return EXIT_FAILED if results.get("failed") else EXIT_OK
+
+
+def run(args: argparse.Namespace) -> int:
+    """
+    3i. scans, converts and reports, returns the exit code
+    """
+    if not args.source.is_dir():
+        print(f"error: source folder does not exist: {args.source}", file=sys.stderr)
+        return EXIT_USAGE
+    # 3j. the library index stores absolute paths, keep the scanners in step
+    args.source = Path(os.path.abspath(args.source))
+    problem = _check_run_options(args)
+    if args.dedup_report and not args.dedup:
+        problem = "--dedup-report needs --dedup"
+    comic = ComicOptions(args.comic_size, args.comic_grayscale, args.comic_quality)
+    if comic.active and not pillow_available():
+        problem = "--comic-size and --comic-grayscale need Pillow (pip install Pillow)"
+    elif comic.active and (not args.native or args.convert_options):
+        problem = "--comic-size and --comic-grayscale can't be used with --no-native or --calibre-option"
+    elif not 1 <= args.comic_quality <= 95:
+        problem = "--comic-quality must be between 1 and 95"
+    if problem:
+        print(f"error: {problem}", file=sys.stderr)
+        return EXIT_USAGE
+    
+    worker = _new_worker(args)
+    native = args.native and not args.convert_options
+    ebook_convert, code = _find_calibre(args, worker, args.output_formats, native)
+    if not ebook_convert:
+        return code
+    
+    index = LibraryIndex(args.index_db) if args.index or args.index_db else None
+    
+    if args.recursive:
+        # 3k. stream the walk so the first conversions start right away
+        scan = index.scan if index else worker.iter_folder
+        files = scan(str(args.source), args.source_formats, args.max_depth, args.follow_symlinks)
+        if not args.quiet:
+            print(f"Scanning {args.source} recursively", flush=True)
+    else:
+        if index:
+            index.refresh(str(args.source), max_depth=0)
+            files = index.query(str(args.source), args.source_formats)
+        else:
+            files = worker.scan_folder(str(args.source), args.source_formats)
+        if not args.quiet:
+            print(f"Found {len(files)} file(s) in {args.source}", flush=True)
+        if not files:
+            return EXIT_OK
+    
+    args.output.mkdir(parents=True, exist_ok=True)
+    if load_journal(args.output) and not args.quiet:
+        print(f"note: starting over, an interrupted batch in {args.output} "
+              f"could have been continued with 'resume'", flush=True)
+    
+    thread = threading.Thread(
+        target=worker.convert_files,
+        args=(files, args.output, args.output_formats, ebook_convert),
+        kwargs={
+            **_run_options(args),
+            "incremental": args.incremental,
+            "convert_options": args.convert_options,
+            "source_root": args.source if args.recursive else None,
+            "index": index,
+            "dedup": args.dedup,
+            "dedup_report": args.dedup_report,
+            "native": args.native,
+            "native_options": {"comic": comic.to_dict()} if comic.active else None,
+            # 3l. lets "resume" redo the scan if it never finished
+            "scan": {
+                "root": str(args.source),
+                "formats": args.source_formats,
+                "max_depth": args.max_depth if args.recursive else 0,
+                "follow_symlinks": args.follow_symlinks,
+            },
+        },
+        daemon=True
+    )
+    # 3m. dedup reads the whole scan before converting, so it has a total
+    return _drive(args, worker, thread, hasattr(files, "__len__") or bool(args.dedup))
+
+
+def resume(args: argparse.Namespace) -> int:
+    """
+    3n. continues the batch journaled in args.output
+    """
+    args.output = Path(os.path.abspath(args.output))
+    problem = _check_run_options(args)
+    if problem:
+        print(f"error: {problem}", file=sys.stderr)
+        return EXIT_USAGE
+    state = load_journal(args.output)
+    if state is None:
+        print(f"error: no interrupted batch to resume in {args.output}", file=sys.stderr)
+        return EXIT_USAGE
+    
+    worker = _new_worker(args)
+    settings = state.settings
+    native = settings.get("native", True) and not settings.get("convert_options")
+    ebook_convert, code = _find_calibre(args, worker, target_formats(settings["output_format"]), native)
+    if not ebook_convert:
+        return code
+    if not args.quiet:
+        more = "" if state.scan_complete else ", then the rest of the scan"
+        print(f"Resuming {len(state.pending)} unfinished file(s){more}", flush=True)
+    
+    thread = threading.Thread(
+        target=worker.resume,
+        args=(args.output, ebook_convert),
+        kwargs=_run_options(args),
+        daemon=True
+    )
+    return _drive(args, worker, thread, state.scan_complete)
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt()
+
+
+def serve(args: argparse.Namespace) -> int:
+    """
+    3o. runs the HTTP service until Ctrl+C, -j jobs convert at once
+    """
+    problem = _check_run_options(args)
+    if args.warm or args.asyncio:
+        problem = "--warm and --asyncio don't apply to serve, every job is converted on its own"
+    elif args.queue_size < 1 or args.client_queue < 1:
+        problem = "--queue-size and --client-queue must be at least 1"
+    elif args.max_upload < 1:
+        problem = "--max-upload must be at least 1 MB"
+    if problem:
+        print(f"error: {problem}", file=sys.stderr)
+        return EXIT_USAGE
+    
+    worker = ConversionWorker(queue.Queue())
+    ebook_convert, code = _find_calibre(args, worker, [], args.native)
+    if not ebook_convert:
+        return code
+    from service import ConversionService, ServiceServer
+    
+    options = _run_options(args)
+    del options["max_workers"], options["warm"]
+    service = ConversionService(
+        ebook_convert,
+        [fmt for fmt in EBOOK_FORMATS if worker.can_write(fmt, native=args.native)],
+        spool=args.spool,
+        workers=args.jobs,
+        queue_size=args.queue_size,
+        client_queue=args.client_queue,
+        max_upload=args.max_upload * 1024 * 1024,
+        keep=args.keep,
+        run_options={**options, "native": args.native},
+        registry=worker.registry
+    )
+    try:
+        server = ServiceServer((args.host, args.port), service, args.quiet)
+    except OSError as e:
+        service.close()
+        print(f"error: can't listen on {args.host}:{args.port}: {str(e)}", file=sys.stderr)
+        return EXIT_USAGE
+    
+    # 3p. a service manager's SIGTERM shuts down like Ctrl+C
+    signal.signal(signal.SIGTERM, _interrupt)
+    service.start()
+    host, port = server.server_address[:2]
+    print(f"Serving conversions on http://{host}:{port}/jobs, {args.jobs} at a time, Ctrl+C stops", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping service...", file=sys.stderr, flush=True)
+    finally:
+        server.server_close()
+        service.close()
+    return EXIT_OK
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    4a. cli entry point
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["resume"]:
+        return resume(build_resume_parser().parse_args(argv[1:]))
+    if argv[:1] == ["serve"]:
+        return serve(build_serve_parser().parse_args(argv[1:]))
+    args = build_parser().parse_args(argv)
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,397 @@
+"""
+EBook Converter Pro - comic repacking
+Rewrites CBZ, CBR and CBC comics without Calibre, which decodes every
+page. Pages are copied as they are unless a page size or grayscale is
+asked for, then they are recompressed on a process pool. Every output
+archive is written in a single streaming pass
+"""
+
+import io
+import os
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import BrokenExecutor, Executor, Future
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass
+from pathlib import PurePosixPath
+from typing import Any, BinaryIO, Callable, Deque, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from registry import ConverterRegistry, NativeRequest, NativeUnsupported
+from sniffing import IMAGE_SUFFIXES
+
+# 1a. bytes per read, and the member size past which zip64 headers are needed
+CHUNK_SIZE = 256 * 1024
+ZIP64_LIMIT = 2 ** 31 - 1
+
+# 1b. pages queued for the pool per pool process, bounds memory for big comics
+PAGES_PER_WORKER = 2
+
+DEFAULT_QUALITY = 85
+
+# 1c. archive clutter that is not part of the comic
+JUNK_PREFIXES = ("__MACOSX/",)
+JUNK_NAMES = {"thumbs.db", ".ds_store"}
+
+
+def _pillow():
+    """
+    1d. PIL.Image, or None without Pillow (pages can only be copied)
+    imported on first use, converter loads this module and Pillow, rarfile
+    and the process pool would add their import time to every start
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+
+def _rarfile():
+    """
+    1e. the rarfile module, or None without it (CBR goes to calibre)
+    """
+    try:
+        import rarfile
+    except ImportError:
+        return None
+    return rarfile
+
+
+def pillow_available() -> bool:
+    return _pillow() is not None
+
+
+@dataclass
+class ComicOptions:
+    """
+    2a. page processing for e-ink readers, off unless max_size or grayscale
+    is set. pages are shrunk to fit max_size (width, height), never enlarged,
+    and saved as JPEG at quality
+    """
+    max_size: Optional[Tuple[int, int]] = None
+    grayscale: bool = False
+    quality: int = DEFAULT_QUALITY
+    workers: Optional[int] = None
+    
+    @property
+    def active(self) -> bool:
+        return bool(self.max_size or self.grayscale)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "max_size": list(self.max_size) if self.max_size else None,
+            "grayscale": self.grayscale,
+            "quality": self.quality,
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "ComicOptions":
+        data = data or {}
+        size = data.get("max_size")
+        return cls(
+            max_size=(int(size[0]), int(size[1])) if size else None,
+            grayscale=bool(data.get("grayscale")),
+            quality=int(data.get("quality", DEFAULT_QUALITY)),
+            workers=data.get("workers"),
+        )
+
+
+def parse_size(text: str) -> Tuple[int, int]:
+    """
+    2b. "1072x1448" -> (1072, 1448)
+    """
+    width, sep, height = text.lower().partition("x")
+    if not sep or not width.isdigit() or not height.isdigit() or not int(width) or not int(height):
+        raise ValueError(f"expected WIDTHxHEIGHT, got {text!r}")
+    return int(width), int(height)
+
+
+class _Member(NamedTuple):
+    name: str
+    size: int
+    open: Callable[[], BinaryIO]
+
+
+def _is_page(name: str) -> bool:
+    return name.lower().endswith(IMAGE_SUFFIXES)
+
+
+def _listing(archive, prefix: str = "") -> List[_Member]:
+    """
+    3a. an archive's files in name order, the order readers show pages in
+    works for zipfile and rarfile alike
+    """
+    members = []
+    for info in archive.infolist():
+        name = info.filename.replace("\\", "/")
+        if info.is_dir() or name.startswith(JUNK_PREFIXES) or PurePosixPath(name).name.lower() in JUNK_NAMES:
+            continue
+        members.append(_Member(prefix + name, info.file_size, lambda info=info: archive.open(info)))
+    return sorted(members, key=lambda m: m.name.lower())
+
+
+def _cbc_comics(archive: zipfile.ZipFile) -> List[str]:
+    """
+    3b. a CBC's comics in comics.txt order, else by name
+    """
+    names = set(archive.namelist())
+    order = []
+    if "comics.txt" in names:
+        text = archive.read("comics.txt").decode("utf-8", errors="replace")
+        for line in text.splitlines():
+            name = line.split(":", 1)[0].strip()
+            if name in names and name not in order:
+                order.append(name)
+    rest = sorted(n for n in names if n.lower().endswith((".cbz", ".cbr")) and n not in order)
+    return order + rest
+
+
+@contextmanager
+def open_comic(path, fmt: str) -> Iterator[List[_Member]]:
+    """
+    3c. the members of a CBZ, CBR or CBC, open while the block runs
+    a CBC's comics are read in place from the outer zip, each one's files
+    under a "NN title/" folder so their pages stay in order
+    """
+    with ExitStack() as stack:
+        if fmt == "CBR":
+            rarfile = _rarfile()
+            if rarfile is None:
+                raise NativeUnsupported("rarfile is not installed")
+            yield _listing(stack.enter_context(rarfile.RarFile(str(path))))
+            return
+        archive = stack.enter_context(zipfile.ZipFile(path))
+        if fmt != "CBC":
+            yield _listing(archive)
+            return
+        members = []
+        for n, name in enumerate(_cbc_comics(archive), 1):
+            if not name.lower().endswith(".cbz"):
+                raise NativeUnsupported(f"{name} inside is not a CBZ")
+            inner = stack.enter_context(zipfile.ZipFile(stack.enter_context(archive.open(name))))
+            members.extend(_listing(inner, f"{n:02d} {PurePosixPath(name).stem}/"))
+        if not members:
+            raise NativeUnsupported("no comics inside")
+        yield members
+
+
+def process_page(data: bytes, max_size: Optional[Tuple[int, int]], grayscale: bool, quality: int) -> Optional[bytes]:
+    """
+    4a. one page shrunk and/or made gray, as JPEG, runs in a pool process
+    None keeps the original: it already fits, didn't get smaller, or isn't
+    an image Pillow can read
+    """
+    Image = _pillow()
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            fits = not max_size or (image.width <= max_size[0] and image.height <= max_size[1])
+            if fits and (not grayscale or image.mode in ("L", "1")):
+                return None
+            mode = "L" if grayscale else "RGB"
+            if max_size:
+                # 4b. lets the JPEG decoder skip most of the work for big pages
+                image.draft(mode, max_size)
+            page = image.convert(mode) if image.mode != mode else image
+            if max_size:
+                page.thumbnail(max_size, Image.LANCZOS)
+            buffer = io.BytesIO()
+            page.save(buffer, "JPEG", quality=quality)
+    except Exception:
+        return None
+    result = buffer.getvalue()
+    if fits and len(result) >= len(data):
+        return None
+    return result
+
+
+_pool_lock = threading.Lock()
+_pool: Optional[Executor] = None
+_pool_users = 0
+
+
+@contextmanager
+def _page_pool(workers: Optional[int]) -> Iterator[Executor]:
+    """
+    5a. one pool shared by every comic being converted, so parallel
+    conversions don't each start a process per core. it is held for one
+    comic, batches running side by side (the service) don't close it
+    under each other
+    """
+    global _pool, _pool_users
+    with _pool_lock:
+        if _pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+            _pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1)
+        _pool_users += 1
+        pool = _pool
+    try:
+        yield pool
+    finally:
+        with _pool_lock:
+            _pool_users -= 1
+
+
+def close_page_pool(broken: bool = False):
+    """
+    5b. stops the pool's processes once no comic is using it, the next
+    comic starts a new one. a broken pool is dropped right away
+    """
+    global _pool
+    with _pool_lock:
+        if _pool_users and not broken:
+            return
+        pool, _pool = _pool, None
+    if pool:
+        pool.shutdown(wait=True)
+
+
+class _PageWriter:
+    """
+    6a. writes members into a zip in order, stored since pages are
+    compressed images already. with options active, pages go through the
+    pool while later ones are being read
+    """
+    
+    def __init__(self, out: zipfile.ZipFile, request: NativeRequest, total: int, options: ComicOptions):
+        self.out = out
+        self.request = request
+        self.options = options
+        self.total = max(1, total)
+        self.done = 0
+        self.reported = -1
+        self.taken: Set[str] = set()
+        self.date_time = time.localtime(os.path.getmtime(request.source))[:6]
+    
+    def _progress(self, size: int):
+        self.request.check_stop()
+        self.done += size
+        percent = min(100, self.done * 100 // self.total)
+        if percent >= self.reported + 5:
+            self.reported = percent
+            self.request.on_progress(percent, "Repacking comic")
+    
+    def _info(self, name: str, size: int) -> zipfile.ZipInfo:
+        self.taken.add(name.lower())
+        info = zipfile.ZipInfo(name, date_time=self.date_time)
+        info.compress_type = zipfile.ZIP_STORED
+        info.file_size = size
+        return info
+    
+    def copy(self, member: _Member):
+        """
+        6b. member streamed across chunk by chunk, never held whole
+        """
+        info = self._info(member.name, member.size)
+        with member.open() as src, self.out.open(info, "w", force_zip64=member.size >= ZIP64_LIMIT) as dst:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                dst.write(chunk)
+                self._progress(len(chunk))
+    
+    def _write(self, member: _Member, data: bytes, processed: Optional[bytes]):
+        name = member.name
+        if processed is not None:
+            data = processed
+            jpeg = str(PurePosixPath(name).with_suffix(".jpg"))
+            name = jpeg if jpeg == name or jpeg.lower() not in self.taken else name + ".jpg"
+        self.out.writestr(self._info(name, len(data)), data)
+        self._progress(member.size)
+    
+    def write_all(self, members: List[_Member]):
+        if not self.options.active:
+            for member in members:
+                self.copy(member)
+            return
+        options = self.options
+        limit = PAGES_PER_WORKER * (options.workers or os.cpu_count() or 1)
+        window: Deque[Tuple[_Member, bytes, Optional[Future]]] = deque()
+        with _page_pool(options.workers) as pool:
+            try:
+                for member in members:
+                    with member.open() as src:
+                        data = src.read()
+                    future = None
+                    if _is_page(member.name):
+                        future = pool.submit(process_page, data, options.max_size, options.grayscale, options.quality)
+                    window.append((member, data, future))
+                    while len(window) > limit:
+                        self._flush(window.popleft())
+                while window:
+                    self._flush(window.popleft())
+            except BrokenExecutor:
+                # 6c. a pool process died, start the next comic on a fresh pool
+                close_page_pool(broken=True)
+                raise
+            finally:
+                for _, _, future in window:
+                    if future:
+                        future.cancel()
+    
+    def _flush(self, entry: Tuple[_Member, bytes, Optional[Future]]):
+        member, data, future = entry
+        self._write(member, data, future.result() if future else None)
+
+
+def _comic_options(request: NativeRequest) -> ComicOptions:
+    options = ComicOptions.from_dict(request.options.get("comic"))
+    if options.active and not pillow_available():
+        raise NativeUnsupported("Pillow is not installed, pages can't be resized")
+    return options
+
+
+def _to_cbz(source_format: str):
+    def convert(request: NativeRequest):
+        options = _comic_options(request)
+        with open_comic(request.source, source_format) as members:
+            with zipfile.ZipFile(request.dest, "w") as out:
+                _PageWriter(out, request, sum(m.size for m in members), options).write_all(members)
+    return convert
+
+
+def _to_cbc(source_format: str):
+    """
+    7a. a CBC is a zip of CBZs with a comics.txt index. a CBZ with nothing
+    to change is stored in it byte for byte, anything else is repacked
+    into the inner CBZ as the outer one is written
+    """
+    def convert(request: NativeRequest):
+        options = _comic_options(request)
+        member = f"{request.output.stem}.cbz"
+        size = request.source.stat().st_size
+        with zipfile.ZipFile(request.dest, "w", zipfile.ZIP_DEFLATED) as out:
+            out.writestr("comics.txt", f"{member}:{request.output.stem}\n".encode("utf-8"))
+            if source_format == "CBZ" and not options.active:
+                if not zipfile.is_zipfile(request.source):
+                    raise NativeUnsupported("not a zip archive")
+                whole = _Member(member, size, lambda: open(request.source, "rb"))
+                _PageWriter(out, request, size, options).copy(whole)
+                return
+            with open_comic(request.source, source_format) as members:
+                info = zipfile.ZipInfo(member, date_time=time.localtime(os.path.getmtime(request.source))[:6])
+                info.compress_type = zipfile.ZIP_STORED
+                # 7b. the inner size is unknown until written, zip64 just in case
+                with out.open(info, "w", force_zip64=True) as raw, zipfile.ZipFile(raw, "w") as inner:
+                    _PageWriter(inner, request, sum(m.size for m in members), options).write_all(members)
+    return convert
+
+
+def _rewrite_cbz(request: NativeRequest):
+    """
+    7c. CBZ to CBZ has nothing to do without page options, the converter
+    only queues it when they are set
+    """
+    if not _comic_options(request).active:
+        raise NativeUnsupported("nothing to change")
+    _to_cbz("CBZ")(request)
+
+
+def register(registry: ConverterRegistry):
+    """
+    8a. adds the comic backends to registry
+    """
+    registry.register("CBZ", "CBZ")(_rewrite_cbz)
+    registry.register("CBR", "CBZ")(_to_cbz("CBR"))
+    registry.register("CBC", "CBZ")(_to_cbz("CBC"))
+    registry.register("CBZ", "CBC")(_to_cbc("CBZ"))
+    registry.register("CBR", "CBC")(_to_cbc("CBR"))
@@ -0,0 +1,51 @@
+"""
+EBook Converter Pro - format tables
+Which extensions belong to which ebook format
+"""
+
+from typing import Dict, Iterable, Set
+
+
+# 1a. supported formats that calibre can handle
+EBOOK_FORMATS = {
+    "EPUB": [".epub"],
+    "MOBI": [".mobi"],
+    "AZW3": [".azw3", ".azw"],
+    "PDF": [".pdf"],
+    "DOCX": [".docx"],
+    "TXT": [".txt"],
+    "HTML": [".html", ".htm"],
+    "FB2": [".fb2"],
+    "LIT": [".lit"],
+    "PDB": [".pdb"],
+    "RTF": [".rtf"],
+    "SNB": [".snb"],
+    "TCR": [".tcr"],
+    "HTMLZ": [".htmlz"],
+    "TXTZ": [".txtz"],
+    "CBZ": [".cbz"],
+    "CBR": [".cbr"],
+    "CBC": [".cbc"],
+    "ODT": [".odt"],
+}
+
+# 1b. flatten all extensions for quick lookup
+ALL_EXTENSIONS: Set[str] = set()
+for exts in EBOOK_FORMATS.values():
+    ALL_EXTENSIONS.update(exts)
+
+# 1c. reverse lookup, extension -> format name
+EXTENSION_FORMATS: Dict[str, str] = {
+    ext: fmt for fmt, exts in EBOOK_FORMATS.items() for ext in exts
+}
+
+
+def extensions_for(source_formats: Iterable[str]) -> Set[str]:
+    """
+    1d. all extensions belonging to the given format names
+    """
+    extensions: Set[str] = set()
+    for fmt in source_formats:
+        if fmt in EBOOK_FORMATS:
+            extensions.update(EBOOK_FORMATS[fmt])
+    return extensions
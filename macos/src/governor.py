@@ -0,0 +1,175 @@
+"""
+EBook Converter Pro - resource governor
+Keeps a batch from swapping the machine: conversions run at low CPU and
+I/O priority, optionally under a per-process memory limit, and only
+start while the predicted memory of everything running fits a budget
+"""
+
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from processes import new_group_kwargs
+
+
+# 1a. defaults, the budget leaves a quarter of RAM for everything else
+DEFAULT_NICE = 10
+MEMORY_BUDGET_FRACTION = 0.75
+
+# 1b. rough peak memory of one ebook-convert: a fixed base plus a multiple
+# of the input size, image heavy formats are decoded page by page
+BASE_JOB_MEMORY = 300 * 1024 * 1024
+MEMORY_PER_INPUT_BYTE = {"PDF": 8, "CBR": 6, "CBZ": 6, "CBC": 6, "DJVU": 6}
+DEFAULT_MEMORY_PER_INPUT_BYTE = 3
+
+# 1c. signs in a failed run that it was killed for memory, not bad input
+MEMORY_ERROR_MARKERS = ("MemoryError", "std::bad_alloc", "Cannot allocate memory", "Out of memory")
+
+
+def physical_memory() -> Optional[int]:
+    """
+    2a. total RAM in bytes, None if the platform won't say
+    """
+    if sys.platform == "win32":
+        import ctypes
+        
+        class MemoryStatus(ctypes.Structure):
+            _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong),
+                        ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong),
+                        ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong),
+                        ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong),
+                        ("ullAvailExtendedVirtual", ctypes.c_ulonglong)]
+        
+        status = MemoryStatus()
+        status.dwLength = ctypes.sizeof(MemoryStatus)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return status.ullTotalPhys
+        return None
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def estimate_memory(source_format: str, size: int) -> int:
+    """
+    2b. predicted peak memory of converting one file
+    """
+    per_byte = MEMORY_PER_INPUT_BYTE.get(source_format.upper(), DEFAULT_MEMORY_PER_INPUT_BYTE)
+    return BASE_JOB_MEMORY + size * per_byte
+
+
+def killed_by_limits(returncode: int, output: str) -> bool:
+    """
+    2c. true if a failed conversion looks like it ran out of memory
+    SIGKILL covers the kernel's OOM killer, a process over its own limit
+    says so when an allocation fails, a crash is just a failure
+    """
+    if returncode == 0:
+        return False
+    if sys.platform != "win32" and returncode in (-signal.SIGKILL, 128 + signal.SIGKILL):
+        return True
+    return any(marker in (output or "") for marker in MEMORY_ERROR_MARKERS)
+
+
+@dataclass
+class ResourceLimits:
+    """
+    3a. limits applied to every conversion of one run
+    memory_budget caps the predicted total of all running conversions,
+    process_memory caps each one, both in bytes, None means no limit
+    """
+    memory_budget: Optional[int] = None
+    process_memory: Optional[int] = None
+    nice: int = DEFAULT_NICE
+    idle_io: bool = True
+    
+    @classmethod
+    def default(cls) -> "ResourceLimits":
+        total = physical_memory()
+        return cls(memory_budget=int(total * MEMORY_BUDGET_FRACTION) if total else None)
+    
+    def command(self, cmd: List[str], alone: bool = False) -> List[str]:
+        """
+        3b. prefixes the limits to cmd, each prefix execs the next so the pid
+        stays: ionice on Linux, nice, and a shell that sets the memory limit
+        nothing runs in the child between fork and exec, preexec_fn isn't
+        safe with the worker threads that start conversions
+        RLIMIT_DATA (ulimit -d) rather than RLIMIT_AS, Calibre's Qt WebEngine
+        reserves far more address space than it ever touches
+        a job retried alone may use the whole budget instead of its own cap
+        """
+        if sys.platform == "win32":
+            return list(cmd)
+        prefix = []
+        if self.idle_io and sys.platform.startswith("linux"):
+            ionice = shutil.which("ionice")
+            if ionice:
+                prefix += [ionice, "-c", "3"]
+        nice = shutil.which("nice") if self.nice else None
+        if nice:
+            prefix += [nice, "-n", str(self.nice)]
+        memory = self.memory_budget if alone else self.process_memory
+        sh = shutil.which("sh") if memory else None
+        if sh:
+            prefix += [sh, "-c", f'ulimit -d {max(1, memory // 1024)} && exec "$@"', "sh"]
+        return [*prefix, *cmd]
+    
+    def popen_kwargs(self) -> Dict[str, Any]:
+        """
+        3c. Popen arguments for a conversion process, priority on Windows
+        where there is no command to set it
+        """
+        kwargs = new_group_kwargs()
+        if sys.platform == "win32" and self.nice > 0:
+            kwargs["creationflags"] |= subprocess.BELOW_NORMAL_PRIORITY_CLASS
+        return kwargs
+
+
+class MemoryGate:
+    """
+    4a. admission control, a job waits until its predicted memory fits the
+    budget next to the running ones. one job is always let in, so a file
+    bigger than the whole budget still gets its turn
+    """
+    
+    def __init__(self, budget: Optional[int]):
+        self.budget = budget
+        self._cond = threading.Condition()
+        self._in_use = 0
+        self._running = 0
+    
+    def acquire(self, amount: int, should_stop: Callable[[], bool]) -> bool:
+        """
+        4b. blocks until admitted, False if the run was stopped meanwhile
+        """
+        with self._cond:
+            while self.budget and self._running and self._in_use + amount > self.budget:
+                if should_stop():
+                    return False
+                self._cond.wait(0.2)
+            self._in_use += amount
+            self._running += 1
+            return True
+    
+    def try_acquire(self, amount: int) -> bool:
+        """
+        4c. admits without waiting or says no, for callers that can't block
+        """
+        with self._cond:
+            if self.budget and self._running and self._in_use + amount > self.budget:
+                return False
+            self._in_use += amount
+            self._running += 1
+            return True
+    
+    def release(self, amount: int):
+        with self._cond:
+            self._in_use -= amount
+            self._running -= 1
+            self._cond.notify_all()
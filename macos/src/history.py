@@ -0,0 +1,147 @@
+"""
+EBook Converter Pro - conversion history
+Past conversion timings per format pair, used to predict how long a
+file will take (ETA, scheduling, timeouts)
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from paths import user_config_dir
+
+
+# 1a. used until a format pair has history of its own
+DEFAULT_OVERHEAD = 2.0                    # seconds of calibre startup per file
+DEFAULT_SECONDS_PER_BYTE = 1 / (1024 ** 2)  # about 1 MB/s
+
+# 1b. newest samples kept per format pair
+MAX_SAMPLES = 200
+
+# 1c. timeouts are a multiple of the prediction, kept between floor and
+# ceiling. pairs with little history get a wider margin
+DEFAULT_TIMEOUT_FLOOR = 60.0
+DEFAULT_TIMEOUT_CEILING = 3600.0
+TIMEOUT_FACTOR = 4.0
+UNTRAINED_TIMEOUT_FACTOR = 10.0
+MIN_TIMEOUT_SAMPLES = 5
+
+
+def _fit(samples: List[Tuple[int, float]]) -> Tuple[float, float]:
+    """
+    1d. least squares fit of duration = overhead + size * seconds_per_byte
+    falls back to a min-overhead/average-rate split for degenerate data
+    """
+    n = len(samples)
+    mean_size = sum(s for s, _ in samples) / n
+    mean_dur = sum(d for _, d in samples) / n
+    var = sum((s - mean_size) ** 2 for s, _ in samples)
+    if n >= 3 and var > 0:
+        cov = sum((s - mean_size) * (d - mean_dur) for s, d in samples)
+        slope = max(0.0, cov / var)
+        overhead = max(0.0, mean_dur - slope * mean_size)
+        return overhead, slope
+    overhead = min(d for _, d in samples)
+    slope = (mean_dur - overhead) / mean_size if mean_size else 0.0
+    return overhead, max(0.0, slope)
+
+
+class ConversionHistory:
+    """
+    2a. (size, duration) samples keyed by "SOURCE>TARGET"
+    saved as json in the config folder
+    """
+    
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else user_config_dir() / "history.json"
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._samples: Dict[str, List[Tuple[int, float]]] = {}
+        self._models: Dict[str, Tuple[float, float]] = {}
+        self._dirty = False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for key, samples in data.get("samples", {}).items():
+                self._samples[key] = [(int(s), float(d)) for s, d in samples][-MAX_SAMPLES:]
+        except (OSError, ValueError, TypeError, AttributeError):
+            pass
+    
+    @staticmethod
+    def _key(source_format: str, target_format: str) -> str:
+        return f"{source_format.upper()}>{target_format.upper()}"
+    
+    def record(self, source_format: str, target_format: str, size: int, duration: float):
+        """
+        2b. adds one finished conversion
+        """
+        key = self._key(source_format, target_format)
+        with self._lock:
+            samples = self._samples.setdefault(key, [])
+            samples.append((size, duration))
+            del samples[:-MAX_SAMPLES]
+            self._models.clear()
+            self._dirty = True
+    
+    def model(self, source_format: str, target_format: str) -> Tuple[float, float]:
+        """
+        2c. (overhead seconds, seconds per byte) for a format pair
+        tries the exact pair, then any pair from the same source, then defaults
+        """
+        key = self._key(source_format, target_format)
+        with self._lock:
+            if key in self._models:
+                return self._models[key]
+            samples = self._samples.get(key)
+            if not samples:
+                prefix = f"{source_format.upper()}>"
+                samples = [s for k, v in self._samples.items() if k.startswith(prefix) for s in v]
+            model = _fit(samples) if samples else (DEFAULT_OVERHEAD, DEFAULT_SECONDS_PER_BYTE)
+            self._models[key] = model
+            return model
+    
+    def estimate(self, source_format: str, target_format: str, size: int) -> float:
+        """
+        2d. predicted conversion time in seconds
+        """
+        overhead, per_byte = self.model(source_format, target_format)
+        return overhead + size * per_byte
+    
+    def timeout(
+        self,
+        source_format: str,
+        target_format: str,
+        size: int,
+        floor: float = DEFAULT_TIMEOUT_FLOOR,
+        ceiling: float = DEFAULT_TIMEOUT_CEILING
+    ) -> float:
+        """
+        2e. seconds to allow before a conversion counts as hung
+        """
+        trained = self.sample_count(source_format, target_format) >= MIN_TIMEOUT_SAMPLES
+        factor = TIMEOUT_FACTOR if trained else UNTRAINED_TIMEOUT_FACTOR
+        return min(ceiling, max(floor, factor * self.estimate(source_format, target_format, size)))
+    
+    def sample_count(self, source_format: str, target_format: str) -> int:
+        with self._lock:
+            return len(self._samples.get(self._key(source_format, target_format), ()))
+    
+    def save(self):
+        """
+        2f. writes the history atomically, only if something changed
+        saves from several threads take turns, they share the .tmp file and
+        a later snapshot must not be overwritten by an earlier one
+        """
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                data = {"version": 1, "samples": {k: list(v) for k, v in self._samples.items()}}
+                self._dirty = False
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
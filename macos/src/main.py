@@ -6,215 +6,40 @@ Supports: EPUB, MOBI, AZW3, PDF, DOCX, TXT, HTML, FB2, and more
 """
 
 import customtkinter as ctk
+import tkinter
 from tkinter import filedialog, messagebox
 import threading
-import subprocess
+import multiprocessing
 import os
-import sys
+import sqlite3
+import time
+import traceback
 from pathlib import Path
-from typing import Optional, List, Dict, Set
-import json
+from typing import Callable, List, Dict, Optional, Tuple
 import queue
 
+from cache import ConversionCache
+from calibre import CalibreInfo
+from converter import APP_NAME, APP_VERSION, ConversionWorker, FolderScan, WakeupQueue, target_formats
+from formats import EBOOK_FORMATS
+from journal import load_journal
+from library_index import LibraryIndex
+from logs import SessionLog
 
-# 1a. version info
-APP_NAME = "EBook Converter Pro"
-APP_VERSION = "1.0.0"
 
+# 1a. log panel limits, the full log is spilled to a session file
+LOG_MAX_LINES = 5000
+QUEUE_TIME_BUDGET = 0.015  # seconds of queue draining per UI tick
+FRAME_INTERVAL = 1 / 30     # at most this many UI refreshes per second
+POLL_INTERVAL_MS = 100      # fallback for Tcl builds without thread support
 
-# 1b. supported formats that calibre can handle
-EBOOK_FORMATS = {
-    "EPUB": [".epub"],
-    "MOBI": [".mobi"],
-    "AZW3": [".azw3", ".azw"],
-    "PDF": [".pdf"],
-    "DOCX": [".docx"],
-    "TXT": [".txt"],
-    "HTML": [".html", ".htm"],
-    "FB2": [".fb2"],
-    "LIT": [".lit"],
-    "PDB": [".pdb"],
-    "RTF": [".rtf"],
-    "SNB": [".snb"],
-    "TCR": [".tcr"],
-    "HTMLZ": [".htmlz"],
-    "TXTZ": [".txtz"],
-    "CBZ": [".cbz"],
-    "CBR": [".cbr"],
-    "CBC": [".cbc"],
-    "ODT": [".odt"],
+# 1b. labels for the incremental option menu
+INCREMENTAL_CHOICES = {
+    "Off": None,
+    "By date and size": "mtime",
+    "By content hash": "hash",
 }
 
-# 1c. flatten all extensions for quick lookup
-ALL_EXTENSIONS: Set[str] = set()
-for exts in EBOOK_FORMATS.values():
-    ALL_EXTENSIONS.update(exts)
-
-
-class ConversionWorker:
-    """
-    2a. handles conversion in a background thread
-    keeps the UI responsive during heavy operations
-    """
-    
-    def __init__(self, callback_queue: queue.Queue):
-        self.callback_queue = callback_queue
-        self.is_running = False
-        self.should_stop = False
-    
-    def find_ebook_convert(self) -> Optional[str]:
-        """
-        2b. finds calibre's ebook-convert on the system
-        checks the usual install paths for each OS
-        """
-        possible_paths = []
-        
-        if sys.platform == "win32":
-            possible_paths = [
-                r"C:\Program Files\Calibre2\ebook-convert.exe",
-                r"C:\Program Files (x86)\Calibre2\ebook-convert.exe",
-                os.path.expanduser(r"~\AppData\Local\Calibre2\ebook-convert.exe"),
-            ]
-        elif sys.platform == "darwin":
-            possible_paths = [
-                "/Applications/calibre.app/Contents/MacOS/ebook-convert",
-                "/usr/local/bin/ebook-convert",
-            ]
-        else:
-            possible_paths = [
-                "/usr/bin/ebook-convert",
-                "/usr/local/bin/ebook-convert",
-                os.path.expanduser("~/.local/bin/ebook-convert"),
-            ]
-        
-        # 2c. try PATH first
-        try:
-            result = subprocess.run(
-                ["ebook-convert", "--version"],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            if result.returncode == 0:
-                return "ebook-convert"
-        except (FileNotFoundError, subprocess.TimeoutExpired):
-            pass
-        
-        # 2d. fall back to known paths
-        for path in possible_paths:
-            if os.path.isfile(path):
-                return path
-        
-        return None
-    
-    def scan_folder(self, folder: str, source_formats: List[str]) -> List[Path]:
-        """
-        3a. finds ebook files in folder matching the selected formats
-        """
-        files = []
-        folder_path = Path(folder)
-        
-        target_extensions = set()
-        for fmt in source_formats:
-            if fmt in EBOOK_FORMATS:
-                target_extensions.update(EBOOK_FORMATS[fmt])
-        
-        for file_path in folder_path.iterdir():
-            if file_path.is_file():
-                if file_path.suffix.lower() in target_extensions:
-                    files.append(file_path)
-        
-        return sorted(files, key=lambda x: x.name.lower())
-    
-    def convert_files(
-        self,
-        files: List[Path],
-        output_folder: Path,
-        output_format: str,
-        ebook_convert_path: str
-    ):
-        """
-        3b. runs the actual conversion on all files
-        sends progress updates back to the UI
-        """
-        self.is_running = True
-        self.should_stop = False
-        
-        total = len(files)
-        successful = 0
-        failed = 0
-        skipped = 0
-        
-        output_ext = f".{output_format.lower()}"
-        
-        for idx, input_file in enumerate(files, 1):
-            if self.should_stop:
-                self._send_update("status", "Conversion cancelled")
-                break
-            
-            # 3c. skip files already in target format
-            if input_file.suffix.lower() == output_ext:
-                self._send_update("log", f"Skipping (already {output_format}): {input_file.name}")
-                skipped += 1
-                continue
-            
-            progress = (idx / total) * 100
-            self._send_update("progress", progress)
-            self._send_update("status", f"Converting {idx}/{total}: {input_file.name}")
-            self._send_update("log", f"Converting: {input_file.name}")
-            
-            output_file = output_folder / f"{input_file.stem}{output_ext}"
-            
-            try:
-                # 3d. call ebook-convert
-                result = subprocess.run(
-                    [ebook_convert_path, str(input_file), str(output_file)],
-                    capture_output=True,
-                    text=True,
-                    timeout=600  # 10 min timeout, PDFs can be slow
-                )
-                
-                if result.returncode == 0:
-                    self._send_update("log", f"  -> Success: {output_file.name}")
-                    successful += 1
-                else:
-                    error_msg = result.stderr[:200] if result.stderr else "Unknown error"
-                    self._send_update("log", f"  -> FAILED: {error_msg}")
-                    failed += 1
-                    
-            except subprocess.TimeoutExpired:
-                self._send_update("log", f"  -> TIMEOUT: File took too long")
-                failed += 1
-            except Exception as e:
-                self._send_update("log", f"  -> ERROR: {str(e)}")
-                failed += 1
-        
-        # 3e. show final results
-        self._send_update("progress", 100)
-        self._send_update("status", "Conversion complete!")
-        self._send_update("log", "\n" + "=" * 50)
-        self._send_update("log", f"CONVERSION COMPLETE")
-        self._send_update("log", f"  Successful: {successful}")
-        self._send_update("log", f"  Failed: {failed}")
-        self._send_update("log", f"  Skipped: {skipped}")
-        self._send_update("log", "=" * 50)
-        self._send_update("complete", {"successful": successful, "failed": failed, "skipped": skipped})
-        
-        self.is_running = False
-    
-    def _send_update(self, msg_type: str, data):
-        """
-        3f. thread-safe way to push updates to the UI
-        """
-        self.callback_queue.put((msg_type, data))
-    
-    def stop(self):
-        """
-        3g. tells the worker to stop after current file
-        """
-        self.should_stop = True
-
-
 class EBookConverterApp(ctk.CTk):
     """
     4a. main application window
@@ -238,27 +63,54 @@ class EBookConverterApp(ctk.CTk):
         self.output_folder = ctk.StringVar()
         self.output_format = ctk.StringVar(value="MOBI")
         self.source_filter = ctk.StringVar(value="All Formats")
+        self.parallel_jobs = ctk.StringVar(value=str(os.cpu_count() or 1))
+        self.incremental_mode = ctk.StringVar(value="Off")
+        self.use_cache = ctk.BooleanVar(value=False)
+        self.dedup_files = ctk.BooleanVar(value=False)
+        self.recursive = ctk.BooleanVar(value=False)
+        self.warm_workers = ctk.BooleanVar(value=False)
+        self.cache: Optional[ConversionCache] = None
         self.scanned_files: List[Path] = []
+        self.scanned_key: Optional[Tuple[str, bool]] = None
+        self.scan: Optional[FolderScan] = None
+        self.scan_request: Optional[Tuple[str, bool]] = None
+        self.converting = False
         
         # 4e. worker thread setup
-        self.callback_queue = queue.Queue()
+        self.callback_queue = WakeupQueue()
         self.worker = ConversionWorker(self.callback_queue)
+        self._drain_scheduled = False
+        self._last_drain = 0.0
+        
+        # 4f. library index, makes rescans and filter changes cheap
+        try:
+            self.index: Optional[LibraryIndex] = LibraryIndex()
+        except (OSError, sqlite3.Error):
+            self.index = None
         
-        # 4f. build the UI
+        # 4g. full log on disk, the textbox only keeps the tail
+        self.session_log = SessionLog()
+        
+        # 4h. build the UI
         self._create_ui()
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
         
-        # 4g. check if calibre is available
+        # 4i. check if calibre is available
         self._check_calibre()
         
-        # 4h. start polling for worker updates
-        self._process_queue()
+        # 4j. wake up only when the worker has something to show
+        self.event_driven = bool(int(self.tk.eval("info exists tcl_platform(threaded)")))
+        if self.event_driven:
+            self.bind("<<WorkerUpdate>>", lambda event: self._schedule_drain())
+            self.callback_queue.wakeup = self._wake_from_worker
+        self._schedule_drain()
     
     def _create_ui(self):
         """
         5a. builds all the UI elements
         """
         self.grid_columnconfigure(0, weight=1)
-        self.grid_rowconfigure(4, weight=1)
+        self.grid_rowconfigure(5, weight=1)
         
         # ===== HEADER =====
         header_frame = ctk.CTkFrame(self, fg_color="transparent")
@@ -388,7 +240,7 @@ class EBookConverterApp(ctk.CTk):
             height=35,
             fg_color="#2d5a27",
             hover_color="#3d7a37",
-            command=self._scan_folder
+            command=self._on_scan_button
         )
         self.scan_btn.pack(side="left", padx=(30, 10), pady=15)
         
@@ -415,9 +267,77 @@ class EBookConverterApp(ctk.CTk):
         )
         self.stop_btn.pack(side="left", padx=10, pady=15)
         
+        # ===== OPTIONS SECTION =====
+        options_frame = ctk.CTkFrame(self)
+        options_frame.grid(row=4, column=0, padx=20, pady=10, sticky="ew")
+        
+        # 5c. how many ebook-convert processes to run at once
+        ctk.CTkLabel(
+            options_frame,
+            text="Parallel jobs:",
+            font=ctk.CTkFont(size=14, weight="bold")
+        ).pack(side="left", padx=15, pady=10)
+        
+        self.jobs_menu = ctk.CTkOptionMenu(
+            options_frame,
+            variable=self.parallel_jobs,
+            values=[str(n) for n in range(1, (os.cpu_count() or 1) + 1)],
+            width=80,
+            height=30
+        )
+        self.jobs_menu.pack(side="left", padx=10, pady=10)
+        
+        # 5d. incremental mode, skips outputs that are already up to date
+        ctk.CTkLabel(
+            options_frame,
+            text="Skip up-to-date:",
+            font=ctk.CTkFont(size=14, weight="bold")
+        ).pack(side="left", padx=(30, 15), pady=10)
+        
+        self.incremental_menu = ctk.CTkOptionMenu(
+            options_frame,
+            variable=self.incremental_mode,
+            values=list(INCREMENTAL_CHOICES.keys()),
+            width=160,
+            height=30
+        )
+        self.incremental_menu.pack(side="left", padx=10, pady=10)
+        
+        # 5e. reuse earlier conversions of the same content
+        self.cache_check = ctk.CTkCheckBox(
+            options_frame,
+            text="Use conversion cache",
+            variable=self.use_cache
+        )
+        self.cache_check.pack(side="left", padx=(30, 15), pady=10)
+        
+        # 5f. identical files are converted once and the result copied
+        self.dedup_check = ctk.CTkCheckBox(
+            options_frame,
+            text="Convert duplicates once",
+            variable=self.dedup_files
+        )
+        self.dedup_check.pack(side="left", padx=15, pady=10)
+        
+        # 5g. walk subfolders and mirror them in the output folder
+        self.recursive_check = ctk.CTkCheckBox(
+            options_frame,
+            text="Include subfolders",
+            variable=self.recursive
+        )
+        self.recursive_check.pack(side="left", padx=15, pady=10)
+        
+        # 5h. keep calibre loaded between files, pays off on many small books
+        self.warm_check = ctk.CTkCheckBox(
+            options_frame,
+            text="Keep Calibre warm",
+            variable=self.warm_workers
+        )
+        self.warm_check.pack(side="left", padx=15, pady=10)
+        
         # ===== PROGRESS AND LOG SECTION =====
         progress_frame = ctk.CTkFrame(self)
-        progress_frame.grid(row=4, column=0, padx=20, pady=10, sticky="nsew")
+        progress_frame.grid(row=5, column=0, padx=20, pady=10, sticky="nsew")
         progress_frame.grid_columnconfigure(0, weight=1)
         progress_frame.grid_rowconfigure(2, weight=1)
         
@@ -428,8 +348,17 @@ class EBookConverterApp(ctk.CTk):
         )
         self.status_label.grid(row=0, column=0, padx=15, pady=(15, 5), sticky="w")
         
+        # 5i. throughput and ETA, byte-weighted like the progress bar
+        self.stats_label = ctk.CTkLabel(
+            progress_frame,
+            text="",
+            font=ctk.CTkFont(size=12),
+            text_color="gray"
+        )
+        self.stats_label.grid(row=0, column=1, padx=15, pady=(15, 5), sticky="e")
+        
         self.progress_bar = ctk.CTkProgressBar(progress_frame, height=20)
-        self.progress_bar.grid(row=1, column=0, padx=15, pady=10, sticky="ew")
+        self.progress_bar.grid(row=1, column=0, columnspan=2, padx=15, pady=10, sticky="ew")
         self.progress_bar.set(0)
         
         self.log_text = ctk.CTkTextbox(
@@ -437,11 +366,11 @@ class EBookConverterApp(ctk.CTk):
             font=ctk.CTkFont(family="Consolas", size=12),
             wrap="word"
         )
-        self.log_text.grid(row=2, column=0, padx=15, pady=(5, 15), sticky="nsew")
+        self.log_text.grid(row=2, column=0, columnspan=2, padx=15, pady=(5, 15), sticky="nsew")
         
         # ===== FOOTER =====
         footer_frame = ctk.CTkFrame(self, fg_color="transparent")
-        footer_frame.grid(row=5, column=0, padx=20, pady=(5, 15), sticky="ew")
+        footer_frame.grid(row=6, column=0, padx=20, pady=(5, 15), sticky="ew")
         
         self.files_label = ctk.CTkLabel(
             footer_frame,
@@ -474,11 +403,31 @@ class EBookConverterApp(ctk.CTk):
     def _check_calibre(self):
         """
         6b. checks if calibre is installed
+        runs off the main thread, a cold lookup spawns ebook-convert --version
         """
-        ebook_convert = self.worker.find_ebook_convert()
-        if ebook_convert:
-            self._log(f"Calibre found: {ebook_convert}")
-            self.ebook_convert_path = ebook_convert
+        self.calibre_checked = False
+        self.ebook_convert_path = None
+        
+        def probe():
+            self.worker.find_ebook_convert()
+            self.callback_queue.put(("calibre", self.worker.calibre))
+        
+        threading.Thread(target=probe, daemon=True).start()
+    
+    def _on_calibre_found(self, info: Optional[CalibreInfo]):
+        """
+        6c. applies the lookup result, limits the menus to what calibre can do
+        and what the built-in converters add
+        """
+        self.calibre_checked = True
+        if info:
+            self._log(f"Calibre {info.version_string} found: {info.path}")
+            self.ebook_convert_path = info.path
+            outputs = [fmt for fmt in EBOOK_FORMATS if self.worker.can_write(fmt)]
+            self.format_menu.configure(values=outputs)
+            if self.output_format.get() not in outputs and outputs:
+                self.output_format.set(outputs[0])
+            self.filter_menu.configure(values=["All Formats"] + info.input_formats)
         else:
             self._log("WARNING: Calibre not found!")
             self._log("Please install Calibre from: https://calibre-ebook.com/download")
@@ -496,7 +445,7 @@ class EBookConverterApp(ctk.CTk):
     
     def _select_source_folder(self):
         """
-        6c. opens folder picker for input
+        6d. opens folder picker for input
         """
         folder = filedialog.askdirectory(title="Select folder with ebooks")
         if folder:
@@ -507,7 +456,7 @@ class EBookConverterApp(ctk.CTk):
     
     def _select_output_folder(self):
         """
-        6d. opens folder picker for output
+        6e. opens folder picker for output
         """
         folder = filedialog.askdirectory(title="Select output folder")
         if folder:
@@ -516,15 +465,44 @@ class EBookConverterApp(ctk.CTk):
     
     def _on_filter_change(self, value):
         """
-        6e. re-scans when filter changes
+        6f. re-filters when filter changes
+        a folder already in the library index is only queried, not rescanned
         """
         self._log(f"Filter changed to: {value}")
-        if self.source_folder.get():
+        folder = self.source_folder.get()
+        if not folder:
+            return
+        if self.index and self.scanned_key == (os.path.abspath(folder), self.recursive.get()):
+            self.scanned_files = self.index.query(
+                folder, self._selected_formats(), recursive=self.recursive.get()
+            )
+            self._show_scan_results(folder)
+        else:
+            self._scan_folder()
+    
+    def _selected_formats(self) -> List[str]:
+        """
+        6g. source formats picked in the filter menu
+        """
+        filter_val = self.source_filter.get()
+        if filter_val == "All Formats":
+            return list(EBOOK_FORMATS.keys())
+        return [filter_val]
+    
+    def _on_scan_button(self):
+        """
+        7a. the scan button doubles as "Cancel Scan" while a scan runs
+        """
+        if self.scan and not self.scan.done:
+            self.scan.cancel()
+            self._log("Cancelling scan...")
+        else:
             self._scan_folder()
     
     def _scan_folder(self):
         """
-        7a. scans source folder for matching ebooks
+        7b. starts a background scan of the source folder
+        files stream in through the callback queue, the window stays live
         """
         folder = self.source_folder.get()
         if not folder:
@@ -535,31 +513,78 @@ class EBookConverterApp(ctk.CTk):
             messagebox.showerror("Error", "Source folder does not exist!")
             return
         
-        filter_val = self.source_filter.get()
-        if filter_val == "All Formats":
-            source_formats = list(EBOOK_FORMATS.keys())
-        else:
-            source_formats = [filter_val]
+        if self.scan and not self.scan.done:
+            self.scan.cancel()
+        
+        source_formats = self._selected_formats()
+        recursive = self.recursive.get()
+        max_depth = None if recursive else 0
         
         self._log(f"\nScanning folder: {folder}")
         self._log(f"Looking for: {', '.join(source_formats)}")
         
-        self.scanned_files = self.worker.scan_folder(folder, source_formats)
+        # 7c. through the index only folders whose mtime changed are listed again
+        scan_fn = self.index.scan if self.index else self.worker.iter_folder
+        self.scan = FolderScan(
+            self.callback_queue, scan_fn, folder, source_formats, max_depth, False
+        ).start()
+        self.scanned_files = self.scan.results
+        self.scan_request = (os.path.abspath(folder), recursive)
+        self.scanned_key = None
+        
+        self.scan_btn.configure(text="Cancel Scan")
+        self.files_label.configure(text="Files found: 0")
+        if not self.converting:
+            self.status_label.configure(text="Scanning...")
+    
+    def _on_scan_progress(self, count: int):
+        """
+        7d. live "files found" counter
+        """
+        self.files_label.configure(text=f"Files found: {count}")
+        if not self.converting:
+            self.status_label.configure(text=f"Scanning... {count} ebook file(s) found")
+    
+    def _on_scan_complete(self, results: Dict):
+        """
+        7e. scan finished, was cancelled or failed
+        """
+        self.scan_btn.configure(text="Scan Folder")
+        if self.converting:
+            self.files_label.configure(text=f"Files found: {results['count']}")
+            return
         
+        self.scan_btn.configure(state="normal")
+        if results["error"]:
+            self._log(f"Scan failed: {results['error']}")
+        elif results["cancelled"]:
+            self._log(f"Scan cancelled after {results['count']} file(s)")
+        elif self.index:
+            self.scanned_key = self.scan_request
+        self._show_scan_results(self.source_folder.get())
+    
+    def _show_scan_results(self, folder: str):
+        """
+        7f. updates the counters and lists the first few files
+        """
         count = len(self.scanned_files)
         self.files_label.configure(text=f"Files found: {count}")
         self.status_label.configure(text=f"Found {count} ebook file(s)")
         
         self._log(f"Found {count} file(s):")
         for f in self.scanned_files[:20]:
-            self._log(f"  - {f.name}")
+            self._log(f"  - {os.path.relpath(f, folder)}")
         if count > 20:
             self._log(f"  ... and {count - 20} more")
     
     def _start_conversion(self):
         """
-        7b. starts conversion when user clicks the button
+        7g. starts conversion when user clicks the button
         """
+        if not self.calibre_checked:
+            messagebox.showinfo("Please Wait", "Still looking for Calibre, try again in a moment.")
+            return
+        
         if not self.ebook_convert_path:
             messagebox.showerror("Error", "Calibre not installed!")
             return
@@ -572,82 +597,287 @@ class EBookConverterApp(ctk.CTk):
             messagebox.showwarning("Warning", "Select an output folder!")
             return
         
-        if not self.scanned_files:
+        # 7h. an interrupted batch in the output folder can pick up where it stopped
+        state = load_journal(Path(self.output_folder.get()))
+        if state is not None:
+            answer = messagebox.askyesnocancel(
+                "Resume",
+                f"An interrupted batch to {', '.join(target_formats(state.settings['output_format']))} has "
+                f"{len(state.pending)} file(s) left in this output folder.\n\n"
+                "Resume it? Choose No to start a new batch instead."
+            )
+            if answer is None:
+                return
+            if answer:
+                self._resume_conversion()
+                return
+        
+        if not self.scanned_files and (self.scan is None or self.scan.done):
             self._scan_folder()
         
-        if not self.scanned_files:
-            messagebox.showwarning("Warning", "No ebook files found!")
-            return
+        # 7i. a scan still running feeds the conversion as it finds files
+        scanning = self.scan is not None and not self.scan.done
+        if scanning:
+            files = self.scan.follow()
+        else:
+            files = self.scanned_files
+            if not files:
+                messagebox.showwarning("Warning", "No ebook files found!")
+                return
         
         output_path = Path(self.output_folder.get())
         output_path.mkdir(parents=True, exist_ok=True)
         
-        self.convert_btn.configure(state="disabled")
-        self.scan_btn.configure(state="disabled")
-        self.stop_btn.configure(state="normal")
-        
+        self._set_converting()
         thread = threading.Thread(
-            target=self.worker.convert_files,
+            target=self._run_batch,
             args=(
-                self.scanned_files,
+                self.worker.convert_files,
+                files,
                 output_path,
                 self.output_format.get(),
                 self.ebook_convert_path
             ),
+            kwargs={
+                **self._run_options(),
+                "incremental": INCREMENTAL_CHOICES[self.incremental_mode.get()],
+                "dedup": "copy" if self.dedup_files.get() else None,
+                "source_root": Path(os.path.abspath(self.source_folder.get())) if self.recursive.get() else None,
+                "scan": {
+                    "root": os.path.abspath(self.source_folder.get()),
+                    "formats": self._selected_formats(),
+                    "max_depth": None if self.recursive.get() else 0,
+                    "follow_symlinks": False,
+                },
+            },
             daemon=True
         )
         thread.start()
     
+    def _run_options(self) -> Dict:
+        """
+        7j. the run options shared by new and resumed batches
+        """
+        cache = None
+        if self.use_cache.get():
+            try:
+                if self.cache is None:
+                    self.cache = ConversionCache()
+                cache = self.cache
+            except OSError as e:
+                self._log(f"WARNING: conversion cache unavailable: {e}")
+        return {
+            "max_workers": int(self.parallel_jobs.get()),
+            "cache": cache,
+            "index": self.index,
+            "warm": self.warm_workers.get(),
+        }
+    
+    def _set_converting(self):
+        self.converting = True
+        self.stats_label.configure(text="")
+        self.convert_btn.configure(state="disabled")
+        self.scan_btn.configure(state="disabled")
+        self.stop_btn.configure(state="normal")
+    
+    def _resume_conversion(self):
+        """
+        7k. continues the journaled batch, format and options come from the journal
+        """
+        self._log("Resuming interrupted batch...")
+        self._set_converting()
+        thread = threading.Thread(
+            target=self._run_batch,
+            args=(self.worker.resume, Path(self.output_folder.get()), self.ebook_convert_path),
+            kwargs=self._run_options(),
+            daemon=True
+        )
+        thread.start()
+    
+    def _run_batch(self, run: Callable[..., object], *args, **kwargs):
+        """
+        7l. the conversion thread, a batch that raises or finds nothing to
+        resume never sends "complete", "failed" gives the controls back
+        """
+        try:
+            if run(*args, **kwargs) is False:
+                self.callback_queue.put(("failed", "Nothing left to resume in this output folder"))
+        except Exception as e:
+            self.worker.is_running = False
+            self.callback_queue.put(("log", f"ERROR: {traceback.format_exc().rstrip()}"))
+            self.callback_queue.put(("failed", f"Conversion stopped by an error: {e}"))
+    
     def _stop_conversion(self):
         """
-        7c. cancels the current conversion
+        7m. cancels the current conversion
         """
+        if self.scan and not self.scan.done:
+            self.scan.cancel()
         self.worker.stop()
         self._log("Stopping conversion...")
     
     def _process_queue(self):
         """
-        8a. polls for worker updates and refreshes UI
-        """
+        8a. applies worker updates to the UI
+        drains for at most QUEUE_TIME_BUDGET per tick, log lines are
+        inserted in one go and only the latest progress/status is drawn
+        """
+        self._drain_scheduled = False
+        self._last_drain = time.monotonic()
+        deadline = time.monotonic() + QUEUE_TIME_BUDGET
+        lines: List[str] = []
+        progress = None
+        status = None
+        stats = None
+        backlog = False
         try:
             while True:
+                if time.monotonic() >= deadline:
+                    backlog = True
+                    break
                 msg_type, data = self.callback_queue.get_nowait()
                 
                 if msg_type == "progress":
-                    self.progress_bar.set(data / 100)
+                    progress = data
                 elif msg_type == "status":
-                    self.status_label.configure(text=data)
+                    status = data
                 elif msg_type == "log":
-                    self._log(data)
-                elif msg_type == "complete":
-                    self._on_conversion_complete(data)
+                    lines.append(data)
+                elif msg_type == "stats":
+                    stats = data
+                elif msg_type in ("file_started", "file_progress", "file_finished"):
+                    pass  # already folded into the stats events
+                else:
+                    # 8b. keep ordering intact around non-log events
+                    self._flush_updates(lines, progress, status, stats)
+                    lines, progress, status, stats = [], None, None, None
+                    if msg_type == "complete":
+                        self._on_conversion_complete(data)
+                    elif msg_type == "failed":
+                        self._on_conversion_failed(data)
+                    elif msg_type == "scan_progress":
+                        self._on_scan_progress(data)
+                    elif msg_type == "scan_complete":
+                        self._on_scan_complete(data)
+                    elif msg_type == "calibre":
+                        self._on_calibre_found(data)
                     
         except queue.Empty:
             pass
         
-        self.after(100, self._process_queue)
+        self._flush_updates(lines, progress, status, stats)
+        
+        # 8c. idle until the next wakeup, unless work is left or slipped in
+        if not self.event_driven:
+            self.after(1 if backlog else POLL_INTERVAL_MS, self._process_queue)
+        elif backlog or self.callback_queue.rearm():
+            self._schedule_drain()
+    
+    def _schedule_drain(self):
+        """
+        8d. one pending drain at a time, no more than one per frame
+        """
+        if self._drain_scheduled:
+            return
+        self._drain_scheduled = True
+        wait = FRAME_INTERVAL - (time.monotonic() - self._last_drain)
+        self.after(max(1, int(wait * 1000)), self._process_queue)
+    
+    def _wake_from_worker(self):
+        """
+        8e. runs on worker threads, threaded Tcl hands the event to the Tk loop
+        """
+        try:
+            self.event_generate("<<WorkerUpdate>>", when="tail")
+        except (RuntimeError, tkinter.TclError):
+            pass  # window is closing
+    
+    def _flush_updates(self, lines: List[str], progress, status, stats=None):
+        """
+        8f. applies one batch of queued updates to the widgets
+        """
+        if progress is not None:
+            self.progress_bar.set(progress / 100)
+        if status is not None:
+            self.status_label.configure(text=status)
+        if stats is not None:
+            self.stats_label.configure(text=stats.describe())
+        if lines:
+            self._append_log(lines)
     
     def _on_conversion_complete(self, results: Dict):
         """
-        8b. called when all files are done
+        8g. called when all files are done
         """
-        self.convert_btn.configure(state="normal")
-        self.scan_btn.configure(state="normal")
-        self.stop_btn.configure(state="disabled")
+        self._set_idle()
         
-        messagebox.showinfo(
-            "Conversion Complete",
+        summary = (
             f"Successful: {results['successful']}\n"
             f"Failed: {results['failed']}\n"
-            f"Skipped: {results['skipped']}"
+            f"Skipped: {results['skipped']}\n"
+            f"Up-to-date: {results['up_to_date']}"
         )
+        if "cache_hits" in results:
+            summary += f"\nCache hits: {results['cache_hits']}, misses: {results['cache_misses']}"
+        self.session_log.flush()
+        self._log(f"Full log: {self.session_log.path}")
+        messagebox.showinfo("Conversion Complete", summary)
+    
+    def _on_conversion_failed(self, message: str):
+        """
+        8h. called when the batch ended without results
+        """
+        self._set_idle()
+        self.status_label.configure(text=message)
+        self.session_log.flush()
+        messagebox.showerror("Error", message)
+    
+    def _set_idle(self):
+        self.converting = False
+        self.convert_btn.configure(state="normal")
+        self.scan_btn.configure(state="normal")
+        self.stop_btn.configure(state="disabled")
+        if self.scan and self.scan.done:
+            self.files_label.configure(text=f"Files found: {self.scan.count}")
     
     def _log(self, message: str):
         """
-        8c. appends a line to the log textbox
+        8i. appends a line to the log textbox
+        """
+        self._append_log([message])
+    
+    def _append_log(self, lines: List[str]):
         """
-        self.log_text.insert("end", message + "\n")
-        self.log_text.see("end")
+        8j. one textbox insert for a batch of lines
+        the textbox is a ring buffer of LOG_MAX_LINES, everything also
+        goes to the session log file
+        """
+        try:
+            self.session_log.write(lines)
+        except OSError:
+            pass
+        
+        # 8k. only follow the tail if the user hasn't scrolled up
+        follow = self.log_text.yview()[1] >= 0.999
+        self.log_text.insert("end", "\n".join(lines) + "\n")
+        
+        line_count = int(self.log_text.index("end-1c").split(".")[0]) - 1
+        if line_count > LOG_MAX_LINES:
+            excess = line_count - LOG_MAX_LINES
+            self.log_text.delete("1.0", f"{excess + 1}.0")
+        if follow:
+            self.log_text.see("end")
+    
+    def _on_close(self):
+        """
+        8l. stops background work and closes the session log
+        """
+        if self.scan and not self.scan.done:
+            self.scan.cancel()
+        self.callback_queue.wakeup = None
+        self.worker.stop()
+        self.session_log.close()
+        self.destroy()
 
 
 def main():
@@ -659,4 +889,7 @@ def main():
 
 
 if __name__ == "__main__":
+    # 9b. comic pages are resized in pool processes, which a frozen app
+    # starts through its own executable
+    multiprocessing.freeze_support()
     main()
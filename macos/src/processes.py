@@ -0,0 +1,43 @@
+"""
+EBook Converter Pro - child process helpers
+Calibre starts helper processes of its own (PDF rendering, the warm
+workers' forked jobs), so killing only the direct child can leave them
+running. Children are started in their own group and killed as a group
+"""
+
+import os
+import signal
+import subprocess
+import sys
+from typing import Any, Dict
+
+
+def new_group_kwargs() -> Dict[str, Any]:
+    """
+    1a. Popen arguments that put the child and its descendants in a new group
+    """
+    if sys.platform == "win32":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+def kill_tree(proc: subprocess.Popen):
+    """
+    1b. kills a process started with new_group_kwargs() and all its children
+    """
+    try:
+        if sys.platform == "win32":
+            subprocess.run(
+                ["taskkill", "/F", "/T", "/PID", str(proc.pid)],
+                capture_output=True,
+                creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0)
+            )
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        pass
+    # 1c. taskkill may be missing and the group may already be gone
+    try:
+        proc.kill()
+    except OSError:
+        pass
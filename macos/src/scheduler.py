@@ -0,0 +1,132 @@
+"""
+EBook Converter Pro - job scheduling
+Hands out conversions most expensive first, so the big PDFs are not the
+ones left running alone at the end, and packs tiny files together.
+The service's queue takes turns between clients instead
+"""
+
+import heapq
+import itertools
+from collections import OrderedDict, deque
+from typing import Deque, Generic, List, Optional, Tuple, TypeVar
+
+
+# 1a. small jobs are packed until a pack is predicted to take this long
+PACK_SECONDS = 10.0
+PACK_MAX_FILES = 16
+
+T = TypeVar("T")
+
+
+class CostQueue(Generic[T]):
+    """
+    2a. pending jobs keyed by predicted seconds, largest first
+    ties keep discovery order so equal files still go by name
+    """
+    
+    def __init__(self):
+        self._heap: List[Tuple[float, int, T]] = []
+        self._order = itertools.count()
+    
+    def __len__(self) -> int:
+        return len(self._heap)
+    
+    def push(self, job: T, cost: float):
+        heapq.heappush(self._heap, (-cost, next(self._order), job))
+    
+    def pop_task(self, workers: int) -> List[T]:
+        """
+        2b. the next unit of work for one slot
+        a job that is big on its own goes alone, otherwise small jobs are
+        packed, but never so many that slots would sit idle for lack of work
+        """
+        neg_cost, _, job = heapq.heappop(self._heap)
+        task = [job]
+        budget = PACK_SECONDS + neg_cost
+        limit = min(PACK_MAX_FILES, max(1, (len(self._heap) + 1) // max(1, workers)))
+        while self._heap and len(task) < limit:
+            next_cost = -self._heap[0][0]
+            if next_cost > budget:
+                break
+            budget -= next_cost
+            task.append(heapq.heappop(self._heap)[2])
+        return task
+
+
+class FairQueue(Generic[T]):
+    """
+    3a. waiting jobs of several clients, handed out round robin by client
+    so one client's hundred uploads don't hold up another's one
+    bounded: push refuses past limit jobs in all, or per_client for one client
+    """
+    
+    def __init__(self, limit: int, per_client: Optional[int] = None):
+        self.limit = limit
+        self.per_client = per_client or limit
+        self._queues: "OrderedDict[str, Deque[T]]" = OrderedDict()
+        self._count = 0
+    
+    def __len__(self) -> int:
+        return self._count
+    
+    def room_for(self, client: str) -> Optional[str]:
+        """
+        3b. None if client may push another job, else why not
+        """
+        if self._count >= self.limit:
+            return "queue is full"
+        if len(self._queues.get(client, ())) >= self.per_client:
+            return "too many queued jobs for this client"
+        return None
+    
+    def push(self, client: str, job: T) -> bool:
+        if self.room_for(client):
+            return False
+        self._queues.setdefault(client, deque()).append(job)
+        self._count += 1
+        return True
+    
+    def pop(self) -> Optional[T]:
+        """
+        3c. the oldest job of the client whose turn it is, that client then
+        goes to the back of the line
+        """
+        if not self._queues:
+            return None
+        client, jobs = next(iter(self._queues.items()))
+        job = jobs.popleft()
+        self._count -= 1
+        if jobs:
+            self._queues.move_to_end(client)
+        else:
+            del self._queues[client]
+        return job
+    
+    def remove(self, client: str, job: T) -> bool:
+        jobs = self._queues.get(client)
+        if not jobs or job not in jobs:
+            return False
+        jobs.remove(job)
+        self._count -= 1
+        if not jobs:
+            del self._queues[client]
+        return True
+    
+    def position(self, client: str, job: T) -> Optional[int]:
+        """
+        3d. how many jobs will be handed out before job, None if not queued
+        each client ahead in the rotation gets one more turn than job's
+        own place in its queue, the ones behind get as many
+        """
+        jobs = self._queues.get(client)
+        if not jobs or job not in jobs:
+            return None
+        index = list(jobs).index(job)
+        ahead = index
+        before = True
+        for other, queued in self._queues.items():
+            if other == client:
+                before = False
+                continue
+            ahead += min(len(queued), index + 1 if before else index)
+        return ahead
@@ -0,0 +1,529 @@
+"""
+EBook Converter Pro - local HTTP service
+Serves conversions to other tools on this machine: a client uploads a
+book, polls its status and downloads the result. Uploads and downloads
+stream through the spool folder in chunks, so a large PDF never sits in
+memory, waiting jobs share a bounded queue fairly between clients, and
+each running job gets a ConversionWorker of its own, so native backends,
+the cache, timeouts and memory limits apply as they do in the CLI
+
+    POST   /jobs?to=EPUB&name=book.pdf   body: the book, 202 {"id": ...}
+    GET    /jobs                         the client's jobs
+    GET    /jobs/ID                      status, with the queue position
+    GET    /jobs/ID/output               the converted book
+    DELETE /jobs/ID                      cancels, or deletes a finished job
+
+Clients are told apart by an X-Client-Id header, else by address
+"""
+
+import json
+import mimetypes
+import queue
+import re
+import secrets
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, BinaryIO, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from converter import ConversionWorker
+from history import ConversionHistory
+from native import default_registry
+from registry import ConverterRegistry
+from scheduler import FairQueue
+
+
+# 1a. defaults: address, waiting jobs in all and per client, upload limit,
+# and how long a finished job's files are kept for download
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_QUEUE_SIZE = 64
+DEFAULT_CLIENT_QUEUE = 16
+DEFAULT_MAX_UPLOAD = 1024 * 1024 * 1024
+DEFAULT_KEEP = 3600.0
+
+# 1b. bytes read or written per step, and how often expired jobs are cleared
+CHUNK_SIZE = 256 * 1024
+EXPIRE_INTERVAL = 30.0
+
+# 1c. result lines kept per job for its status
+LOG_LINES = 20
+
+MAX_HEADER_LINE = 1024
+SAFE_NAME_RE = re.compile(r"[^\w .()\-]+")
+
+FINISHED_STATES = ("done", "failed", "cancelled")
+
+
+class ServiceError(Exception):
+    """
+    1d. a request the service turns down, with the HTTP status to send
+    """
+    
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass(eq=False)
+class ServiceJob:
+    """
+    2a. one uploaded book and the format it is wanted in
+    state is "queued", "running", "done", "failed" or "cancelled"
+    """
+    id: str
+    client: str
+    name: str
+    target_format: str
+    folder: Path
+    state: str = "queued"
+    percent: int = 0
+    stage: str = ""
+    error: str = ""
+    output: Optional[Path] = None
+    submitted: float = field(default_factory=time.time)
+    finished: Optional[float] = None
+    cancelled: bool = False
+    worker: Optional[ConversionWorker] = None
+    results: Optional[Dict[str, Any]] = None
+    log: Deque[str] = field(default_factory=lambda: deque(maxlen=LOG_LINES))
+    
+    @property
+    def source(self) -> Path:
+        return self.folder / "source" / self.name
+
+
+class _JobFeed(queue.Queue):
+    """
+    2b. the callback queue of a job's worker, keeps what the status needs
+    instead of queueing every update
+    """
+    
+    def __init__(self, job: ServiceJob):
+        super().__init__()
+        self.job = job
+        self._summary = False
+    
+    def put(self, item, block: bool = True, timeout: Optional[float] = None):
+        msg_type, data = item
+        job = self.job
+        # 2c. convert_files clears the stop flag as it starts, a cancel that
+        # came just before is applied again here
+        worker = job.worker
+        if job.cancelled and worker and not worker.should_stop:
+            worker.stop()
+        if msg_type == "file_progress":
+            job.percent, job.stage = data.percent, data.stage
+        elif msg_type == "log":
+            # 2d. the run's summary block starts with a blank line, the
+            # status has its own counts
+            self._summary = self._summary or data.startswith("\n")
+            if not self._summary and data.strip():
+                job.log.append(data.strip())
+        elif msg_type == "complete":
+            job.results = data
+
+
+def safe_name(name: str) -> str:
+    """
+    2e. an uploaded file name usable in the spool folder, no directories,
+    no leading dot (hidden files are temp files here)
+    """
+    name = SAFE_NAME_RE.sub("_", name.replace("\\", "/").rsplit("/", 1)[-1]).strip(" .")
+    return name[:200] or "book"
+
+
+class ConversionService:
+    """
+    3a. the job queue and the conversion slots behind the HTTP handler
+    workers slots convert at once, targets are the formats clients may ask
+    for, run_options are extra convert_files keyword arguments (cache,
+    limits, timeouts, native...), spool defaults to a temp folder that is
+    removed on close()
+    """
+    
+    def __init__(
+        self,
+        ebook_convert_path: str,
+        targets: Sequence[str],
+        spool: Optional[Path] = None,
+        workers: int = 1,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        client_queue: int = DEFAULT_CLIENT_QUEUE,
+        max_upload: int = DEFAULT_MAX_UPLOAD,
+        keep: float = DEFAULT_KEEP,
+        run_options: Optional[Dict[str, Any]] = None,
+        registry: Optional[ConverterRegistry] = None
+    ):
+        self.ebook_convert_path = ebook_convert_path
+        self.targets = [fmt.upper() for fmt in targets]
+        self._own_spool = spool is None
+        self.spool = Path(tempfile.mkdtemp(prefix="ebook-service-")) if spool is None else spool
+        self.spool.mkdir(parents=True, exist_ok=True)
+        self.max_upload = max_upload
+        self.keep = keep
+        self.run_options = run_options or {}
+        self.registry = registry or default_registry()
+        self.history = ConversionHistory()
+        
+        self._cond = threading.Condition()
+        self._queue: FairQueue[ServiceJob] = FairQueue(queue_size, client_queue)
+        self._jobs: Dict[str, ServiceJob] = {}
+        self._closing = False
+        self._slots = [
+            threading.Thread(target=self._slot, name=f"service-slot-{n}", daemon=True)
+            for n in range(max(1, workers))
+        ]
+    
+    def start(self) -> "ConversionService":
+        for slot in self._slots:
+            slot.start()
+        return self
+    
+    def submit(self, client: str, name: str, target: str, body: Iterator[bytes]) -> ServiceJob:
+        """
+        3b. spools an upload and queues it, body yields the book in chunks
+        raises ServiceError when the format is unknown, the queue has no
+        room (checked before and after the upload) or the upload is too big
+        """
+        target = (target or "").upper()
+        if target not in self.targets:
+            raise ServiceError(400, f"unknown target format {target or '(none)'}, choose from: {', '.join(self.targets)}")
+        self.check_room(client)
+        
+        job_id = secrets.token_hex(8)
+        job = ServiceJob(job_id, client, safe_name(name), target, self.spool / job_id)
+        job.source.parent.mkdir(parents=True)
+        try:
+            received = 0
+            with open(job.source, "wb") as f:
+                for chunk in body:
+                    received += len(chunk)
+                    if received > self.max_upload:
+                        raise ServiceError(413, f"upload is larger than {self.max_upload // (1024 * 1024)} MB")
+                    f.write(chunk)
+            with self._cond:
+                if self._closing:
+                    raise ServiceError(503, "service is shutting down")
+                self.check_room(client)
+                self._queue.push(client, job)
+                self._jobs[job.id] = job
+                self._cond.notify()
+                expired = self._expired()
+        except BaseException:
+            shutil.rmtree(job.folder, ignore_errors=True)
+            raise
+        for folder in expired:
+            shutil.rmtree(folder, ignore_errors=True)
+        return job
+    
+    def check_room(self, client: str):
+        """
+        3c. raises ServiceError if client can't queue another job right now
+        """
+        with self._cond:
+            problem = self._queue.room_for(client)
+        if problem:
+            raise ServiceError(429 if "client" in problem else 503, problem)
+    
+    def job(self, client: str, job_id: str) -> ServiceJob:
+        """
+        3d. raises ServiceError 404 for unknown ids and other clients' jobs
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+        if job is None or job.client != client:
+            raise ServiceError(404, f"no such job: {job_id}")
+        return job
+    
+    def jobs(self, client: str) -> List[Dict[str, Any]]:
+        with self._cond:
+            return [self._describe(job) for job in self._jobs.values() if job.client == client]
+    
+    def status(self, job: ServiceJob) -> Dict[str, Any]:
+        with self._cond:
+            return self._describe(job)
+    
+    def _describe(self, job: ServiceJob) -> Dict[str, Any]:
+        status = {
+            "id": job.id,
+            "name": job.name,
+            "to": job.target_format,
+            "state": job.state,
+            "percent": 100 if job.state == "done" else job.percent,
+            "stage": job.stage,
+            "submitted": job.submitted,
+            "finished": job.finished,
+        }
+        if job.state == "queued":
+            status["position"] = self._queue.position(job.client, job)
+        if job.error:
+            status["error"] = job.error
+        if job.state == "done" and job.output:
+            status["output"] = job.output.name
+            try:
+                status["size"] = job.output.stat().st_size
+            except OSError:
+                pass
+            status["download"] = f"/jobs/{job.id}/output"
+        if job.log:
+            status["log"] = list(job.log)
+        return status
+    
+    def cancel(self, job: ServiceJob) -> Dict[str, Any]:
+        """
+        3e. a queued job is dropped, a running one stopped, a finished one
+        deleted along with its files
+        """
+        with self._cond:
+            if job.state == "queued":
+                self._queue.remove(job.client, job)
+                job.state = "cancelled"
+                job.finished = time.time()
+                shutil.rmtree(job.source.parent, ignore_errors=True)
+            elif job.state == "running":
+                job.cancelled = True
+                if job.worker:
+                    job.worker.stop()
+            else:
+                # 3f. two deletes of one job may both get here
+                self._jobs.pop(job.id, None)
+                shutil.rmtree(job.folder, ignore_errors=True)
+                return {"id": job.id, "state": "deleted"}
+            return self._describe(job)
+    
+    def close(self):
+        """
+        3g. stops the running jobs and waits for the slots, then removes the
+        jobs' files, jobs don't outlive the service
+        """
+        with self._cond:
+            self._closing = True
+            running = [job.worker for job in self._jobs.values() if job.worker]
+            self._cond.notify_all()
+        for worker in running:
+            worker.stop()
+        for slot in self._slots:
+            if slot.is_alive():
+                slot.join(timeout=30)
+        if self._own_spool:
+            shutil.rmtree(self.spool, ignore_errors=True)
+            return
+        with self._cond:
+            folders = [job.folder for job in self._jobs.values()]
+            self._jobs.clear()
+        for folder in folders:
+            shutil.rmtree(folder, ignore_errors=True)
+    
+    def _slot(self):
+        """
+        3h. one conversion at a time, clears expired jobs between them and
+        every EXPIRE_INTERVAL while idle
+        """
+        while True:
+            with self._cond:
+                expired = self._expired()
+                job = None if self._closing else self._queue.pop()
+                if job is None:
+                    if self._closing:
+                        return
+                    self._cond.wait(EXPIRE_INTERVAL)
+                else:
+                    job.state = "running"
+                    job.worker = ConversionWorker(
+                        _JobFeed(job), max_workers=1, history=self.history, registry=self.registry
+                    )
+            for folder in expired:
+                shutil.rmtree(folder, ignore_errors=True)
+            if job:
+                self._run(job)
+    
+    def _run(self, job: ServiceJob):
+        output_folder = job.folder / "output"
+        try:
+            job.worker.convert_files(
+                [job.source],
+                output_folder,
+                job.target_format,
+                self.ebook_convert_path,
+                **{**self.run_options, "max_workers": 1, "journal": False}
+            )
+        except Exception as e:
+            job.log.append(f"-> ERROR: {str(e)}")
+        
+        outputs = sorted(p for p in output_folder.glob("*") if not p.name.startswith(".")) if output_folder.is_dir() else []
+        with self._cond:
+            job.worker = None
+            job.finished = time.time()
+            if job.cancelled:
+                job.state = "cancelled"
+            elif (job.results or {}).get("successful") and outputs:
+                job.state = "done"
+                job.output = outputs[0]
+            else:
+                job.state = "failed"
+                # 3i. a skipped file only gets a "Skipping (reason)" line
+                job.error = job.log[-1] if job.log else "not converted"
+        shutil.rmtree(job.source.parent, ignore_errors=True)
+    
+    def _expired(self) -> List[Path]:
+        """
+        3j. forgets finished jobs older than keep, returns their folders
+        """
+        now = time.time()
+        expired = [
+            job for job in self._jobs.values()
+            if job.state in FINISHED_STATES and job.finished and now - job.finished > self.keep
+        ]
+        for job in expired:
+            del self._jobs[job.id]
+        return [job.folder for job in expired]
+
+
+class ServiceServer(ThreadingHTTPServer):
+    """
+    4a. the HTTP front of a ConversionService, one thread per connection
+    """
+    daemon_threads = True
+    
+    def __init__(self, address: Tuple[str, int], service: ConversionService, quiet: bool = False):
+        super().__init__(address, _ServiceHandler)
+        self.service = service
+        self.quiet = quiet
+
+
+class _ServiceHandler(BaseHTTPRequestHandler):
+    """
+    4b. routes requests to the service, every answer but a download is json
+    """
+    protocol_version = "HTTP/1.1"
+    server: ServiceServer
+    
+    def handle_expect_100(self) -> bool:
+        # 4c. a full queue is reported before the client sends the book
+        try:
+            self.server.service.check_room(self._client())
+        except ServiceError as e:
+            self.close_connection = True
+            self._send_json(e.status, {"error": str(e)})
+            return False
+        return super().handle_expect_100()
+    
+    def do_POST(self):
+        self._handle("POST")
+    
+    def do_GET(self):
+        self._handle("GET")
+    
+    def do_DELETE(self):
+        self._handle("DELETE")
+    
+    def _handle(self, method: str):
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        service = self.server.service
+        client = self._client()
+        try:
+            if parts == ["jobs"] and method == "POST":
+                query = parse_qs(url.query)
+                job = service.submit(
+                    client,
+                    query.get("name", ["book"])[0],
+                    query.get("to", [""])[0],
+                    self._body()
+                )
+                self._send_json(202, service.status(job))
+            elif parts == ["jobs"] and method == "GET":
+                self._send_json(200, {"jobs": service.jobs(client)})
+            elif len(parts) == 2 and parts[0] == "jobs" and method == "GET":
+                self._send_json(200, service.status(service.job(client, parts[1])))
+            elif len(parts) == 2 and parts[0] == "jobs" and method == "DELETE":
+                self._send_json(200, service.cancel(service.job(client, parts[1])))
+            elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "output" and method == "GET":
+                self._send_output(service.job(client, parts[1]))
+            else:
+                raise ServiceError(404, f"no such endpoint: {method} {url.path}")
+        except ServiceError as e:
+            # 4d. an upload turned down part way is not read to its end
+            if method == "POST":
+                self.close_connection = True
+            self._send_json(e.status, {"error": str(e)})
+    
+    def _client(self) -> str:
+        return self.headers.get("X-Client-Id") or self.client_address[0]
+    
+    def _body(self) -> Iterator[bytes]:
+        """
+        4e. the request body in chunks, sized by Content-Length or sent chunked
+        """
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            return _read_chunked(self.rfile)
+        length = self.headers.get("Content-Length")
+        if length is None or not length.isdigit():
+            raise ServiceError(411, "send the book with Content-Length or chunked")
+        return _read_exactly(self.rfile, int(length))
+    
+    def _send_output(self, job: ServiceJob):
+        if job.state != "done" or not job.output:
+            raise ServiceError(409, f"job is {job.state}, there is nothing to download")
+        try:
+            f = open(job.output, "rb")
+        except OSError:
+            raise ServiceError(410, "the output is gone")
+        with f:
+            size = f.seek(0, 2)
+            f.seek(0)
+            self.send_response(200)
+            self.send_header("Content-Type", mimetypes.guess_type(job.output.name)[0] or "application/octet-stream")
+            self.send_header("Content-Length", str(size))
+            self.send_header("Content-Disposition", f'attachment; filename="{job.output.name}"')
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile, CHUNK_SIZE)
+    
+    def _send_json(self, status: int, body: Dict[str, Any]):
+        data = json.dumps(body, indent=2).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def log_message(self, format: str, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+def _read_exactly(stream: BinaryIO, length: int) -> Iterator[bytes]:
+    remaining = length
+    while remaining:
+        data = stream.read(min(CHUNK_SIZE, remaining))
+        if not data:
+            raise ServiceError(400, "upload ended early")
+        remaining -= len(data)
+        yield data
+
+
+def _read_chunked(stream: BinaryIO) -> Iterator[bytes]:
+    """
+    5a. decodes Transfer-Encoding: chunked, trailers are read and ignored
+    """
+    while True:
+        line = stream.readline(MAX_HEADER_LINE)
+        try:
+            size = int(line.split(b";", 1)[0].strip(), 16)
+        except ValueError:
+            raise ServiceError(400, "bad chunk in upload")
+        if size == 0:
+            while stream.readline(MAX_HEADER_LINE) not in (b"\r\n", b"\n", b""):
+                pass
+            return
+        yield from _read_exactly(stream, size)
+        stream.readline(MAX_HEADER_LINE)
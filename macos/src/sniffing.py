@@ -0,0 +1,234 @@
+"""
+EBook Converter Pro - format sniffing
+Tells what a file really is from its first few KB, so a mislabelled book
+is converted as what it is and a file that is not an ebook never costs
+a Calibre launch
+"""
+
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+from formats import EBOOK_FORMATS, EXTENSION_FORMATS
+
+
+# 1a. bytes looked at, the rest of the file is never read
+SNIFF_BYTES = 8192
+
+# 1b. what sniff() returns besides format names
+TEXT = "TEXT"  # plain text without markup it could be told apart by
+ZIP = "ZIP"    # a zip archive that fits none of the zip based formats
+
+# 1c. formats that are text, and ones that are zip archives, by extension
+TEXT_FORMATS = {"TXT", "HTML", "FB2", "RTF"}
+ZIP_FORMATS = {"EPUB", "DOCX", "ODT", "HTMLZ", "TXTZ", "CBZ", "CBC"}
+
+# 1d. calibre picks its input plugin by extension, these share one
+MOBI_FAMILY = {"MOBI", "AZW3"}
+
+# 1e. palm database type+creator codes calibre's PDB input reads
+PDB_TYPES = {b"TEXtREAd", b"TEXtTlDc", b"PNRdPPrs", b"PDctPPrs", b"DataPlkr", b"zTXTGPlm"}
+
+# 1f. magic numbers at offset 0
+MAGIC = (
+    (b"%PDF-", "PDF"),
+    (b"ITOLITLS", "LIT"),
+    (b"SNBP000B", "SNB"),
+    (b"!!8-Bit!!", "TCR"),
+    (b"Rar!\x1a\x07", "CBR"),
+    (b"{\\rtf", "RTF"),
+)
+NOT_EBOOKS = (
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "an Office 97-2003 document"),
+    (b"\x89PNG", "a PNG image"),
+    (b"\xff\xd8\xff", "a JPEG image"),
+    (b"GIF8", "a GIF image"),
+    (b"\x7fELF", "a program"),
+    (b"MZ", "a Windows program"),
+    (b"\x1f\x8b", "a gzip archive"),
+    (b"7z\xbc\xaf\x27\x1c", "a 7-Zip archive"),
+    (b"AT&TFORM", "a DjVu document"),
+    (b"Microsoft C/C++ MSF", "debug symbols"),
+)
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp")
+
+Buffer = Union[bytes, mmap.mmap]
+
+
+def sniff(path: Path) -> Tuple[Optional[str], str]:
+    """
+    2a. (kind, description) from the file's content
+    kind is a format name, TEXT, ZIP, or None for anything else
+    the file is memory mapped, so only the pages looked at are read
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return None, "an empty file"
+        try:
+            data: Buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            data = f.read(SNIFF_BYTES)
+        try:
+            return _sniff(data)
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+
+def _sniff(data: Buffer) -> Tuple[Optional[str], str]:
+    head = data[:SNIFF_BYTES]
+    for magic, fmt in MAGIC:
+        if head.startswith(magic):
+            return fmt, fmt
+    # 2b. PDFs may have a little junk before the header
+    if b"%PDF-" in head[:1024]:
+        return "PDF", "PDF"
+    if head.startswith(b"PK\x03\x04"):
+        return _sniff_zip(data)
+    if head.startswith(b"TPZ"):
+        # 2c. calibre reads Topaz with its MOBI input
+        return "MOBI", "a Topaz book"
+    if len(head) >= 78:
+        type_creator = head[60:68]
+        if type_creator == b"BOOKMOBI":
+            return _sniff_mobi(data)
+        if type_creator in PDB_TYPES:
+            return "PDB", "PDB"
+    for magic, description in NOT_EBOOKS:
+        if head.startswith(magic):
+            return None, description
+    return _sniff_text(head)
+
+
+def _sniff_mobi(data: Buffer) -> Tuple[Optional[str], str]:
+    """
+    2d. file version 8 in the MOBI header of record 0 means KF8 only (AZW3),
+    older and joint MOBI/KF8 books are MOBI
+    """
+    if len(data) < 82:
+        return "MOBI", "MOBI"
+    record0 = struct.unpack(">I", data[78:82])[0]
+    header = data[record0 + 16:record0 + 40]
+    if len(header) == 24 and header[:4] == b"MOBI":
+        version = struct.unpack(">I", header[20:24])[0]
+        if version >= 8:
+            return "AZW3", "AZW3"
+    return "MOBI", "MOBI"
+
+
+def _sniff_zip(data: Buffer) -> Tuple[Optional[str], str]:
+    """
+    2e. walks the first few local headers, enough for the mimetype entry of
+    EPUB/ODT and the top level names of the rest
+    """
+    names = []
+    offset = 0
+    while len(names) < 16 and data[offset:offset + 4] == b"PK\x03\x04":
+        header = data[offset:offset + 30]
+        if len(header) < 30:
+            break
+        flags, method = struct.unpack("<HH", header[6:10])
+        compressed, = struct.unpack("<I", header[18:22])
+        name_len, extra_len = struct.unpack("<HH", header[26:30])
+        start = offset + 30
+        name = bytes(data[start:start + name_len])
+        body = start + name_len + extra_len
+        if not names and name == b"mimetype" and method == 0:
+            mimetype = bytes(data[body:body + min(compressed, 100)]).strip()
+            if mimetype == b"application/epub+zip":
+                return "EPUB", "EPUB"
+            if mimetype == b"application/vnd.oasis.opendocument.text":
+                return "ODT", "ODT"
+            if mimetype.startswith(b"application/vnd.oasis.opendocument."):
+                return None, "an OpenDocument spreadsheet or presentation"
+        names.append(name.decode("utf-8", errors="replace").lower())
+        # 2f. sizes come after the data when bit 3 is set, can't skip ahead
+        if flags & 0x08:
+            break
+        offset = body + compressed
+    
+    if any(n.startswith("word/") for n in names):
+        return "DOCX", "DOCX"
+    if any(n.startswith(("xl/", "ppt/")) for n in names):
+        return None, "an Excel or PowerPoint document"
+    if "comics.txt" in names:
+        return "CBC", "CBC"
+    if "index.txt" in names:
+        return "TXTZ", "TXTZ"
+    if "index.html" in names:
+        return "HTMLZ", "HTMLZ"
+    files = [n for n in names if not n.endswith("/")]
+    if files and all(n.endswith(IMAGE_SUFFIXES) for n in files):
+        return "CBZ", "CBZ"
+    return ZIP, "a zip archive"
+
+
+def _sniff_text(head: bytes) -> Tuple[Optional[str], str]:
+    """
+    2g. text, possibly UTF-16, with markup that gives its format away
+    """
+    if head.startswith((b"\xff\xfe", b"\xfe\xff")):
+        head = head.decode("utf-16", errors="ignore").encode("utf-8")
+    elif b"\x00" in head:
+        return None, "binary data"
+    lowered = head.lstrip(b"\xef\xbb\xbf \t\r\n").lower()
+    if lowered.startswith(b"{\\rtf"):
+        return "RTF", "RTF"
+    if b"<fictionbook" in lowered:
+        return "FB2", "FB2"
+    if b"<html" in lowered or b"<!doctype html" in lowered or b"<body" in lowered:
+        return "HTML", "HTML"
+    return TEXT, "plain text"
+
+
+def detect_format(path: Path) -> Tuple[Optional[str], str]:
+    """
+    3a. the format to convert path as, None if it is not an ebook
+    the description says what it looked like instead
+    content wins over the extension, except that text and zip files with
+    nothing more telling inside keep the format their extension claims
+    an unreadable file keeps its extension's format, calibre will report it
+    """
+    claimed = EXTENSION_FORMATS.get(path.suffix.lower())
+    try:
+        kind, description = sniff(path)
+    except OSError:
+        return claimed, "unreadable"
+    if kind == TEXT:
+        return (claimed, description) if claimed in TEXT_FORMATS else (None, description)
+    if kind == ZIP:
+        return (claimed, description) if claimed in ZIP_FORMATS else (None, description)
+    if kind == "HTML" and claimed == "TXT":
+        # 3b. a text file quoting some markup is still a text file
+        return claimed, description
+    return kind, description
+
+
+class SniffedPath(type(Path())):
+    """
+    3c. a path a folder scan has already run detect_format on, so queueing
+    it doesn't read its header a second time. paths derived from it
+    (parent, with_suffix...) have no detection of their own
+    """
+    detected: Optional[Tuple[Optional[str], str]] = None
+
+
+def scanned_format(path: Path) -> Tuple[Optional[str], str]:
+    """
+    3d. detect_format, reusing what the scan found for a SniffedPath
+    """
+    return getattr(path, "detected", None) or detect_format(path)
+
+
+def reader_suffix(path: Path, fmt: str) -> Optional[str]:
+    """
+    3e. the extension calibre needs to read path as fmt, None if its own will do
+    """
+    claimed = EXTENSION_FORMATS.get(path.suffix.lower())
+    if claimed == fmt or {claimed, fmt} <= MOBI_FAMILY:
+        return None
+    return EBOOK_FORMATS[fmt][0]
@@ -0,0 +1,65 @@
+"""
+EBook Converter Pro - stand-in ebook-convert for the tests
+Answers --version like Calibre, prints progress lines the way
+ebook-convert does and copies the input to the output, so a run goes
+through the real process handling without Calibre installed. An EPUB
+output is a real one, a single chapter holding the input's text, so
+native backends can read it. A file named with "fail" fails,
+STUB_DELAY is how long a conversion takes
+
+    python stub_ebook_convert.py input output [options...]
+"""
+
+import html
+import os
+import shutil
+import sys
+import time
+import zipfile
+
+
+CONTAINER = """<?xml version="1.0"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+<rootfiles><rootfile full-path="content.opf" media-type="application/oebps-package+xml"/></rootfiles>
+</container>"""
+
+PACKAGE = """<?xml version="1.0"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="2.0">
+<metadata xmlns:dc="http://purl.org/dc/elements/1.1/"><dc:title>{title}</dc:title></metadata>
+<manifest><item id="text" href="text.xhtml" media-type="application/xhtml+xml"/></manifest>
+<spine><itemref idref="text"/></spine>
+</package>"""
+
+
+def write_epub(source: str, output: str):
+    with open(source, "rb") as f:
+        text = f.read().decode("latin-1")
+    title = html.escape(os.path.splitext(os.path.basename(source))[0])
+    with zipfile.ZipFile(output, "w") as book:
+        book.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        book.writestr("META-INF/container.xml", CONTAINER)
+        book.writestr("content.opf", PACKAGE.format(title=title))
+        book.writestr("text.xhtml", f"<html><body><pre>{html.escape(text)}</pre></body></html>")
+
+
+def main() -> int:
+    if sys.argv[1:2] == ["--version"]:
+        print("ebook-convert (calibre 7.2.0)")
+        return 0
+    source, output = sys.argv[1], sys.argv[2]
+    delay = float(os.environ.get("STUB_DELAY", "0.2"))
+    for percent in (1, 34, 67, 100):
+        print(f"{percent}% Converting input to output", flush=True)
+        time.sleep(delay / 4)
+    if "fail" in os.path.basename(source):
+        print("ValueError: stub failure", file=sys.stderr)
+        return 1
+    if output.lower().endswith(".epub"):
+        write_epub(source, output)
+    else:
+        shutil.copyfile(source, output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
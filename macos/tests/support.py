@@ -0,0 +1,38 @@
+"""
+EBook Converter Pro - test helpers
+Puts src on the path, builds the stand-in ebook-convert command and
+small books to feed it
+"""
+
+import stat
+import sys
+import zipfile
+from pathlib import Path
+
+TESTS = Path(__file__).resolve().parent
+sys.path.insert(0, str(TESTS.parent / "src"))
+
+
+def write_stub(folder: Path) -> str:
+    """
+    1a. a command that runs the stub with this interpreter, ebook-convert
+    is started as a program of its own
+    """
+    stub = TESTS / "stub_ebook_convert.py"
+    if sys.platform == "win32":
+        command = folder / "ebook-convert.bat"
+        command.write_text(f'@"{sys.executable}" "{stub}" %*\n')
+    else:
+        command = folder / "ebook-convert"
+        command.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{stub}" "$@"\n')
+        command.chmod(command.stat().st_mode | stat.S_IXUSR)
+    return str(command)
+
+
+def write_epub(path: Path):
+    """
+    1b. the smallest zip that sniffs as an EPUB
+    """
+    with zipfile.ZipFile(path, "w") as book:
+        book.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        book.writestr("content.opf", "<package/>")
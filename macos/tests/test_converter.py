@@ -0,0 +1,195 @@
+"""
+EBook Converter Pro - conversion batch tests
+Runs ConversionWorker.convert_files against the stand-in ebook-convert:
+chained targets, resuming a stopped batch from its journal, duplicates,
+the cache, incremental skips and native backends
+
+    python3 -m unittest discover tests
+"""
+
+import os
+import queue
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from support import write_stub
+
+from cache import ConversionCache
+from converter import ConversionWorker
+from governor import ResourceLimits
+from history import ConversionHistory
+from journal import load_journal
+
+
+# 1a. a fake PDF, the stub's EPUB of it holds this text
+BOOK = b"%PDF-1.4\nthe chained chapter\n"
+
+
+class StopAfter(queue.Queue):
+    """
+    1b. a callback queue that stops the worker once count files have
+    converted, like the Stop button part way through a batch
+    """
+    
+    def __init__(self, count: int):
+        super().__init__()
+        self.count = count
+        self.worker = None
+    
+    def put(self, item, block: bool = True, timeout=None):
+        super().put(item, block, timeout)
+        msg_type, data = item
+        if msg_type == "file_finished" and data.outcome == "success":
+            self.count -= 1
+            if self.count == 0:
+                self.worker.stop()
+
+
+class ConverterTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.folder = Path(tempfile.mkdtemp(prefix="ebook-converter-test-"))
+        self.addCleanup(shutil.rmtree, self.folder, ignore_errors=True)
+        os.environ["STUB_DELAY"] = "0"
+        self.addCleanup(os.environ.pop, "STUB_DELAY", None)
+        self.ebook_convert = write_stub(self.folder)
+        self.source = self.folder / "source"
+        self.output = self.folder / "output"
+        self.source.mkdir()
+    
+    def books(self, *names: str, content: bytes = BOOK):
+        paths = []
+        for name in names:
+            path = self.source / name
+            path.write_bytes(content + name.encode())
+            paths.append(path)
+        return paths
+    
+    def worker(self, updates=None) -> ConversionWorker:
+        worker = ConversionWorker(
+            updates if updates is not None else queue.Queue(),
+            max_workers=1,
+            history=ConversionHistory(self.folder / "history.json")
+        )
+        if isinstance(updates, StopAfter):
+            updates.worker = worker
+        return worker
+    
+    def convert(self, files, targets, updates=None, **options):
+        """
+        2a. one batch, returns (results, log lines)
+        """
+        worker = self.worker(updates)
+        results = worker.convert_files(
+            files, self.output, targets, self.ebook_convert,
+            limits=ResourceLimits(nice=0, idle_io=False), **options
+        )
+        return results, self.log(worker.callback_queue)
+    
+    @staticmethod
+    def log(updates: queue.Queue):
+        lines = []
+        while not updates.empty():
+            msg_type, data = updates.get()
+            if msg_type == "log":
+                lines.append(data)
+        return lines
+    
+    def outputs(self):
+        return sorted(p.name for p in self.output.iterdir() if not p.name.startswith("."))
+    
+    def test_target_made_from_another_target(self):
+        # 3a. nothing makes HTML from PDF, the native EPUB to HTML backend
+        # makes it from the EPUB the same batch converts
+        pdf, = self.books("book.pdf")
+        results, log = self.convert([pdf], ["EPUB", "HTML"], journal=False)
+        
+        self.assertEqual(results["successful"], 2, log)
+        self.assertEqual(results["skipped"], 0, log)
+        self.assertTrue((self.output / "book.epub").is_file())
+        self.assertIn("the chained chapter", (self.output / "book.html").read_text(encoding="utf-8"))
+    
+    def test_target_nothing_makes(self):
+        pdf, = self.books("book.pdf")
+        results, log = self.convert([pdf], ["HTML"], journal=False)
+        
+        self.assertEqual(results["skipped"], 1)
+        self.assertIn("Skipping (nothing converts PDF to HTML): book.pdf", log)
+    
+    def test_resume_after_partial_run(self):
+        files = self.books("a.pdf", "b.pdf", "c.pdf", "d.pdf")
+        results, log = self.convert(files, "MOBI", updates=StopAfter(1))
+        self.assertEqual(results["successful"], 1, log)
+        
+        state = load_journal(self.output)
+        self.assertIsNotNone(state)
+        self.assertEqual(len(state.pending), 3)
+        self.assertEqual(state.settings["output_format"], "MOBI")
+        done, = self.outputs()
+        first = (self.output / done).stat().st_mtime_ns
+        
+        # 3b. only what the journal still owes is converted, then it is gone
+        worker = self.worker()
+        self.assertTrue(worker.resume(self.output, self.ebook_convert, limits=ResourceLimits(nice=0, idle_io=False)))
+        self.assertEqual(self.outputs(), ["a.mobi", "b.mobi", "c.mobi", "d.mobi"])
+        self.assertEqual((self.output / done).stat().st_mtime_ns, first)
+        self.assertIn("  Successful: 3", self.log(worker.callback_queue))
+        self.assertIsNone(load_journal(self.output))
+    
+    def test_resume_owes_only_missing_targets(self):
+        files = self.books("a.pdf", "b.pdf")
+        self.convert(files, ["EPUB", "MOBI"], updates=StopAfter(1))
+        
+        # 3c. a's EPUB was made first, as the intermediate of its MOBI
+        state = load_journal(self.output)
+        self.assertEqual(self.outputs(), ["a.epub"])
+        self.assertEqual(state.targets[str(files[0])], ["MOBI"])
+        self.assertEqual(sorted(state.targets[str(files[1])]), ["EPUB", "MOBI"])
+        
+        worker = self.worker()
+        worker.resume(self.output, self.ebook_convert, limits=ResourceLimits(nice=0, idle_io=False))
+        self.assertEqual(self.outputs(), ["a.epub", "a.mobi", "b.epub", "b.mobi"])
+        self.assertIn("  Successful: 3", self.log(worker.callback_queue))
+    
+    def test_duplicates_convert_once(self):
+        first, second = self.books("a.pdf", "b.pdf")
+        second.write_bytes(first.read_bytes())
+        results, log = self.convert([first, second], "MOBI", journal=False, dedup="copy")
+        
+        self.assertEqual(results["duplicates"], 1, log)
+        self.assertEqual(results["successful"], 1, log)
+        self.assertEqual(self.outputs(), ["a.mobi", "b.mobi"])
+        self.assertEqual((self.output / "b.mobi").read_bytes(), first.read_bytes())
+    
+    def test_cache_hit_in_another_output_folder(self):
+        pdf, = self.books("book.pdf")
+        cache = ConversionCache(self.folder / "cache")
+        results, log = self.convert([pdf], "MOBI", journal=False, cache=cache)
+        self.assertEqual((results["cache_hits"], results["cache_misses"]), (0, 1), log)
+        
+        self.output = self.folder / "again"
+        results, log = self.convert([pdf], "MOBI", journal=False, cache=cache)
+        self.assertEqual((results["cache_hits"], results["cache_misses"]), (1, 0), log)
+        self.assertEqual((self.output / "book.mobi").read_bytes(), pdf.read_bytes())
+    
+    def test_incremental_skips_up_to_date(self):
+        files = self.books("a.pdf", "b.pdf")
+        self.convert(files, "MOBI", journal=False, incremental="mtime")
+        
+        files[1].write_bytes(BOOK + b"changed")
+        results, log = self.convert(files, "MOBI", journal=False, incremental="mtime")
+        self.assertEqual((results["up_to_date"], results["successful"]), (1, 1), log)
+    
+    def test_native_backend_without_calibre(self):
+        text, = self.books("notes.txt", content=b"plain words\n")
+        results, log = self.convert([text], "HTML", journal=False)
+        
+        self.assertEqual(results["successful"], 1, log)
+        self.assertEqual(list(results["backends"]), ["native txt>html"])
+        self.assertIn("plain words", (self.output / "notes.html").read_text(encoding="utf-8"))
+
+
+if __name__ == "__main__":
+    unittest.main()
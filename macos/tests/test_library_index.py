@@ -0,0 +1,66 @@
+"""
+EBook Converter Pro - library index tests
+
+    python3 -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from support import write_epub
+
+from library_index import LibraryIndex
+
+
+PDF = b"%PDF-1.4\nsome pages\n"
+
+
+class LibraryIndexTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.folder = Path(tempfile.mkdtemp(prefix="ebook-index-test-"))
+        self.addCleanup(shutil.rmtree, self.folder, ignore_errors=True)
+        self.library = self.folder / "library"
+        self.library.mkdir()
+        self.index = LibraryIndex(self.folder / "library.sqlite3")
+        self.addCleanup(self.index.close)
+    
+    def scan(self, formats):
+        return [(path.name, path.detected[0]) for path in self.index.scan(str(self.library), formats)]
+    
+    def rewrite(self, path: Path, write):
+        """
+        2a. changes a file in place and puts the folder's mtime back, as an
+        editor saving over the file may leave it
+        """
+        st = os.stat(self.library)
+        write(path)
+        os.utime(self.library, ns=(st.st_atime_ns, st.st_mtime_ns))
+    
+    def test_format_is_detected_not_claimed(self):
+        (self.library / "book.mobi").write_bytes(PDF)
+        
+        self.assertEqual(self.scan(["PDF"]), [("book.mobi", "PDF")])
+        self.assertEqual(self.scan(["MOBI"]), [])
+        self.assertEqual([p.name for p in self.index.query(str(self.library), ["PDF"])], ["book.mobi"])
+    
+    def test_file_rewritten_in_place(self):
+        book = self.library / "book.pdf"
+        book.write_bytes(PDF)
+        self.assertEqual(self.scan(["PDF", "EPUB"]), [("book.pdf", "PDF")])
+        
+        # 3a. same folder mtime, the file's own stat shows the change
+        self.rewrite(book, write_epub)
+        self.assertEqual(self.scan(["PDF", "EPUB"]), [("book.pdf", "EPUB")])
+        self.assertEqual([p.name for p in self.index.query(str(self.library), ["EPUB"])], ["book.pdf"])
+        
+        self.rewrite(book, lambda path: path.write_bytes(b"\x00\x01 no longer a book" * 10))
+        self.assertEqual(self.scan(["PDF", "EPUB"]), [])
+        self.assertEqual(self.index.query(str(self.library), ["PDF", "EPUB"]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
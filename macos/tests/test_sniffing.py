@@ -0,0 +1,66 @@
+"""
+EBook Converter Pro - format sniffing tests
+
+    python3 -m unittest discover tests
+"""
+
+import shutil
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+
+from support import write_epub
+
+from sniffing import SniffedPath, detect_format, reader_suffix, scanned_format
+
+
+class SniffingTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.folder = Path(tempfile.mkdtemp(prefix="ebook-sniffing-test-"))
+        self.addCleanup(shutil.rmtree, self.folder, ignore_errors=True)
+    
+    def file(self, name: str, content: bytes) -> Path:
+        path = self.folder / name
+        path.write_bytes(content)
+        return path
+    
+    def epub(self, name: str) -> Path:
+        path = self.folder / name
+        write_epub(path)
+        return path
+    
+    def test_content_wins_over_extension(self):
+        self.assertEqual(detect_format(self.epub("book.pdf")), ("EPUB", "EPUB"))
+        self.assertEqual(detect_format(self.file("book.epub", b"%PDF-1.7\n")), ("PDF", "PDF"))
+        self.assertEqual(detect_format(self.file("book.txt", b"{\\rtf1 hello}")), ("RTF", "RTF"))
+        # 3a. calibre picks its reader by extension, a mislabelled book needs
+        # the right one
+        self.assertEqual(reader_suffix(self.folder / "book.pdf", "EPUB"), ".epub")
+        self.assertIsNone(reader_suffix(self.folder / "book.azw3", "MOBI"))
+    
+    def test_not_an_ebook(self):
+        fmt, description = detect_format(self.file("cover.pdf", b"\x89PNG\r\n\x1a\n" + b"\x00" * 64))
+        self.assertIsNone(fmt)
+        self.assertEqual(description, "a PNG image")
+        self.assertEqual(detect_format(self.file("empty.epub", b"")), (None, "an empty file"))
+        # 3b. a zip with nothing telling inside is only trusted as a zip format
+        with zipfile.ZipFile(self.folder / "notes.mobi", "w") as archive:
+            archive.writestr("notes.txt", "hello")
+        self.assertEqual(detect_format(self.folder / "notes.mobi"), (None, "a zip archive"))
+    
+    def test_text_keeps_its_extension(self):
+        self.assertEqual(detect_format(self.file("notes.txt", b"just words\n")), ("TXT", "plain text"))
+        self.assertEqual(detect_format(self.file("page.txt", b"quoting <html> in text\n"))[0], "TXT")
+        self.assertEqual(detect_format(self.file("notes.pdf", b"just words\n")), (None, "plain text"))
+    
+    def test_scanned_path_is_not_sniffed_again(self):
+        path = SniffedPath(self.file("book.pdf", b"%PDF-1.4\n"))
+        path.detected = ("EPUB", "what the scan saw")
+        self.assertEqual(scanned_format(path), ("EPUB", "what the scan saw"))
+        self.assertEqual(scanned_format(Path(path)), ("PDF", "PDF"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,310 @@
+"""
+EBook Converter Pro - asyncio engine
+The conversion loop on an event loop instead of a thread pool. Calibre
+runs through asyncio.create_subprocess_exec, a semaphore caps how many
+run at once and every file is a task of its own, so one loop can keep
+hundreds of conversions in flight and the engine embeds in an async
+service. Updates still go to the callback queue, events() streams them
+to coroutines as well
+"""
+
+import asyncio
+import queue
+import subprocess
+import time
+from functools import partial
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from capture import SPOOL_BYTES, OutputCapture
+from converter import ConversionBatch, ConversionJob, ConversionRun, ConversionWorker
+from events import format_duration
+from governor import ResourceLimits
+from history import ConversionHistory
+from processes import kill_tree, new_group_kwargs
+from registry import ConverterRegistry
+
+
+# 1a. how often a job waiting for memory asks the gate again
+GATE_POLL = 0.2
+
+
+class AsyncConversionWorker(ConversionWorker):
+    """
+    2a. ConversionWorker driven by an asyncio event loop
+    convert_files_async takes convert_files' options, convert_files runs it
+    on a loop of its own so the GUI and CLI use this worker unchanged
+    the steps that read, hash or copy files run in the loop's default
+    executor, warm Calibre workers are not supported
+    callback_queue may be None for a service that only reads events()
+    """
+    
+    def __init__(
+        self,
+        callback_queue: Optional[queue.Queue] = None,
+        max_workers: Optional[int] = None,
+        history: Optional[ConversionHistory] = None,
+        registry: Optional[ConverterRegistry] = None
+    ):
+        super().__init__(callback_queue, max_workers, history, registry)
+        self._streams: List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = []
+    
+    def events(self) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        2b. the updates as an async stream of (msg_type, data), ending after
+        "complete". it subscribes when called, so call it before starting
+        the run to see all of it, from a coroutine on the reading loop
+        """
+        loop = asyncio.get_running_loop()
+        stream: asyncio.Queue = asyncio.Queue()
+        entry = (loop, stream)
+        with self._lock:
+            self._streams.append(entry)
+        
+        async def follow():
+            try:
+                while True:
+                    msg_type, data = await stream.get()
+                    yield msg_type, data
+                    if msg_type == "complete":
+                        return
+            finally:
+                with self._lock:
+                    self._streams.remove(entry)
+        
+        return follow()
+    
+    def _send_update(self, msg_type: str, data):
+        """
+        2c. the callback queue as before, plus every open event stream
+        """
+        if self.callback_queue is not None:
+            self.callback_queue.put((msg_type, data))
+        with self._lock:
+            streams = list(self._streams)
+        for loop, stream in streams:
+            try:
+                loop.call_soon_threadsafe(stream.put_nowait, (msg_type, data))
+            except RuntimeError:
+                # 2d. the reader's loop is closed
+                pass
+    
+    def convert_files(self, *args, **kwargs) -> Dict[str, Any]:
+        """
+        3a. the blocking call the GUI and CLI make, on an event loop of its own
+        """
+        return asyncio.run(self.convert_files_async(*args, **kwargs))
+    
+    async def convert_files_async(
+        self,
+        files: Iterable[Path],
+        output_folder: Path,
+        output_format: Union[str, Sequence[str]],
+        ebook_convert_path: str,
+        max_workers: Optional[int] = None,
+        **options
+    ) -> Dict[str, Any]:
+        """
+        3b. convert_files as a coroutine, returns the results
+        max_workers is how many conversions run at once, with no threads
+        behind them it can go far past the CPU count when calibre waits on I/O
+        cancelling the task stops the run like stop(): running processes are
+        killed, the jobs wind down and the journal keeps the rest for resume
+        """
+        loop = asyncio.get_running_loop()
+        if options.pop("warm", False):
+            self._send_update("log", "Warm Calibre workers aren't used on an event loop, starting ebook-convert per file")
+        batch = await loop.run_in_executor(None, partial(
+            self._start_batch, files, output_folder, output_format, ebook_convert_path,
+            max_workers=max_workers, **options
+        ))
+        run = batch.run
+        workers = batch.workers
+        slots = asyncio.Semaphore(workers)
+        tasks: Dict[asyncio.Future, ConversionJob] = {}
+        try:
+            try:
+                # 3c. like the thread pool, only a small window of jobs is started
+                while not self.should_stop:
+                    await loop.run_in_executor(None, batch.refill, len(tasks))
+                    if not batch.pending:
+                        if not tasks:
+                            break
+                        # 3d. derived jobs are queued as their intermediates finish
+                        await self._collect(batch, tasks)
+                        continue
+                    while len(tasks) >= workers * 2:
+                        await self._collect(batch, tasks)
+                    for job in batch.next_task(workers):
+                        tasks[asyncio.ensure_future(self._convert_one_async(job, run, slots))] = job
+                
+                while tasks:
+                    await self._collect(batch, tasks)
+            except asyncio.CancelledError:
+                # 3e. cooperative, stop() kills the processes and the jobs
+                # report "cancelled" so the journal knows what is left
+                self.stop()
+                try:
+                    while tasks:
+                        await self._collect(batch, tasks)
+                finally:
+                    for task in tasks:
+                        task.cancel()
+                raise
+            
+            # 3f. files killed for memory get another go, alone and with the whole budget
+            if batch.retries and not self.should_stop:
+                self._send_update("log", f"Retrying {len(batch.retries)} file(s) that ran out of memory, one at a time")
+                run.alone = True
+                while batch.retries and not self.should_stop:
+                    job = batch.retries.pop(0)
+                    batch.tally(job, await self._convert_one_async(job, run, slots))
+        finally:
+            results = await loop.run_in_executor(None, self._finish_batch, batch)
+        return results
+    
+    async def resume_async(self, output_folder: Path, ebook_convert_path: str, **kwargs) -> bool:
+        """
+        3g. resume() as a coroutine
+        """
+        loop = asyncio.get_running_loop()
+        arguments = await loop.run_in_executor(None, self._resume_arguments, output_folder)
+        if arguments is None:
+            return False
+        files, options = arguments
+        await self.convert_files_async(files, output_folder, ebook_convert_path=ebook_convert_path, **options, **kwargs)
+        return True
+    
+    async def _collect(self, batch: ConversionBatch, tasks: Dict[asyncio.Future, ConversionJob]):
+        """
+        3h. waits for at least one job and tallies what finished
+        """
+        finished, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in finished:
+            job = tasks.pop(task)
+            if not task.cancelled():
+                batch.tally(job, task.result())
+    
+    async def _convert_one_async(self, job: ConversionJob, run: ConversionRun, slots: asyncio.Semaphore) -> str:
+        """
+        3i. _convert_one on the loop, once the semaphore has a slot
+        """
+        async with slots:
+            if self.should_stop:
+                return "cancelled"
+            self._job_started(job, run)
+            start = time.monotonic()
+            outcome = await self._convert_job_async(job, run)
+            duration = time.monotonic() - start
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self._job_done, job, run, outcome, duration)
+    
+    async def _convert_job_async(self, job: ConversionJob, run: ConversionRun) -> str:
+        """
+        3j. _convert_job with calibre as an asyncio subprocess
+        """
+        loop = asyncio.get_running_loop()
+        outcome, digest, cache_key = await loop.run_in_executor(None, self._prepare, job, run)
+        if outcome:
+            return outcome
+        
+        timeout, memory = self._calibre_budget(job, run)
+        if memory and not await self._admit(run, memory):
+            self._send_update("log", f"  -> CANCELLED: {job.source.name}")
+            return "cancelled"
+        
+        partial_path = self._partial_path(job)
+        alias = None
+        capture = OutputCapture(lambda percent, stage: self._file_progress(job, run, percent, stage))
+        try:
+            try:
+                source, alias = await loop.run_in_executor(None, self._calibre_input, job)
+                returncode = await self._run_ebook_convert_async(
+                    [run.ebook_convert_path, str(source), str(partial_path), *run.convert_options],
+                    timeout=timeout,
+                    capture=capture,
+                    limits=run.limits,
+                    alone=run.alone
+                )
+            except subprocess.TimeoutExpired:
+                note = await loop.run_in_executor(None, self._keep_log, job, capture)
+                self._send_update(
+                    "log",
+                    f"  -> TIMEOUT: {job.source.name} took longer than {format_duration(timeout)}{note}"
+                )
+                return "failed"
+            except Exception as e:
+                self._send_update("log", f"  -> ERROR ({job.source.name}): {str(e)}")
+                return "failed"
+            finally:
+                if memory:
+                    run.gate.release(memory)
+            return await loop.run_in_executor(
+                None, self._calibre_outcome, job, run, returncode, capture, partial_path, digest, cache_key
+            )
+        finally:
+            capture.close()
+            self._discard(partial_path, alias)
+    
+    async def _admit(self, run: ConversionRun, memory: int) -> bool:
+        """
+        3k. the memory gate, polled since a blocking acquire() would hold an
+        executor thread for every job that waits
+        """
+        while not run.gate.try_acquire(memory):
+            if self.should_stop:
+                return False
+            await asyncio.sleep(GATE_POLL)
+        return True
+    
+    async def _run_ebook_convert_async(
+        self,
+        cmd: List[str],
+        timeout: float,
+        capture: OutputCapture,
+        limits: Optional[ResourceLimits] = None,
+        alone: bool = False
+    ) -> int:
+        """
+        3l. runs one ebook-convert process, registered so stop() can kill it
+        output streams into capture as it is written, returns the exit code
+        """
+        proc = await asyncio.create_subprocess_exec(
+            *(limits.command(cmd, alone) if limits else cmd),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            **(limits.popen_kwargs() if limits else new_group_kwargs())
+        )
+        with self._lock:
+            self._processes.add(proc)
+        try:
+            # 3m. stop() may have run between the spawn and registering
+            if self.should_stop:
+                kill_tree(proc)
+            try:
+                await asyncio.wait_for(self._pump(proc, capture), timeout)
+            except asyncio.TimeoutError:
+                # 3n. the whole tree, leftover children would hold the pipe open
+                kill_tree(proc)
+                await proc.wait()
+                raise subprocess.TimeoutExpired(cmd, timeout)
+            return proc.returncode
+        except asyncio.CancelledError:
+            kill_tree(proc)
+            await proc.wait()
+            raise
+        finally:
+            with self._lock:
+                self._processes.discard(proc)
+    
+    async def _pump(self, proc: asyncio.subprocess.Process, capture: OutputCapture):
+        """
+        3o. feeds the output to capture until the process closes it, then reaps it
+        """
+        while True:
+            data = await proc.stdout.read(SPOOL_BYTES)
+            if not data:
+                break
+            capture.feed(data)
+        capture.finish()
+        await proc.wait()
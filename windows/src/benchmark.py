@@ -0,0 +1,89 @@
+"""
+EBook Converter Pro - startup overhead benchmark
+Converts a batch of tiny generated books once with a fresh ebook-convert
+per file and once with warm calibre-debug workers, and prints the time
+each costs per file. Tiny inputs make the difference almost pure startup
+
+    python benchmark.py --files 20 --to EPUB
+"""
+
+import argparse
+import queue
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from converter import ConversionWorker
+from formats import EBOOK_FORMATS
+from history import ConversionHistory
+
+
+def _make_books(folder: Path, count: int):
+    """
+    1a. short TXT files, a few paragraphs each
+    """
+    text = "\n\n".join(f"Paragraph {n}. " + "Lorem ipsum dolor sit amet. " * 8 for n in range(10))
+    for n in range(count):
+        (folder / f"book{n:03d}.txt").write_text(f"Book {n}\n\n{text}\n", encoding="utf-8")
+
+
+def _timed_run(worker: ConversionWorker, files, output: Path, target: str, ebook_convert: str,
+               jobs: int, warm: bool) -> float:
+    """
+    1b. wall time of one convert_files call, fails loudly if a file failed
+    """
+    start = time.perf_counter()
+    worker.convert_files(files, output, target, ebook_convert, max_workers=jobs, warm=warm)
+    elapsed = time.perf_counter() - start
+    summary = None
+    while True:
+        try:
+            msg_type, data = worker.callback_queue.get_nowait()
+        except queue.Empty:
+            break
+        if msg_type == "complete":
+            summary = data
+    if not summary or summary["failed"]:
+        raise RuntimeError(f"benchmark run failed: {summary}")
+    return elapsed
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measure per-file Calibre startup overhead.")
+    parser.add_argument("--files", type=int, default=20, help="number of generated books")
+    parser.add_argument("--to", dest="target", default="EPUB", choices=list(EBOOK_FORMATS))
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="parallel conversions")
+    parser.add_argument("--ebook-convert", dest="ebook_convert", default=None)
+    args = parser.parse_args(argv)
+    
+    worker = ConversionWorker(queue.Queue())
+    ebook_convert = args.ebook_convert or worker.find_ebook_convert()
+    if not ebook_convert:
+        print("error: Calibre's ebook-convert was not found", file=sys.stderr)
+        return 3
+    
+    with tempfile.TemporaryDirectory(prefix="ebook-bench-") as tmp:
+        root = Path(tmp)
+        # 2a. a throwaway history, so the benchmark never skews real ETAs
+        worker.history = ConversionHistory(root / "history.json")
+        source = root / "in"
+        source.mkdir()
+        _make_books(source, args.files)
+        files = worker.scan_folder(str(source), ["TXT"])
+    
+        results = []
+        for label, warm in (("ebook-convert per file", False), ("warm calibre-debug", True)):
+            elapsed = _timed_run(worker, files, root / label.split()[0], args.target, ebook_convert, args.jobs, warm)
+            results.append((label, elapsed))
+    
+    print(f"{args.files} TXT -> {args.target}, {args.jobs} job(s)")
+    for label, elapsed in results:
+        print(f"  {label:<24} {elapsed:7.2f} s total  {elapsed / args.files * 1000:8.0f} ms/file")
+    cold, warm = results[0][1], results[1][1]
+    print(f"  saved {(cold - warm) / args.files * 1000:.0f} ms per file ({cold / warm:.1f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""
+EBook Converter Pro - conversion cache
+Content-addressed store of finished conversions, so the same book under
+another name or in another folder is copied instead of reconverted
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+
+from paths import user_cache_dir
+
+
+# 1a. default size limit before least recently used entries are dropped
+DEFAULT_CACHE_BYTES = 2 * 1024 ** 3
+
+
+def link_or_copy(source: Path, dest: Path, link: bool = False):
+    """
+    1b. puts source at dest, as a hard link when asked and possible
+    goes through a temp name so dest is never half written
+    """
+    tmp = dest.with_name(f".{dest.name}.tmp-{os.getpid()}-{threading.get_ident()}")
+    try:
+        if link:
+            try:
+                os.link(source, tmp)
+            except OSError:
+                shutil.copyfile(source, tmp)
+        else:
+            shutil.copyfile(source, tmp)
+        os.replace(tmp, dest)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+class ConversionCache:
+    """
+    2a. artifacts stored as objects/<ab>/<key><ext>
+    an entry's mtime is its last use, eviction drops the oldest first
+    """
+    
+    def __init__(
+        self,
+        root: Optional[Path] = None,
+        max_bytes: int = DEFAULT_CACHE_BYTES,
+        link: bool = False
+    ):
+        self.root = Path(root) if root else user_cache_dir() / "conversions"
+        self.objects = self.root / "objects"
+        self.max_bytes = max_bytes
+        self.link = link
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: Dict[Path, Tuple[int, float]] = {}
+        self._total = 0
+        self.objects.mkdir(parents=True, exist_ok=True)
+        self._load()
+        self.evict()
+    
+    def _load(self):
+        """
+        2b. one scandir pass to learn sizes and last-use times
+        """
+        for shard in os.scandir(self.objects):
+            if not shard.is_dir(follow_symlinks=False):
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.startswith(".") or not entry.is_file(follow_symlinks=False):
+                    continue
+                st = entry.stat(follow_symlinks=False)
+                self._entries[Path(entry.path)] = (st.st_size, st.st_mtime)
+                self._total += st.st_size
+    
+    @staticmethod
+    def key_for(source_digest: str, output_format: str, options: Sequence[str] = ()) -> str:
+        """
+        2c. same content + target + calibre options -> same artifact
+        """
+        material = json.dumps([source_digest, output_format.upper(), list(options)])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+    
+    def _object_path(self, key: str, ext: str) -> Path:
+        return self.objects / key[:2] / f"{key}{ext}"
+    
+    def fetch(self, key: str, ext: str, dest: Path) -> bool:
+        """
+        2d. copies (or links) a cached artifact to dest, true on a hit
+        """
+        path = self._object_path(key, ext)
+        try:
+            os.utime(path)
+            st = path.stat()
+            link_or_copy(path, dest, self.link)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+                entry = self._entries.pop(path, None)
+                if entry:
+                    self._total -= entry[0]
+            return False
+        with self._lock:
+            self.hits += 1
+            old = self._entries.get(path)
+            if old:
+                self._total -= old[0]
+            self._entries[path] = (st.st_size, st.st_mtime)
+            self._total += st.st_size
+        return True
+    
+    def store(self, key: str, ext: str, produced: Path):
+        """
+        2e. copies a fresh conversion into the cache, then trims it
+        always a copy, so later writes to the output can't touch the cache
+        """
+        path = self._object_path(key, ext)
+        path.parent.mkdir(exist_ok=True)
+        link_or_copy(produced, path, link=False)
+        st = path.stat()
+        with self._lock:
+            old = self._entries.get(path)
+            if old:
+                self._total -= old[0]
+            self._entries[path] = (st.st_size, st.st_mtime)
+            self._total += st.st_size
+        self.evict()
+    
+    def evict(self):
+        """
+        2f. drops least recently used entries until under max_bytes
+        """
+        with self._lock:
+            if self._total <= self.max_bytes:
+                return
+            by_age = sorted(self._entries.items(), key=lambda item: item[1][1])
+            victims = []
+            for path, (size, _) in by_age:
+                if self._total <= self.max_bytes:
+                    break
+                victims.append(path)
+                del self._entries[path]
+                self._total -= size
+        for path in victims:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+    
+    @property
+    def total_bytes(self) -> int:
+        return self._total
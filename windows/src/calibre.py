@@ -0,0 +1,172 @@
+"""
+EBook Converter Pro - Calibre discovery
+Finds ebook-convert once, remembers where and which version it is, and
+later only re-checks the binary with a stat instead of running it
+"""
+
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from formats import EBOOK_FORMATS
+from paths import user_config_dir
+
+
+# 1a. formats calibre reads but has no output plugin for
+NO_OUTPUT_PLUGIN = {"HTML", "CBZ", "CBR", "CBC", "ODT"}
+
+# 1b. formats that need a minimum calibre version, as (input, output)
+MIN_VERSIONS = {
+    "DOCX": ((1, 0, 0), (2, 0, 0)),
+    "AZW3": ((0, 8, 50), (0, 8, 50)),
+    "HTMLZ": ((0, 8, 0), (0, 8, 0)),
+    "TXTZ": ((0, 8, 0), (0, 8, 0)),
+}
+
+VERSION_RE = re.compile(r"calibre\s+(\d+)\.(\d+)(?:\.(\d+))?")
+
+
+@dataclass
+class CalibreInfo:
+    """
+    2a. a resolved ebook-convert binary
+    mtime_ns and size let a stat tell whether it was upgraded or replaced
+    """
+    path: str
+    version: Tuple[int, int, int]
+    mtime_ns: int
+    size: int
+    
+    @property
+    def version_string(self) -> str:
+        return ".".join(str(v) for v in self.version)
+    
+    def supports_input(self, fmt: str) -> bool:
+        minimum = MIN_VERSIONS.get(fmt, ((0, 0, 0), (0, 0, 0)))[0]
+        return fmt in EBOOK_FORMATS and self.version >= minimum
+    
+    def supports_output(self, fmt: str) -> bool:
+        if fmt in NO_OUTPUT_PLUGIN:
+            return False
+        minimum = MIN_VERSIONS.get(fmt, ((0, 0, 0), (0, 0, 0)))[1]
+        return fmt in EBOOK_FORMATS and self.version >= minimum
+    
+    @property
+    def input_formats(self) -> List[str]:
+        return [fmt for fmt in EBOOK_FORMATS if self.supports_input(fmt)]
+    
+    @property
+    def output_formats(self) -> List[str]:
+        return [fmt for fmt in EBOOK_FORMATS if self.supports_output(fmt)]
+
+
+def candidate_paths() -> List[str]:
+    """
+    3a. usual install locations for each OS, PATH comes first
+    """
+    found = shutil.which("ebook-convert")
+    paths = [found] if found else []
+    if sys.platform == "win32":
+        paths += [
+            r"C:\Program Files\Calibre2\ebook-convert.exe",
+            r"C:\Program Files (x86)\Calibre2\ebook-convert.exe",
+            os.path.expanduser(r"~\AppData\Local\Calibre2\ebook-convert.exe"),
+        ]
+    elif sys.platform == "darwin":
+        paths += [
+            "/Applications/calibre.app/Contents/MacOS/ebook-convert",
+            "/usr/local/bin/ebook-convert",
+        ]
+    else:
+        paths += [
+            "/usr/bin/ebook-convert",
+            "/usr/local/bin/ebook-convert",
+            os.path.expanduser("~/.local/bin/ebook-convert"),
+        ]
+    return paths
+
+
+def probe_version(path: str, timeout: float = 10) -> Optional[Tuple[int, int, int]]:
+    """
+    3b. runs ebook-convert --version, the one slow step of discovery
+    """
+    try:
+        result = subprocess.run([path, "--version"], capture_output=True, text=True, timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if result.returncode != 0:
+        return None
+    match = VERSION_RE.search(result.stdout or "")
+    if not match:
+        return (0, 0, 0)
+    return (int(match.group(1)), int(match.group(2)), int(match.group(3) or 0))
+
+
+class CalibreLocator:
+    """
+    4a. find() returns the cached CalibreInfo while its binary is unchanged
+    """
+    
+    def __init__(self, cache_path: Optional[Path] = None):
+        self.cache_path = Path(cache_path) if cache_path else user_config_dir() / "calibre.json"
+    
+    def _load(self) -> Optional[CalibreInfo]:
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            data["version"] = tuple(data["version"])
+            return CalibreInfo(**data)
+        except (OSError, ValueError, TypeError, KeyError):
+            return None
+    
+    def _save(self, info: CalibreInfo):
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.cache_path.with_name(self.cache_path.name + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(asdict(info), f)
+            os.replace(tmp, self.cache_path)
+        except OSError:
+            pass
+    
+    def cached(self) -> Optional[CalibreInfo]:
+        """
+        4b. the remembered binary, if a stat says it is still the same file
+        """
+        info = self._load()
+        if info is None:
+            return None
+        try:
+            st = os.stat(info.path)
+        except OSError:
+            return None
+        if st.st_mtime_ns != info.mtime_ns or st.st_size != info.size:
+            return None
+        return info
+    
+    def find(self, refresh: bool = False) -> Optional[CalibreInfo]:
+        """
+        4c. cached result, or a fresh search that probes the version once
+        """
+        if not refresh:
+            info = self.cached()
+            if info:
+                return info
+        
+        for path in candidate_paths():
+            if not os.path.isfile(path):
+                continue
+            version = probe_version(path)
+            if version is None:
+                continue
+            st = os.stat(path)
+            info = CalibreInfo(os.path.abspath(path), version, st.st_mtime_ns, st.st_size)
+            self._save(info)
+            return info
+        return None
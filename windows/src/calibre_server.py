@@ -0,0 +1,286 @@
+"""
+EBook Converter Pro - warm Calibre workers
+Keeps calibre-debug processes running with the conversion code already
+imported and feeds them jobs over a pipe, so small files don't pay for
+Calibre's startup every time
+"""
+
+import json
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from capture import OutputCapture
+from governor import ResourceLimits
+from processes import kill_tree, new_group_kwargs
+
+
+# 1a. runs inside calibre-debug, reads one JSON job per line from stdin and
+# answers with one JSON line. forks per job where it can, so a crash or a
+# leak in one conversion never reaches the warm parent
+SERVER_SCRIPT = r'''
+import json, os, sys, traceback
+from calibre.ebooks.conversion.cli import main as convert_main
+
+reply = os.fdopen(os.dup(1), "w", buffering=1)
+os.dup2(2, 1)
+
+def convert(args, log_path):
+    fd = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    os.dup2(fd, 1)
+    os.dup2(fd, 2)
+    os.close(fd)
+    try:
+        return convert_main(["ebook-convert"] + args) or 0
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else 1
+    except BaseException:
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+reply.write(json.dumps({"ready": True}) + "\n")
+for line in sys.stdin:
+    job = json.loads(line)
+    if hasattr(os, "fork"):
+        pid = os.fork()
+        if pid == 0:
+            os._exit(convert(job["args"], job["log"]))
+        _, status = os.waitpid(pid, 0)
+        code = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    else:
+        saved = os.dup(1), os.dup(2)
+        code = convert(job["args"], job["log"])
+        os.dup2(saved[0], 1)
+        os.dup2(saved[1], 2)
+        os.close(saved[0])
+        os.close(saved[1])
+    reply.write(json.dumps({"code": code}) + "\n")
+'''
+
+# 1b. without fork the jobs share one interpreter, recycle it now and then
+MAX_JOBS_IN_PROCESS = 50
+STARTUP_TIMEOUT = 60
+
+
+class ServerUnavailable(Exception):
+    """
+    2a. the warm worker could not take the job, run ebook-convert directly
+    """
+
+
+def find_calibre_debug(ebook_convert_path: str) -> Optional[str]:
+    """
+    2b. calibre-debug ships next to ebook-convert in every install
+    """
+    path = Path(ebook_convert_path)
+    candidate = path.with_name("calibre-debug" + path.suffix)
+    return str(candidate) if candidate.is_file() else None
+
+
+class CalibreServer:
+    """
+    3a. one warm calibre-debug process, handles one job at a time
+    """
+    
+    def __init__(self, calibre_debug_path: str, limits: Optional[ResourceLimits] = None):
+        self.jobs = 0
+        self.killed = False
+        cmd = [calibre_debug_path, "-c", SERVER_SCRIPT]
+        self.proc = subprocess.Popen(
+            limits.command(cmd) if limits else cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1,
+            **(limits.popen_kwargs() if limits else new_group_kwargs())
+        )
+        # 3b. wait for the imports to finish, a missing module ends up here too
+        timer = threading.Timer(STARTUP_TIMEOUT, self.kill)
+        timer.start()
+        try:
+            ready = self.proc.stdout.readline()
+        finally:
+            timer.cancel()
+        if not ready.strip():
+            self.kill()
+            raise ServerUnavailable("calibre-debug did not start")
+    
+    @property
+    def alive(self) -> bool:
+        return not self.killed and self.proc.poll() is None
+    
+    def run(self, args: Sequence[str], timeout: float, capture: OutputCapture) -> int:
+        """
+        3c. converts one file, returns the exit code like a subprocess
+        the job's log file is followed while it runs and fed into capture
+        """
+        fd, log_path = tempfile.mkstemp(prefix="ebook-convert-", suffix=".log")
+        os.close(fd)
+        timed_out = threading.Event()
+        done = threading.Event()
+        
+        def expire():
+            timed_out.set()
+            self.kill()
+        
+        def follow():
+            with open(log_path, "rb") as f:
+                while True:
+                    finished = done.is_set()
+                    for data in iter(lambda: f.read(64 * 1024), b""):
+                        capture.feed(data)
+                    if finished:
+                        break
+                    done.wait(0.1)
+            capture.finish()
+        
+        timer = threading.Timer(timeout, expire)
+        follower = threading.Thread(target=follow, daemon=True)
+        timer.start()
+        follower.start()
+        try:
+            try:
+                self.proc.stdin.write(json.dumps({"args": list(args), "log": log_path}) + "\n")
+                self.proc.stdin.flush()
+                line = self.proc.stdout.readline()
+            except (OSError, ValueError):
+                line = ""
+            finally:
+                timer.cancel()
+                done.set()
+                follower.join()
+            if timed_out.is_set():
+                raise subprocess.TimeoutExpired(args, timeout)
+            if not line:
+                raise ServerUnavailable("calibre-debug exited")
+            self.jobs += 1
+            return json.loads(line)["code"]
+        finally:
+            try:
+                os.unlink(log_path)
+            except OSError:
+                pass
+    
+    def kill(self):
+        """
+        3d. takes down the server and whatever job it forked
+        """
+        self.killed = True
+        kill_tree(self.proc)
+    
+    def close(self):
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.kill()
+
+
+class CalibreServerPool:
+    """
+    4a. up to `size` warm servers, started on first use
+    a server that dies is dropped and the job reported as unavailable, so
+    the caller can fall back to a plain ebook-convert run
+    """
+    
+    def __init__(self, calibre_debug_path: str, size: int, limits: Optional[ResourceLimits] = None):
+        self.calibre_debug_path = calibre_debug_path
+        self.size = size
+        self.limits = limits
+        self.broken = False
+        self._idle: "queue.LifoQueue[CalibreServer]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._servers: List[CalibreServer] = []
+        self._starting = 0
+        self._closed = False
+    
+    def _acquire(self) -> CalibreServer:
+        """
+        4b. an idle server, a new one while under size, else waits for one
+        """
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            with self._lock:
+                if self._closed or self.broken:
+                    raise ServerUnavailable("pool closed")
+                grow = len(self._servers) + self._starting < self.size
+                if grow:
+                    self._starting += 1
+            if grow:
+                break
+            # 4c. poll, a server that dies is never handed back
+            try:
+                return self._idle.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        try:
+            server = CalibreServer(self.calibre_debug_path, self.limits)
+        except (OSError, ServerUnavailable):
+            # 4d. calibre-debug is not usable here, stop trying for this run
+            self.broken = True
+            raise ServerUnavailable("calibre-debug could not be started")
+        finally:
+            with self._lock:
+                self._starting -= 1
+        with self._lock:
+            self._servers.append(server)
+            if self._closed:
+                server.kill()
+        return server
+    
+    def _release(self, server: CalibreServer):
+        recycle = sys.platform == "win32" and server.jobs >= MAX_JOBS_IN_PROCESS
+        if server.alive and not recycle and not self._closed:
+            self._idle.put(server)
+            return
+        if server.alive:
+            server.close()
+        else:
+            server.kill()
+            server.proc.wait()
+        with self._lock:
+            if server in self._servers:
+                self._servers.remove(server)
+    
+    def run(self, args: Sequence[str], timeout: float, capture: OutputCapture) -> int:
+        """
+        4e. same contract as running ebook-convert with these arguments
+        """
+        server = self._acquire()
+        try:
+            return server.run(args, timeout, capture)
+        finally:
+            self._release(server)
+    
+    def kill(self):
+        """
+        4f. for stop(), ends every server and the conversions they run
+        """
+        with self._lock:
+            self._closed = True
+            servers = list(self._servers)
+        for server in servers:
+            server.kill()
+    
+    def close(self):
+        with self._lock:
+            self._closed = True
+            servers = list(self._servers)
+            self._servers.clear()
+        for server in servers:
+            server.close()
@@ -0,0 +1,1445 @@
+"""
+EBook Converter Pro - conversion engine
+Everything that talks to Calibre lives here, with no GUI imports,
+so the app and the headless CLI share one implementation
+"""
+
+import functools
+import itertools
+import json
+import threading
+import subprocess
+import os
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, List, Sequence, Set, Tuple, Union
+import queue
+import shutil
+import time
+
+from cache import ConversionCache, link_or_copy
+from capture import OutputCapture
+from comics import close_page_pool
+from calibre import NO_OUTPUT_PLUGIN, CalibreInfo, CalibreLocator
+from calibre_server import CalibreServerPool, ServerUnavailable, find_calibre_debug
+from dedup import DEDUP_MODES, DuplicateGroups, find_duplicates
+from events import FileFinished, FileProgress, FileStarted, ProgressTracker, format_duration
+from formats import EXTENSION_FORMATS, extensions_for
+from hashing import file_digest
+from governor import MemoryGate, ResourceLimits, estimate_memory, killed_by_limits
+from history import DEFAULT_TIMEOUT_CEILING, DEFAULT_TIMEOUT_FLOOR, ConversionHistory
+from incremental import INCREMENTAL_MODES, ConversionManifest, is_up_to_date
+from journal import Journal, JournalState, load_journal
+from library_index import LibraryIndex
+from logs import failure_log_path
+from native import default_registry
+from processes import kill_tree, new_group_kwargs
+from registry import (
+    CALIBRE_BACKEND, BackendTimes, ConverterRegistry, NativeBackend, NativeCancelled, NativeRequest,
+    companion_folder
+)
+from scheduler import CostQueue
+from sniffing import SniffedPath, detect_format, reader_suffix, scanned_format
+
+
+# 1a. version info
+APP_NAME = "EBook Converter Pro"
+APP_VERSION = "1.0.0"
+
+# 1b. a streamed scan is ordered by cost within this many pending files,
+# reading ahead stops after REFILL_BUDGET seconds while slots sit idle
+STREAM_LOOKAHEAD = 256
+REFILL_BUDGET = 0.05
+
+# 1c. how often the duplicate search reports its hashing progress
+DEDUP_PROGRESS_INTERVAL = 0.5
+
+# 1d. with several targets the first of these among them is converted
+# first and the others are derived from it, calibre re-reads these far
+# faster than PDF or DOCX and they keep the book's structure
+INTERMEDIATE_FORMATS = ("EPUB", "AZW3")
+
+# 1e. source folders whose book names one batch keeps at hand for naming outputs
+STEM_FOLDERS = 64
+
+# 1f. outputs that may come with a "<name>_files" folder their links point
+# into, the cache and duplicate copies hold single files, so these are
+# neither cached nor copied, each source is converted itself
+COMPANION_FORMATS = {"HTML"}
+
+
+def target_formats(output_format: Union[str, Sequence[str]]) -> List[str]:
+    """
+    1g. one format or several as a list, upper case and without repeats
+    """
+    if isinstance(output_format, str):
+        output_format = [output_format]
+    return list(dict.fromkeys(f.upper() for f in output_format))
+
+
+@dataclass
+class ConversionJob:
+    """
+    1h. one source file and one of its outputs
+    a derived job reads input, its parent's output, instead of the source,
+    and is only queued once that output exists
+    """
+    idx: int
+    source: Path
+    output: Path
+    size: int
+    source_format: str
+    target_format: str
+    input: Optional[Path] = None
+    input_size: int = 0
+    cost: float = 0.0
+    derived: List["ConversionJob"] = field(default_factory=list)
+    duplicates: List[Tuple[Path, Path]] = field(default_factory=list)  # (source, output) of copies
+    backend: str = CALIBRE_BACKEND  # what made the output, set by the last attempt
+
+
+@dataclass
+class ConversionRun:
+    """
+    1i. settings shared by every job of one convert_files call
+    """
+    targets: List[str]
+    ebook_convert_path: str
+    tracker: ProgressTracker
+    total: Optional[int] = None
+    incremental: Optional[str] = None
+    manifest: Optional[ConversionManifest] = None
+    cache: Optional[ConversionCache] = None
+    convert_options: Sequence[str] = field(default_factory=tuple)
+    pool: Optional[CalibreServerPool] = None
+    timeout_floor: float = DEFAULT_TIMEOUT_FLOOR
+    timeout_ceiling: float = DEFAULT_TIMEOUT_CEILING
+    limits: Optional[ResourceLimits] = None
+    gate: Optional[MemoryGate] = None
+    alone: bool = False  # the serial retry pass, nothing else is running
+    journal: Optional[Journal] = None
+    dedup: Optional[str] = None
+    registry: Optional[ConverterRegistry] = None  # None when only calibre may convert
+    native_options: Dict[str, Any] = field(default_factory=dict)
+    backend_times: BackendTimes = field(default_factory=BackendTimes)
+
+
+def _plan_derived(jobs: List[ConversionJob], registry: Optional[ConverterRegistry] = None) -> List[ConversionJob]:
+    """
+    1j. hangs one file's jobs off an intermediate, returns the ones to queue now
+    a source that already is an intermediate format converts directly, and
+    so does a target a native backend makes straight from the source
+    """
+    if len(jobs) < 2 or jobs[0].source_format in INTERMEDIATE_FORMATS:
+        return jobs
+    by_target = {job.target_format: job for job in jobs}
+    parent = next((by_target[f] for f in INTERMEDIATE_FORMATS if f in by_target), None)
+    if parent is None:
+        return jobs
+    ready = [parent]
+    for job in jobs:
+        if job is parent:
+            continue
+        if registry and registry.lookup(job.source_format, job.target_format):
+            ready.append(job)
+        else:
+            job.source_format = parent.target_format
+            parent.derived.append(job)
+    return ready
+
+
+def _intermediate(
+    worker: "ConversionWorker", source_format: Optional[str], targets: Sequence[str], native: bool
+) -> Optional[str]:
+    """
+    1k. the target _plan_derived would derive the others from, so a target
+    nothing makes from the source itself can still come from it
+    """
+    if len(targets) < 2 or not source_format or source_format in INTERMEDIATE_FORMATS:
+        return None
+    return next((f for f in INTERMEDIATE_FORMATS if f in targets and worker.can_write(f, source_format, native)), None)
+
+
+def _book_stems(folder: str) -> Dict[str, int]:
+    """
+    1l. how many books in folder share each (lower case) name
+    """
+    stems: Dict[str, int] = {}
+    try:
+        with os.scandir(folder) as it:
+            for entry in it:
+                stem, ext = os.path.splitext(entry.name)
+                if not entry.name.startswith(".") and ext.lower() in EXTENSION_FORMATS:
+                    stems[stem.lower()] = stems.get(stem.lower(), 0) + 1
+    except OSError:
+        pass
+    return stems
+
+
+class ConversionBatch:
+    """
+    1m. the bookkeeping of one convert_files call: the cost queue, what
+    each source still owes, and the counts. the worker's thread loop and
+    the asyncio engine (async_engine.py) drive it the same way: refill(),
+    next_task() to hand out work, tally() for each result, then retries
+    """
+    
+    def __init__(
+        self,
+        worker: "ConversionWorker",
+        run: ConversionRun,
+        files: Iterable[Path],
+        output_folder: Path,
+        workers: int,
+        source_root: Optional[Path] = None,
+        index: Optional[LibraryIndex] = None,
+        duplicates: Optional[DuplicateGroups] = None,
+        resume_from: Optional[JournalState] = None
+    ):
+        self.worker = worker
+        self.run = run
+        self.output_folder = output_folder
+        self.workers = workers
+        self.source_root = source_root
+        self.index = index
+        self.duplicates = duplicates
+        self.successful = 0
+        self.failed = 0
+        self.skipped = 0
+        self.up_to_date = 0
+        self.done = 0
+        self.retries: List[ConversionJob] = []
+        self.cache_before = (run.cache.hits, run.cache.misses) if run.cache else (0, 0)
+        
+        # 1n. a resumed batch converts each journaled file to the targets it
+        # still owes, files the redone scan finds get all of them
+        self.owed: Dict[str, List[str]] = resume_from.targets if resume_from else {}
+        
+        # 1o. jobs wait in a cost queue, a list is ordered as a whole and a
+        # streamed scan within a lookahead window that is filled as it arrives
+        self.pending: CostQueue[ConversionJob] = CostQueue()
+        self.lookahead = run.total if run.total is not None else STREAM_LOOKAHEAD
+        self.source_iter = iter(files)
+        self.exhausted = False
+        self.position = 0
+        self.taken: Set[str] = set()
+        self.book_stems = functools.lru_cache(maxsize=STEM_FOLDERS)(_book_stems)
+    
+    def tally(self, job: ConversionJob, outcome: str):
+        run = self.run
+        if outcome == "retry":
+            self.retries.append(job)
+            return
+        if self.index and outcome != "cancelled":
+            self.index.record_result(job.source, outcome, job.target_format)
+        if outcome in ("success", "cached"):
+            self.successful += 1
+        elif outcome == "failed":
+            self.failed += 1
+        elif outcome == "up_to_date":
+            self.up_to_date += 1
+        self.done += 1
+        if job.derived:
+            self.release(job, outcome)
+        if run.journal:
+            for path in [job.source, *(source for source, _ in job.duplicates)]:
+                run.journal.finished(path, job.target_format, outcome)
+    
+    def release(self, parent: ConversionJob, outcome: str):
+        """
+        1p. queues the jobs derived from parent's output now that it exists,
+        or fails them with it, a stopped run leaves them to resume
+        """
+        for child in parent.derived:
+            if outcome in ("success", "cached", "up_to_date"):
+                child.input = parent.output
+                try:
+                    child.input_size = parent.output.stat().st_size
+                except OSError:
+                    child.input_size = child.size
+                if self.run.alone:
+                    self.position += 1
+                    child.idx = self.position
+                    self.retries.append(child)
+                else:
+                    self.pending.push(child, child.cost)
+            elif outcome == "failed":
+                self.worker._send_update(
+                    "log", f"  -> SKIPPED ({child.source.name}): no {parent.target_format} to make "
+                           f"{child.target_format} from"
+                )
+                self.worker._report(child, self.run, "failed", 0.0)
+                self.tally(child, "failed")
+            else:
+                self.tally(child, outcome)
+    
+    def output_for(self, source: Path, target: str) -> Path:
+        """
+        1q. where source's output in target goes, mirrored under source_root
+        a book named like another book in its folder gets its extension
+        added, so book.epub and book.pdf no longer both write book.mobi. it
+        depends on the folder, not on which files this run converts, so a
+        resumed or filtered run finds the same names
+        """
+        folder = self.output_folder
+        if self.source_root and source.parent != self.source_root:
+            try:
+                folder = self.output_folder / source.parent.relative_to(self.source_root)
+            except ValueError:
+                pass
+        output = candidate = folder / f"{source.stem}.{target.lower()}"
+        if self.book_stems(str(source.parent)).get(source.stem.lower(), 0) > 1:
+            output = candidate = output.with_name(f"{source.stem} ({source.suffix[1:].lower()}){output.suffix}")
+        # 1r. names that still clash, books from different folders in one
+        # output folder or names differing only in case, are numbered
+        n = 1
+        while str(candidate).lower() in self.taken:
+            n += 1
+            candidate = output.with_name(f"{output.stem} ({n}){output.suffix}")
+        self.taken.add(str(candidate).lower())
+        return candidate
+    
+    def refill(self, running: int):
+        """
+        1s. reads sources into the cost queue, running is how many tasks
+        are in flight
+        """
+        run = self.run
+        worker = self.worker
+        deadline = time.monotonic() + REFILL_BUDGET
+        while not self.exhausted and len(self.pending) < self.lookahead and not worker.should_stop:
+            # 1t. don't keep idle slots waiting on a slow scan
+            if run.total is None and self.pending and running < self.workers and time.monotonic() > deadline:
+                return
+            input_file = next(self.source_iter, None)
+            if input_file is None:
+                self.exhausted = True
+                if run.journal:
+                    run.journal.scan_complete()
+                return
+            
+            try:
+                size = input_file.stat().st_size
+            except OSError:
+                size = 0
+            
+            # 1u. what the file really is, whatever its extension says, a
+            # scanned file was sniffed by the scan already
+            source_format, description = scanned_format(input_file)
+            
+            # 1v. skip targets the file is already in, unless a native backend
+            # rewrites it with the given settings, and non-ebooks entirely
+            jobs = []
+            targets = self.owed.get(str(input_file), run.targets)
+            native = run.registry is not None
+            intermediate = _intermediate(worker, source_format, targets, native)
+            for n, target in enumerate(targets):
+                if source_format is None:
+                    reason = f"not an ebook, {description}" if n == 0 else None
+                elif source_format == target and not (
+                    run.native_options and run.registry and run.registry.lookup(target, target)
+                ):
+                    reason = f"already {target}"
+                elif not worker.can_write(target, source_format, native) and not (
+                    intermediate and intermediate != target and worker.can_write(target, intermediate, native)
+                ):
+                    reason = f"nothing converts {source_format} to {target}"
+                else:
+                    output_file = self.output_for(input_file, target)
+                    if os.path.abspath(output_file) != os.path.abspath(input_file):
+                        jobs.append(ConversionJob(0, input_file, output_file, size, source_format, target))
+                        continue
+                    reason = "output would replace the source"
+                if reason:
+                    worker._send_update("log", f"Skipping ({reason}): {input_file.name}")
+                self.skipped += 1
+                self.done += 1
+                self.position += 1
+                run.tracker.skipped(size)
+            if not jobs:
+                continue
+            
+            ready = _plan_derived(jobs, run.registry)
+            copies = self.duplicates.copies.get(input_file, []) if self.duplicates else []
+            separate = []
+            for job in jobs:
+                job.cost = run.tracker.submitted(input_file, size, job.source_format, job.target_format)
+                if job.target_format not in COMPANION_FORMATS:
+                    job.duplicates = [(copy, self.output_for(copy, job.target_format)) for copy in copies]
+                    continue
+                # 1w. a copy's own page derives from the same intermediate
+                parent = next((p for p in ready if job in p.derived), None)
+                for copy in copies:
+                    own = ConversionJob(0, copy, self.output_for(copy, job.target_format), size,
+                                        job.source_format, job.target_format)
+                    own.cost = run.tracker.submitted(copy, size, job.source_format, job.target_format)
+                    (parent.derived if parent else separate).append(own)
+            for job in [*ready, *separate]:
+                self.pending.push(job, job.cost)
+            if run.journal:
+                for job in jobs:
+                    for path in [input_file, *copies]:
+                        run.journal.queued(path, job.target_format)
+    
+    def next_task(self, slots: int) -> List[ConversionJob]:
+        """
+        1x. the next task from the queue, numbered in the order they start
+        """
+        task = self.pending.pop_task(slots)
+        for job in task:
+            self.position += 1
+            job.idx = self.position
+        return task
+    
+    def results(self) -> Dict[str, Any]:
+        """
+        1y. logs the summary block, returns what "complete" carries
+        """
+        run = self.run
+        send = self.worker._send_update
+        send("log", "\n" + "=" * 50)
+        send("log", "CONVERSION COMPLETE")
+        send("log", f"  Successful: {self.successful}")
+        send("log", f"  Failed: {self.failed}")
+        send("log", f"  Skipped: {self.skipped}")
+        if run.incremental:
+            send("log", f"  Up-to-date: {self.up_to_date}")
+        results = {
+            "successful": self.successful,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "up_to_date": self.up_to_date,
+        }
+        duplicates = self.duplicates
+        if duplicates:
+            results["duplicates"] = duplicates.duplicate_count
+            send(
+                "log", f"  Duplicates: {duplicates.duplicate_count} "
+                       f"({duplicates.duplicate_bytes / 1024 ** 2:.1f} MB not converted again)"
+            )
+        backends = run.backend_times.summary()
+        if any(name != CALIBRE_BACKEND for name in backends):
+            results["backends"] = backends
+            send("log", "  Backends:")
+            for line in run.backend_times.describe():
+                send("log", f"    {line}")
+        if run.cache:
+            results["cache_hits"] = run.cache.hits - self.cache_before[0]
+            results["cache_misses"] = run.cache.misses - self.cache_before[1]
+            send("log", f"  Cache hits: {results['cache_hits']}")
+            send("log", f"  Cache misses: {results['cache_misses']}")
+        send("log", "=" * 50)
+        return results
+
+
+class ConversionWorker:
+    """
+    2a. handles conversion in a background thread
+    keeps the UI responsive during heavy operations
+    """
+    
+    def __init__(
+        self,
+        callback_queue: queue.Queue,
+        max_workers: Optional[int] = None,
+        history: Optional[ConversionHistory] = None,
+        registry: Optional[ConverterRegistry] = None
+    ):
+        self.callback_queue = callback_queue
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.history = history
+        # 2b. native backends tried before calibre, register more on it
+        self.registry = registry or default_registry()
+        self.calibre: Optional[CalibreInfo] = None
+        self.is_running = False
+        self.should_stop = False
+        
+        # 2c. bookkeeping so stop() can reach queued jobs and live processes
+        self._lock = threading.Lock()
+        self._pending: Set[Future] = set()
+        self._processes: Set[subprocess.Popen] = set()
+        self._pool: Optional[CalibreServerPool] = None
+    
+    def find_ebook_convert(self, refresh: bool = False) -> Optional[str]:
+        """
+        2d. finds calibre's ebook-convert on the system
+        the answer is cached, so repeat calls cost a stat rather than a spawn
+        """
+        self.calibre = CalibreLocator().find(refresh=refresh)
+        return self.calibre.path if self.calibre else None
+    
+    def can_write(self, target: str, source_format: Optional[str] = None, native: bool = True) -> bool:
+        """
+        2e. whether calibre or a native backend can make target, from
+        source_format if given, else from anything some backend reads
+        """
+        if self.calibre.supports_output(target) if self.calibre else target not in NO_OUTPUT_PLUGIN:
+            return True
+        if not native:
+            return False
+        if source_format:
+            return self.registry.lookup(source_format, target) is not None
+        return target in self.registry.target_formats
+    
+    def scan_folder(
+        self,
+        folder: str,
+        source_formats: List[str],
+        recursive: bool = False,
+        max_depth: Optional[int] = None,
+        follow_symlinks: bool = False
+    ) -> List[Path]:
+        """
+        3a. finds ebook files in folder matching the selected formats
+        recursive scans go through iter_folder and sort by relative path
+        """
+        if not recursive:
+            max_depth = 0
+        files = self.iter_folder(folder, source_formats, max_depth, follow_symlinks)
+        root = Path(folder)
+        return sorted(files, key=lambda x: x.relative_to(root).as_posix().lower())
+    
+    def iter_folder(
+        self,
+        folder: str,
+        source_formats: List[str],
+        max_depth: Optional[int] = None,
+        follow_symlinks: bool = False,
+        should_stop: Optional[Callable[[], bool]] = None
+    ) -> Iterator[Path]:
+        """
+        3b. streams matching files from folder and its subfolders
+        built on os.scandir so file/dir checks reuse the cached dirent type,
+        max_depth 0 means folder only, None means unlimited
+        files with a matching extension are sniffed, ones that turn out not
+        to be ebooks are logged and left out, the rest are yielded as
+        SniffedPath so convert_files reuses the result
+        a directory reached twice (symlink loop, bind mount) is skipped
+        should_stop defaults to the worker's own stop flag
+        """
+        target_extensions = extensions_for(source_formats)
+        if should_stop is None:
+            should_stop = lambda: self.should_stop
+        
+        seen_dirs: Set[Tuple[int, int]] = set()
+        stack = [(os.fspath(folder), 0)]
+        while stack:
+            if should_stop():
+                return
+            path, depth = stack.pop()
+            try:
+                st = os.stat(path)
+                if (st.st_dev, st.st_ino) in seen_dirs:
+                    continue
+                seen_dirs.add((st.st_dev, st.st_ino))
+                with os.scandir(path) as it:
+                    entries = sorted(it, key=lambda e: e.name.lower())
+            except OSError:
+                continue
+            
+            subdirs = []
+            for entry in entries:
+                # 3c. hidden files include our own temp files and macOS ._ forks
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    if entry.is_file():
+                        if os.path.splitext(entry.name)[1].lower() in target_extensions:
+                            found = SniffedPath(entry.path)
+                            found.detected = detect_format(found)
+                            fmt, description = found.detected
+                            if fmt:
+                                yield found
+                            else:
+                                self._send_update("log", f"Skipping (not an ebook, {description}): {entry.name}")
+                    elif entry.is_dir(follow_symlinks=follow_symlinks):
+                        subdirs.append(entry.path)
+                except OSError:
+                    continue
+            
+            if max_depth is None or depth < max_depth:
+                # 3d. reversed so the stack pops them in name order
+                stack.extend((d, depth + 1) for d in reversed(subdirs))
+    
+    def convert_files(
+        self,
+        files: Iterable[Path],
+        output_folder: Path,
+        output_format: Union[str, Sequence[str]],
+        ebook_convert_path: str,
+        max_workers: Optional[int] = None,
+        incremental: Optional[str] = None,
+        cache: Optional[ConversionCache] = None,
+        convert_options: Sequence[str] = (),
+        source_root: Optional[Path] = None,
+        index: Optional[LibraryIndex] = None,
+        warm: bool = False,
+        timeout_floor: float = DEFAULT_TIMEOUT_FLOOR,
+        timeout_ceiling: float = DEFAULT_TIMEOUT_CEILING,
+        limits: Optional[ResourceLimits] = None,
+        scan: Optional[Dict[str, Any]] = None,
+        journal: bool = True,
+        resume_from: Optional[JournalState] = None,
+        dedup: Optional[str] = None,
+        dedup_report: Optional[Path] = None,
+        native: bool = True,
+        native_options: Optional[Dict[str, Any]] = None
+    ):
+        """
+        3e. runs the actual conversion on all files
+        up to max_workers ebook-convert processes run at once,
+        results are tallied here so counts stay correct
+        output_format may be a list, each file is then converted once to an
+        intermediate (INTERMEDIATE_FORMATS) and the other targets derive from it
+        incremental ("mtime" or "hash") skips outputs that are up to date
+        cache reuses earlier conversions of identical content
+        convert_options are extra ebook-convert arguments, e.g. --output-profile
+        source_root mirrors each file's subfolder under output_folder
+        index, if given, records each file's result in the library index
+        files may be a generator, conversion starts while scanning goes on
+        warm keeps calibre-debug workers loaded between files, if available
+        each file's timeout follows its predicted time, within timeout_floor
+        and timeout_ceiling seconds
+        limits sets priority and memory limits, ResourceLimits.default() if None,
+        files that die of them are retried one at a time at the end
+        journal keeps a resumable record in output_folder, scan describes how
+        files were found (see resume()) so an unfinished scan can be redone,
+        resume_from continues an interrupted batch's journal
+        dedup ("copy" or "link") converts identical sources once and gives the
+        copies the same outputs, it needs the whole file list up front so a
+        streamed scan is read to its end first, dedup_report saves the groups
+        native tries the registry's in-process backends before calibre, they
+        are left out when convert_options are given since they can't honour them,
+        native_options are their settings by family, e.g. {"comic": {...}}
+        (comics.ComicOptions), a family's same-format pair such as CBZ to CBZ
+        only runs when its settings are given
+        sends progress updates back to the UI, returns the results "complete" carries
+        """
+        batch = self._start_batch(
+            files,
+            output_folder,
+            output_format,
+            ebook_convert_path,
+            max_workers=max_workers,
+            incremental=incremental,
+            cache=cache,
+            convert_options=convert_options,
+            source_root=source_root,
+            index=index,
+            warm=warm,
+            timeout_floor=timeout_floor,
+            timeout_ceiling=timeout_ceiling,
+            limits=limits,
+            scan=scan,
+            journal=journal,
+            resume_from=resume_from,
+            dedup=dedup,
+            dedup_report=dedup_report,
+            native=native,
+            native_options=native_options
+        )
+        run = batch.run
+        workers = batch.workers
+        sources: Dict[Future, List[ConversionJob]] = {}
+        in_flight: Set[Future] = set()
+        
+        def collect(finished: Set[Future]):
+            for future in finished:
+                with self._lock:
+                    self._pending.discard(future)
+                jobs = sources.pop(future)
+                if future.cancelled():
+                    continue
+                for job, outcome in zip(jobs, future.result()):
+                    batch.tally(job, outcome)
+        
+        # 3f. keep only a small window of tasks queued so stop() has little to cancel
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while not self.should_stop:
+                batch.refill(len(in_flight))
+                if not batch.pending:
+                    if not in_flight:
+                        break
+                    # 3g. derived jobs are queued as their intermediates finish
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(finished)
+                    continue
+                while len(in_flight) >= workers * 2:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(finished)
+                
+                task = batch.next_task(workers)
+                future = executor.submit(self._convert_task, task, run)
+                with self._lock:
+                    self._pending.add(future)
+                in_flight.add(future)
+                sources[future] = task
+            
+            while in_flight:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(finished)
+        
+        # 3h. files killed for memory get another go, alone and with the whole budget
+        if batch.retries and not self.should_stop:
+            self._send_update("log", f"Retrying {len(batch.retries)} file(s) that ran out of memory, one at a time")
+            run.alone = True
+            # 3i. jobs derived from a retried file join the end of the line
+            while batch.retries and not self.should_stop:
+                job = batch.retries.pop(0)
+                batch.tally(job, self._convert_one(job, run))
+        
+        return self._finish_batch(batch)
+    
+    def _start_batch(
+        self,
+        files: Iterable[Path],
+        output_folder: Path,
+        output_format: Union[str, Sequence[str]],
+        ebook_convert_path: str,
+        max_workers: Optional[int] = None,
+        incremental: Optional[str] = None,
+        cache: Optional[ConversionCache] = None,
+        convert_options: Sequence[str] = (),
+        source_root: Optional[Path] = None,
+        index: Optional[LibraryIndex] = None,
+        warm: bool = False,
+        timeout_floor: float = DEFAULT_TIMEOUT_FLOOR,
+        timeout_ceiling: float = DEFAULT_TIMEOUT_CEILING,
+        limits: Optional[ResourceLimits] = None,
+        scan: Optional[Dict[str, Any]] = None,
+        journal: bool = True,
+        resume_from: Optional[JournalState] = None,
+        dedup: Optional[str] = None,
+        dedup_report: Optional[Path] = None,
+        native: bool = True,
+        native_options: Optional[Dict[str, Any]] = None
+    ) -> ConversionBatch:
+        """
+        3j. everything convert_files does before the first job: checks its
+        options, finds duplicates, opens the journal and the warm pool
+        """
+        if incremental and incremental not in INCREMENTAL_MODES:
+            raise ValueError(f"unknown incremental mode: {incremental}")
+        if dedup and dedup not in DEDUP_MODES:
+            raise ValueError(f"unknown dedup mode: {dedup}")
+        
+        self.is_running = True
+        self.should_stop = False
+        
+        workers = max(1, max_workers or self.max_workers)
+        targets = target_formats(output_format)
+        if dedup and not set(targets) - COMPANION_FORMATS:
+            self._send_update("log", "Duplicates are converted one by one to HTML, each page links to a folder of its own")
+            dedup = None
+        duplicates = self._find_duplicates(files, workers, dedup_report) if dedup else None
+        if duplicates:
+            files = duplicates.unique
+        # 3k. a streamed scan has no total until it ends, totals count outputs
+        total = None
+        if hasattr(files, "__len__"):
+            owed = resume_from.targets if resume_from else {}
+            total = sum(len(owed.get(str(path), targets)) for path in files)
+            if duplicates:
+                total += duplicates.duplicate_count * len(COMPANION_FORMATS.intersection(targets))
+        
+        if self.history is None:
+            self.history = ConversionHistory()
+        run = ConversionRun(
+            targets=targets,
+            ebook_convert_path=ebook_convert_path,
+            tracker=ProgressTracker(self.history, targets[0], workers, total),
+            total=total,
+            incremental=incremental,
+            manifest=ConversionManifest(output_folder) if incremental else None,
+            cache=cache,
+            convert_options=convert_options,
+            timeout_floor=timeout_floor,
+            timeout_ceiling=timeout_ceiling,
+            limits=limits or ResourceLimits.default(),
+            dedup=dedup,
+            registry=self.registry if native and not convert_options else None,
+            native_options=native_options or {},
+        )
+        run.gate = MemoryGate(run.limits.memory_budget)
+        if journal:
+            settings = {
+                "output_format": targets[0] if len(targets) == 1 else targets,
+                "incremental": incremental,
+                "convert_options": list(convert_options),
+                "source_root": str(source_root) if source_root else None,
+                "scan": scan,
+                "dedup": dedup,
+                "native": native,
+                "native_options": native_options,
+            }
+            try:
+                run.journal = Journal(output_folder, None if resume_from else settings)
+            except OSError as e:
+                self._send_update("log", f"Batch journal disabled, this run can't be resumed: {str(e)}")
+        calibre_debug = find_calibre_debug(ebook_convert_path) if warm else None
+        if calibre_debug:
+            run.pool = self._pool = CalibreServerPool(calibre_debug, workers, run.limits)
+        elif warm:
+            self._send_update("log", "calibre-debug not found, starting ebook-convert per file")
+        return ConversionBatch(self, run, files, output_folder, workers, source_root, index, duplicates, resume_from)
+    
+    def _finish_batch(self, batch: ConversionBatch) -> Dict[str, Any]:
+        """
+        3l. closes and saves what the batch opened, sends "complete"
+        """
+        run = batch.run
+        if run.journal:
+            run.journal.close(completed=not self.should_stop)
+        if run.pool:
+            if run.pool.broken:
+                self._send_update("log", "Warm Calibre workers failed to start, used ebook-convert per file")
+            run.pool.close()
+            self._pool = None
+        close_page_pool()
+        if run.manifest:
+            run.manifest.save()
+        if batch.index:
+            batch.index.commit()
+        try:
+            self.history.save()
+        except OSError:
+            pass
+        
+        if self.should_stop:
+            self._send_update("status", "Conversion cancelled")
+        
+        # 3m. show final results
+        self._send_update("progress", 100)
+        if not self.should_stop:
+            self._send_update("status", "Conversion complete!")
+        results = batch.results()
+        self._send_update("complete", results)
+        
+        self.is_running = False
+        return results
+    
+    def _convert_task(self, jobs: List[ConversionJob], run: ConversionRun) -> List[str]:
+        """
+        3n. runs one scheduled task, a single big file or a pack of small ones
+        """
+        return [self._convert_one(job, run) for job in jobs]
+    
+    def _convert_one(self, job: ConversionJob, run: ConversionRun) -> str:
+        """
+        3o. converts a single file on a pool thread
+        wraps the work in file_started/file_finished events and feeds
+        the progress tracker and conversion history
+        returns "success", "cached", "failed", "up_to_date" or "cancelled",
+        or "retry" for a file that should be run again on its own
+        """
+        if self.should_stop:
+            return "cancelled"
+        
+        self._job_started(job, run)
+        start = time.monotonic()
+        outcome = self._convert_job(job, run)
+        return self._job_done(job, run, outcome, time.monotonic() - start)
+    
+    def _job_started(self, job: ConversionJob, run: ConversionRun):
+        started = FileStarted(job.source, job.size, job.source_format, job.target_format)
+        run.tracker.started(started)
+        self._send_update("file_started", started)
+        if run.journal:
+            run.journal.started(job.source, job.target_format)
+    
+    def _job_done(self, job: ConversionJob, run: ConversionRun, outcome: str, duration: float) -> str:
+        """
+        3p. records a finished job, returns its outcome
+        """
+        if outcome == "retry":
+            return outcome
+        
+        # 3q. only real calibre runs teach the history anything
+        if outcome == "success":
+            size = job.input_size or job.size
+            run.backend_times.record(job.backend, duration, size)
+            if job.backend == CALIBRE_BACKEND:
+                self.history.record(job.source_format, job.target_format, size, duration)
+        if job.duplicates and outcome in ("success", "cached", "up_to_date"):
+            self._fan_out(job, run, outcome)
+        
+        self._report(job, run, outcome, duration)
+        return outcome
+    
+    def _find_duplicates(
+        self,
+        files: Iterable[Path],
+        workers: int,
+        report: Optional[Path] = None
+    ) -> DuplicateGroups:
+        """
+        3r. the dedup stage, logs the groups and saves the report if asked
+        """
+        self._send_update("status", "Looking for duplicates...")
+        
+        last_update = [0.0]
+        
+        def progress(hashed: int, to_hash: int):
+            now = time.monotonic()
+            if now - last_update[0] >= DEDUP_PROGRESS_INTERVAL or hashed == to_hash:
+                last_update[0] = now
+                self._send_update("status", f"Looking for duplicates... hashed {hashed}/{to_hash}")
+        
+        duplicates = find_duplicates(files, workers, lambda: self.should_stop, progress)
+        if duplicates.copies:
+            self._send_update(
+                "log", f"{duplicates.duplicate_count} duplicate(s) of {len(duplicates.copies)} "
+                       f"book(s) found, each book is converted once"
+            )
+            for first, copies in duplicates.copies.items():
+                self._send_update("log", f"  Same as {first.name}: {', '.join(p.name for p in copies)}")
+        if report:
+            try:
+                duplicates.write_report(report)
+            except OSError as e:
+                self._send_update("log", f"Duplicate report not written: {str(e)}")
+        return duplicates
+    
+    def _fan_out(self, job: ConversionJob, run: ConversionRun, outcome: str):
+        """
+        3s. gives every duplicate of job.source its copy (or link) of the output
+        after an up-to-date result only missing ones are made
+        """
+        for source, output in job.duplicates:
+            if outcome == "up_to_date" and output.exists():
+                continue
+            try:
+                output.parent.mkdir(parents=True, exist_ok=True)
+                link_or_copy(job.output, output, link=run.dedup == "link")
+                if run.manifest:
+                    run.manifest.record(output, source)
+            except OSError as e:
+                self._send_update("log", f"  -> ERROR ({source.name}): {str(e)}")
+                continue
+            self._send_update("log", f"  -> Duplicate: {output.name}")
+    
+    def _report(self, job: ConversionJob, run: ConversionRun, outcome: str, duration: float):
+        """
+        3t. file_finished and the updated totals
+        """
+        finished = FileFinished(
+            job.source, job.size, job.source_format, job.target_format, outcome, duration
+        )
+        run.tracker.finished(finished)
+        self._send_update("file_finished", finished)
+        
+        stats = run.tracker.snapshot()
+        self._send_update("stats", stats)
+        if run.total:
+            self._send_update("progress", stats.percent)
+    
+    def _convert_job(self, job: ConversionJob, run: ConversionRun) -> str:
+        """
+        3u. the actual work for one file: up-to-date check, cache, native backend, calibre
+        """
+        outcome, digest, cache_key = self._prepare(job, run)
+        if outcome:
+            return outcome
+        
+        timeout, memory = self._calibre_budget(job, run)
+        if memory and not run.gate.acquire(memory, lambda: self.should_stop):
+            self._send_update("log", f"  -> CANCELLED: {job.source.name}")
+            return "cancelled"
+        
+        partial = self._partial_path(job)
+        alias = None
+        capture = OutputCapture(lambda percent, stage: self._file_progress(job, run, percent, stage))
+        try:
+            try:
+                source, alias = self._calibre_input(job)
+                returncode = self._run_ebook_convert(
+                    [run.ebook_convert_path, str(source), str(partial), *run.convert_options],
+                    timeout=timeout,
+                    capture=capture,
+                    pool=None if run.alone else run.pool,
+                    limits=run.limits,
+                    alone=run.alone
+                )
+            except subprocess.TimeoutExpired:
+                self._send_update(
+                    "log",
+                    f"  -> TIMEOUT: {job.source.name} took longer than {format_duration(timeout)}"
+                    f"{self._keep_log(job, capture)}"
+                )
+                return "failed"
+            except Exception as e:
+                self._send_update("log", f"  -> ERROR ({job.source.name}): {str(e)}")
+                return "failed"
+            finally:
+                if memory:
+                    run.gate.release(memory)
+            return self._calibre_outcome(job, run, returncode, capture, partial, digest, cache_key)
+        finally:
+            capture.close()
+            self._discard(partial, alias)
+    
+    def _prepare(
+        self,
+        job: ConversionJob,
+        run: ConversionRun
+    ) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """
+        3v. the steps before calibre, returns (outcome, digest, cache_key)
+        with outcome None when calibre still has to convert the file
+        """
+        # 3w. the up-to-date check runs here so hashing is spread over the pool
+        digest = None
+        if run.incremental:
+            try:
+                if run.incremental == "hash":
+                    digest = file_digest(job.source)
+                if is_up_to_date(job.source, job.output, run.incremental, run.manifest, digest):
+                    self._send_update("log", f"Up to date: {job.output.name}")
+                    return "up_to_date", digest, None
+            except OSError as e:
+                self._send_update("log", f"  -> ERROR ({job.source.name}): {str(e)}")
+                return "failed", digest, None
+        
+        # 3x. same content, format and options converted before, reuse it
+        cache_key = None
+        if run.cache and job.target_format not in COMPANION_FORMATS:
+            try:
+                digest = digest or file_digest(job.source)
+                options = list(run.convert_options)
+                if run.native_options and run.registry:
+                    options.append(json.dumps(run.native_options, sort_keys=True))
+                cache_key = run.cache.key_for(digest, job.output.suffix[1:], options)
+                job.output.parent.mkdir(parents=True, exist_ok=True)
+                if run.cache.fetch(cache_key, job.output.suffix, job.output):
+                    if run.manifest:
+                        run.manifest.record(job.output, job.source, digest)
+                    self._send_update("log", f"Cached: {job.source.name} -> {job.output.name}")
+                    return "cached", digest, cache_key
+            except OSError as e:
+                self._send_update("log", f"  -> ERROR ({job.source.name}): {str(e)}")
+                return "failed", digest, cache_key
+        
+        counter = f"{job.idx}/{run.total}" if run.total else f"{job.idx}"
+        name = job.source.name if len(run.targets) == 1 else f"{job.source.name} -> {job.target_format}"
+        self._send_update("status", f"Converting {counter}: {name}")
+        self._send_update("log", f"Converting: {name}")
+        
+        # 3y. a native backend skips the calibre launch, calibre is the fallback
+        backend = run.registry.lookup(job.source_format, job.target_format) if run.registry else None
+        if backend:
+            outcome = self._convert_native(job, run, backend, self._partial_path(job), digest, cache_key)
+            if outcome:
+                return outcome, digest, cache_key
+        job.backend = CALIBRE_BACKEND
+        return None, digest, cache_key
+    
+    def _partial_path(self, job: ConversionJob) -> Path:
+        """
+        3z. calibre writes to a hidden name that is renamed into place when
+        done, so a half written file never looks finished. the rename also
+        never writes through a hard link into the cache
+        """
+        return job.output.with_name(f".{job.output.stem}.partial{job.output.suffix}")
+    
+    def _calibre_budget(self, job: ConversionJob, run: ConversionRun) -> Tuple[float, int]:
+        """
+        3za. (timeout, memory) for a calibre run of job
+        the timeout is sized to the file, a hung small book frees its slot
+        quickly, the memory has to fit next to the running jobs first
+        """
+        size = job.input_size or job.size
+        timeout = self.history.timeout(
+            job.source_format, job.target_format, size, run.timeout_floor, run.timeout_ceiling
+        )
+        memory = 0 if run.alone else estimate_memory(job.source_format, size)
+        return timeout, memory
+    
+    def _calibre_input(self, job: ConversionJob) -> Tuple[Path, Optional[Path]]:
+        """
+        3zb. (file to hand calibre, alias to delete afterwards)
+        a mislabelled file is handed to calibre under the extension of
+        what it really is, calibre picks its reader by extension
+        """
+        job.output.parent.mkdir(parents=True, exist_ok=True)
+        if job.input:
+            return job.input, None
+        suffix = reader_suffix(job.source, job.source_format)
+        if not suffix:
+            return job.source, None
+        alias = job.output.with_name(f".{job.output.stem}.input{suffix}")
+        link_or_copy(job.source, alias, link=True)
+        return alias, alias
+    
+    def _calibre_outcome(
+        self,
+        job: ConversionJob,
+        run: ConversionRun,
+        returncode: int,
+        capture: OutputCapture,
+        partial: Path,
+        digest: Optional[str],
+        cache_key: Optional[str]
+    ) -> str:
+        """
+        3zc. what a finished calibre run's exit code means for job
+        """
+        if self.should_stop and returncode != 0:
+            self._send_update("log", f"  -> CANCELLED: {job.source.name}")
+            return "cancelled"
+        
+        if not run.alone and killed_by_limits(returncode, capture.tail(limit=4096)):
+            self._send_update("log", f"  -> OUT OF MEMORY: {job.source.name}, will retry alone")
+            return "retry"
+        
+        if returncode == 0:
+            return self._finish(job, run, partial, digest, cache_key)
+        
+        error_msg = capture.tail() or "Unknown error"
+        self._send_update("log", f"  -> FAILED ({job.source.name}): {error_msg}{self._keep_log(job, capture)}")
+        return "failed"
+    
+    def _discard(self, *paths: Optional[Path]):
+        for leftover in paths:
+            if leftover and leftover.exists():
+                try:
+                    leftover.unlink()
+                except OSError:
+                    pass
+    
+    def _convert_native(
+        self,
+        job: ConversionJob,
+        run: ConversionRun,
+        backend: NativeBackend,
+        partial: Path,
+        digest: Optional[str],
+        cache_key: Optional[str]
+    ) -> Optional[str]:
+        """
+        3zd. runs a native backend on this thread, no memory gate or timeout
+        since it streams and never blocks on a child process
+        returns the outcome, or None to let calibre have a go
+        """
+        request = NativeRequest(
+            source=job.input or job.source,
+            dest=partial,
+            output=job.output,
+            options=run.native_options,
+            on_progress=lambda percent, stage: self._file_progress(job, run, percent, stage),
+            should_stop=lambda: self.should_stop
+        )
+        job.backend = backend.name
+        try:
+            job.output.parent.mkdir(parents=True, exist_ok=True)
+            backend.convert(request)
+            return self._finish(job, run, partial, digest, cache_key)
+        except NativeCancelled:
+            self._send_update("log", f"  -> CANCELLED: {job.source.name}")
+            return "cancelled"
+        except Exception as e:
+            self._send_update("log", f"  -> {backend.name} could not convert {job.source.name} ({str(e)}), using calibre")
+            return None
+        finally:
+            if partial.exists():
+                try:
+                    partial.unlink()
+                except OSError:
+                    pass
+            shutil.rmtree(request.files_dest, ignore_errors=True)
+    
+    def _finish(
+        self,
+        job: ConversionJob,
+        run: ConversionRun,
+        partial: Path,
+        digest: Optional[str],
+        cache_key: Optional[str]
+    ) -> str:
+        """
+        3ze. moves a finished partial into place and records it
+        a native backend's companion folder goes first, so the page is
+        never there without it
+        """
+        try:
+            files = companion_folder(partial)
+            if job.backend != CALIBRE_BACKEND and files.is_dir():
+                self._replace_folder(files, companion_folder(job.output))
+            os.replace(partial, job.output)
+        except OSError as e:
+            self._send_update("log", f"  -> FAILED ({job.source.name}): no output written ({str(e)})")
+            return "failed"
+        if run.manifest:
+            run.manifest.record(job.output, job.source, digest)
+        if cache_key:
+            try:
+                run.cache.store(cache_key, job.output.suffix, job.output)
+            except OSError as e:
+                self._send_update("log", f"  -> cache write failed: {str(e)}")
+        self._send_update("log", f"  -> Success: {job.output.name}")
+        return "success"
+    
+    def _replace_folder(self, folder: Path, dest: Path):
+        """
+        3zf. renames folder to dest, an existing dest is moved aside first
+        since a folder can't be renamed over a full one
+        """
+        old = dest.with_name(f".{dest.name}.old-{os.getpid()}-{threading.get_ident()}")
+        if dest.exists():
+            os.replace(dest, old)
+        try:
+            os.replace(folder, dest)
+        except OSError:
+            if old.exists():
+                os.replace(old, dest)
+            raise
+        shutil.rmtree(old, ignore_errors=True)
+    
+    def _file_progress(self, job: ConversionJob, run: ConversionRun, percent: int, stage: str):
+        """
+        3zg. a calibre progress line, moves the byte-weighted progress along
+        """
+        event = FileProgress(job.source, job.size, job.target_format, percent, stage)
+        run.tracker.progress(event)
+        self._send_update("file_progress", event)
+        stats = run.tracker.snapshot()
+        self._send_update("stats", stats)
+        if run.total:
+            self._send_update("progress", stats.percent)
+    
+    def _keep_log(self, job: ConversionJob, capture: OutputCapture) -> str:
+        """
+        3zh. saves a failed run's full output, returns a note for the log line
+        """
+        path = failure_log_path(job.source)
+        try:
+            capture.save(path)
+        except OSError:
+            return ""
+        return f"\n     full log: {path}"
+    
+    def _run_ebook_convert(
+        self,
+        cmd: List[str],
+        timeout: float,
+        capture: OutputCapture,
+        pool: Optional[CalibreServerPool] = None,
+        limits: Optional[ResourceLimits] = None,
+        alone: bool = False
+    ) -> int:
+        """
+        3zi. runs one ebook-convert process, registered so stop() can kill it
+        a warm pool takes the job first, a fresh process is the fallback
+        output streams into capture as it is written, returns the exit code
+        """
+        if pool and not pool.broken:
+            try:
+                return pool.run(cmd[1:], timeout, capture)
+            except ServerUnavailable:
+                if self.should_stop:
+                    return 1
+        
+        proc = subprocess.Popen(
+            limits.command(cmd, alone) if limits else cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            **(limits.popen_kwargs() if limits else new_group_kwargs())
+        )
+        with self._lock:
+            self._processes.add(proc)
+        timed_out = threading.Event()
+        
+        def expire():
+            # 3zj. the whole tree, leftover children would hold the pipe open
+            timed_out.set()
+            kill_tree(proc)
+        
+        timer = threading.Timer(timeout, expire)
+        timer.start()
+        try:
+            # 3zk. stop() may have run between Popen and registering
+            if self.should_stop:
+                kill_tree(proc)
+            with proc.stdout:
+                capture.read_stream(proc.stdout)
+            capture.finish()
+            proc.wait()
+            if timed_out.is_set():
+                raise subprocess.TimeoutExpired(cmd, timeout)
+            return proc.returncode
+        finally:
+            timer.cancel()
+            with self._lock:
+                self._processes.discard(proc)
+    
+    def _send_update(self, msg_type: str, data):
+        """
+        3zl. thread-safe way to push updates to the UI
+        """
+        self.callback_queue.put((msg_type, data))
+    
+    def resume(self, output_folder: Path, ebook_convert_path: str, **kwargs) -> bool:
+        """
+        3zm. continues the interrupted batch journaled in output_folder
+        format and calibre options come from the journal, kwargs are the other
+        convert_files options (max_workers, cache, index, warm, limits...)
+        returns False if there was nothing to resume
+        """
+        arguments = self._resume_arguments(output_folder)
+        if arguments is None:
+            return False
+        files, options = arguments
+        self.convert_files(files, output_folder, ebook_convert_path=ebook_convert_path, **options, **kwargs)
+        return True
+    
+    def _resume_arguments(self, output_folder: Path) -> Optional[Tuple[Iterable[Path], Dict[str, Any]]]:
+        """
+        3zn. (files, convert_files options) that continue the journaled batch,
+        None if there is none
+        """
+        state = load_journal(output_folder)
+        if state is None:
+            return None
+        settings = state.settings
+        files: Iterable[Path] = [path for path in state.pending if path.exists()]
+        scan = settings.get("scan")
+        if scan and not state.scan_complete:
+            # 3zo. the walk never finished, redo it and skip what the journal knows
+            walk = self.iter_folder(
+                scan["root"], scan["formats"], scan.get("max_depth"), scan.get("follow_symlinks", False),
+                should_stop=lambda: self.should_stop
+            )
+            files = itertools.chain(files, (path for path in walk if str(path) not in state.known))
+        source_root = settings.get("source_root")
+        return files, {
+            "output_format": target_formats(settings["output_format"]),
+            "incremental": settings.get("incremental"),
+            "convert_options": settings.get("convert_options", ()),
+            "source_root": Path(source_root) if source_root else None,
+            "scan": scan,
+            "resume_from": state,
+            "dedup": settings.get("dedup"),
+            "native": settings.get("native", True),
+            "native_options": settings.get("native_options"),
+        }
+    
+    def stop(self):
+        """
+        3zp. cancels queued jobs and kills the running conversions
+        """
+        self.should_stop = True
+        with self._lock:
+            pending = list(self._pending)
+            processes = list(self._processes)
+            pool = self._pool
+        for future in pending:
+            future.cancel()
+        if pool:
+            pool.kill()
+        for proc in processes:
+            kill_tree(proc)
+
+
+class FolderScan:
+    """
+    5a. runs a folder scan on its own thread
+    results stream to the UI through callback_queue and can be followed
+    by a conversion that starts before the scan is finished
+    """
+    
+    # 5b. how often the "files found" counter is refreshed
+    PROGRESS_INTERVAL = 0.1
+    
+    def __init__(self, callback_queue: queue.Queue, scan: Callable[..., Iterator[Path]], *args):
+        self.callback_queue = callback_queue
+        self.results: List[Path] = []
+        self.cancelled = threading.Event()
+        self.done = False
+        self.error: Optional[str] = None
+        self._scan = scan
+        self._args = args
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    def start(self) -> "FolderScan":
+        self._thread.start()
+        return self
+    
+    def cancel(self):
+        self.cancelled.set()
+    
+    @property
+    def count(self) -> int:
+        return len(self.results)
+    
+    def _run(self):
+        """
+        5c. scan thread, appends results and posts throttled progress
+        """
+        last_update = 0.0
+        try:
+            for path in self._scan(*self._args, should_stop=self.cancelled.is_set):
+                with self._cond:
+                    self.results.append(path)
+                    self._cond.notify_all()
+                now = time.monotonic()
+                if now - last_update >= self.PROGRESS_INTERVAL:
+                    last_update = now
+                    self.callback_queue.put(("scan_progress", len(self.results)))
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            with self._cond:
+                self.done = True
+                self._cond.notify_all()
+            self.callback_queue.put(("scan_complete", {
+                "count": len(self.results),
+                "cancelled": self.cancelled.is_set(),
+                "error": self.error,
+            }))
+    
+    def follow(self) -> Iterator[Path]:
+        """
+        5d. yields every result, waiting for new ones until the scan ends
+        safe to call from another thread, e.g. as convert_files input
+        """
+        idx = 0
+        while True:
+            with self._cond:
+                while idx >= len(self.results) and not self.done:
+                    self._cond.wait()
+                if idx >= len(self.results):
+                    return
+                batch = self.results[idx:]
+            idx += len(batch)
+            yield from batch
+
+
+class WakeupQueue(queue.Queue):
+    """
+    6a. callback queue that tells the consumer when it has work
+    wakeup() runs once on the first put after rearm(), outside the
+    queue lock, so a UI can sleep instead of polling
+    """
+    
+    def __init__(self, wakeup: Optional[Callable[[], None]] = None):
+        super().__init__()
+        self.wakeup = wakeup
+        self._armed = True
+    
+    def put(self, item, block: bool = True, timeout: Optional[float] = None):
+        super().put(item, block, timeout)
+        with self.mutex:
+            fire = self._armed and self.wakeup is not None
+            self._armed = False
+        if fire:
+            self.wakeup()
+    
+    def rearm(self) -> bool:
+        """
+        6b. call after draining, returns true if items slipped in meanwhile
+        """
+        with self.mutex:
+            self._armed = True
+            return bool(self.queue)
+
@@ -0,0 +1,122 @@
+"""
+EBook Converter Pro - duplicate detection
+Finds sources with identical content before a batch starts, so each book
+is converted once and its outputs are copied or linked to the other copies
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+from hashing import file_digest
+
+
+# 1a. "copy" gives every duplicate its own output file, "link" hard-links
+# them to the converted one where the filesystem allows
+DEDUP_MODES = ("copy", "link")
+
+
+@dataclass
+class DuplicateGroups:
+    """
+    2a. result of find_duplicates
+    unique keeps the input order with only the first of each content,
+    copies maps that first file to the later ones
+    """
+    unique: List[Path] = field(default_factory=list)
+    copies: Dict[Path, List[Path]] = field(default_factory=dict)
+    sizes: Dict[Path, int] = field(default_factory=dict)
+    
+    @property
+    def duplicate_count(self) -> int:
+        return sum(len(paths) for paths in self.copies.values())
+    
+    @property
+    def duplicate_bytes(self) -> int:
+        """
+        2b. source bytes that will not be converted again
+        """
+        return sum(self.sizes[first] * len(paths) for first, paths in self.copies.items())
+    
+    def write_report(self, path: Path):
+        """
+        2c. json list of the groups, largest waste first
+        """
+        groups = sorted(self.copies.items(), key=lambda item: -self.sizes[item[0]] * len(item[1]))
+        report = {
+            "duplicates": self.duplicate_count,
+            "duplicate_bytes": self.duplicate_bytes,
+            "groups": [
+                {"size": self.sizes[first], "converted": str(first), "copies": [str(p) for p in paths]}
+                for first, paths in groups
+            ],
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+
+
+def find_duplicates(
+    files: Iterable[Path],
+    workers: int = 4,
+    should_stop: Callable[[], bool] = lambda: False,
+    on_progress: Optional[Callable[[int, int], None]] = None
+) -> DuplicateGroups:
+    """
+    3a. groups files by size, then hashes only the ones sharing a size
+    hashing runs on a thread pool, each file streamed through a fixed
+    buffer (hashing.file_digest), so memory stays flat however big it is
+    on_progress(hashed, to_hash) follows the hashing
+    an unreadable file is treated as unique, conversion will report it
+    """
+    ordered: List[Path] = []
+    by_size: Dict[int, List[Path]] = {}
+    groups = DuplicateGroups()
+    for path in files:
+        if should_stop():
+            break
+        ordered.append(path)
+        try:
+            size = os.stat(path).st_size
+        except OSError:
+            continue
+        groups.sizes[path] = size
+        by_size.setdefault(size, []).append(path)
+    
+    # 3b. a size only one file has can't be a duplicate, empty files are
+    # left to the format check
+    candidates = [p for size, paths in by_size.items() if size and len(paths) > 1 for p in paths]
+    digests: Dict[Path, str] = {}
+    
+    def digest(path: Path) -> Optional[str]:
+        if should_stop():
+            return None
+        try:
+            return file_digest(path)
+        except OSError:
+            return None
+    
+    if candidates:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for n, (path, value) in enumerate(zip(candidates, pool.map(digest, candidates)), 1):
+                if value:
+                    digests[path] = value
+                if on_progress:
+                    on_progress(n, len(candidates))
+    
+    first_by_key: Dict[tuple, Path] = {}
+    for path in ordered:
+        value = digests.get(path)
+        if value is None:
+            groups.unique.append(path)
+            continue
+        key = (groups.sizes[path], value)
+        first = first_by_key.setdefault(key, path)
+        if first is path:
+            groups.unique.append(path)
+        else:
+            groups.copies.setdefault(first, []).append(path)
+    return groups
@@ -0,0 +1,141 @@
+"""
+EBook Converter Pro - EPUB reading
+Finds an EPUB's reading order in its container and OPF without unpacking
+it, so the native backends can stream chapters straight out of the zip
+"""
+
+import posixpath
+import xml.etree.ElementTree as ET
+import zipfile
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from urllib.parse import unquote
+
+
+# 1a. xml namespaces of the package files
+CONTAINER_NS = "{urn:oasis:names:tc:opendocument:xmlns:container}"
+OPF_NS = "{http://www.idpf.org/2007/opf}"
+DC_NS = "{http://purl.org/dc/elements/1.1/}"
+ENC_NS = "{http://www.w3.org/2001/04/xmlenc#}"
+
+# 1b. font obfuscation is the one encryption that leaves chapters readable
+FONT_OBFUSCATION = {
+    "http://www.idpf.org/2008/embedding",
+    "http://ns.adobe.com/pdf/enc#RC",
+}
+
+CHAPTER_TYPES = {"application/xhtml+xml", "text/html", "application/x-dtbook+xml"}
+
+
+@dataclass
+class EpubContents:
+    """
+    2a. what reading an EPUB needs, paths are zip member names
+    spine holds the chapters in reading order
+    """
+    title: str
+    spine: List[str] = field(default_factory=list)
+    media_types: Dict[str, str] = field(default_factory=dict)
+
+
+def _parse(archive: zipfile.ZipFile, name: str) -> ET.Element:
+    # 2b. package files are a few KB, parsed whole
+    with archive.open(name) as f:
+        return ET.parse(f).getroot()
+
+
+def _rootfile(archive: zipfile.ZipFile) -> str:
+    """
+    2c. the OPF's member name from META-INF/container.xml
+    """
+    try:
+        container = _parse(archive, "META-INF/container.xml")
+    except KeyError:
+        container = None
+    if container is not None:
+        for rootfile in container.iter(f"{CONTAINER_NS}rootfile"):
+            path = rootfile.get("full-path")
+            if path and rootfile.get("media-type", "application/oebps-package+xml").endswith("package+xml"):
+                return path
+    # 2d. a broken container still usually has exactly one .opf
+    opfs = [name for name in archive.namelist() if name.lower().endswith(".opf")]
+    if len(opfs) == 1:
+        return opfs[0]
+    raise ValueError("no OPF package file found")
+
+
+def _encrypted(archive: zipfile.ZipFile) -> List[str]:
+    """
+    2e. members that are encrypted with more than font obfuscation
+    """
+    try:
+        encryption = _parse(archive, "META-INF/encryption.xml")
+    except KeyError:
+        return []
+    locked = []
+    for data in encryption.iter(f"{ENC_NS}EncryptedData"):
+        method = data.find(f"{ENC_NS}EncryptionMethod")
+        reference = data.find(f".//{ENC_NS}CipherReference")
+        if reference is None:
+            continue
+        if method is None or method.get("Algorithm") not in FONT_OBFUSCATION:
+            locked.append(unquote(reference.get("URI", "")))
+    return locked
+
+
+def read_contents(archive: zipfile.ZipFile) -> EpubContents:
+    """
+    3a. title and spine of an open EPUB
+    raises ValueError for a book that can't be read this way: no package
+    file, an empty spine, or DRM on its chapters
+    """
+    opf_path = _rootfile(archive)
+    package = _parse(archive, opf_path)
+    base = posixpath.dirname(opf_path)
+    
+    title_element = package.find(f"{OPF_NS}metadata/{DC_NS}title")
+    title = (title_element.text or "").strip() if title_element is not None else ""
+    
+    manifest: Dict[str, str] = {}
+    media_types: Dict[str, str] = {}
+    for item in package.iter(f"{OPF_NS}item"):
+        href = item.get("href")
+        if not item.get("id") or not href:
+            continue
+        path = posixpath.normpath(posixpath.join(base, unquote(href.split("#", 1)[0])))
+        manifest[item.get("id")] = path
+        media_types[path] = item.get("media-type", "")
+    
+    names = set(archive.namelist())
+    spine = []
+    for itemref in package.iter(f"{OPF_NS}itemref"):
+        path = manifest.get(itemref.get("idref", ""))
+        if path and path in names and media_types.get(path) in CHAPTER_TYPES and path not in spine:
+            spine.append(path)
+    if not spine:
+        raise ValueError("empty spine")
+    
+    locked = set(_encrypted(archive)) & set(spine)
+    if locked:
+        raise ValueError("chapters are DRM protected")
+    return EpubContents(title, spine, media_types)
+
+
+def chapter_size(archive: zipfile.ZipFile, contents: EpubContents) -> int:
+    """
+    3b. uncompressed bytes of all chapters, what progress is measured in
+    """
+    return sum(archive.getinfo(path).file_size for path in contents.spine)
+
+
+def member_path(chapter: str, url: str) -> Optional[str]:
+    """
+    3c. zip member a relative link in chapter points to, None for links
+    that leave the book (http:, mailto:, absolute paths)
+    """
+    if not url or ":" in url.split("/", 1)[0] or url.startswith("/"):
+        return None
+    path = unquote(url.split("#", 1)[0])
+    if not path:
+        return chapter
+    return posixpath.normpath(posixpath.join(posixpath.dirname(chapter), path))
@@ -0,0 +1,236 @@
+"""
+EBook Converter Pro - progress events
+Typed payloads for the worker's callback queue, plus the tracker that
+turns per-file events into byte-weighted progress, throughput and ETA
+"""
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Deque, Dict, Optional, Tuple
+
+from history import ConversionHistory
+
+
+# 1a. throughput is averaged over this many recent seconds
+RATE_WINDOW = 30.0
+
+
+@dataclass(frozen=True)
+class FileStarted:
+    """
+    2a. sent as ("file_started", FileStarted) when a pool thread picks up a file
+    """
+    path: Path
+    size: int
+    source_format: str
+    target_format: str
+
+
+@dataclass(frozen=True)
+class FileFinished:
+    """
+    2b. sent as ("file_finished", FileFinished) with the file's outcome
+    outcome is one of "success", "cached", "failed", "up_to_date", "cancelled"
+    """
+    path: Path
+    size: int
+    source_format: str
+    target_format: str
+    outcome: str
+    duration: float
+
+
+@dataclass(frozen=True)
+class FileProgress:
+    """
+    2c. sent as ("file_progress", FileProgress) when calibre reports a new percentage
+    """
+    path: Path
+    size: int
+    target_format: str
+    percent: int
+    stage: str
+
+
+@dataclass(frozen=True)
+class ProgressStats:
+    """
+    2d. sent as ("stats", ProgressStats) after every file event
+    totals are estimates while a streamed scan is still running
+    """
+    files_done: int
+    files_total: Optional[int]
+    bytes_done: int
+    bytes_total: int
+    files_per_sec: float
+    bytes_per_sec: float
+    eta_seconds: Optional[float]
+    
+    @property
+    def percent(self) -> float:
+        if not self.bytes_total:
+            return 0.0
+        return min(100.0, 100.0 * self.bytes_done / self.bytes_total)
+    
+    def describe(self) -> str:
+        """
+        2e. one line summary for status bars and the cli
+        """
+        text = f"{self.files_per_sec:.1f} files/s, {self.bytes_per_sec / 1024 ** 2:.1f} MB/s"
+        if self.eta_seconds is not None:
+            text += f", ETA {format_duration(self.eta_seconds)}"
+        return text
+
+
+def format_duration(seconds: float) -> str:
+    """
+    2f. h:mm:ss, or m:ss under an hour
+    """
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes}:{secs:02d}"
+
+
+class ProgressTracker:
+    """
+    3a. byte-weighted progress for one convert_files run
+    files not seen yet (streamed scans) count at the average size so far,
+    the ETA uses per-format speeds from the conversion history
+    a file converted to several formats counts once per format
+    """
+    
+    def __init__(
+        self,
+        history: ConversionHistory,
+        target_format: str,
+        workers: int,
+        total_files: Optional[int] = None
+    ):
+        self.history = history
+        self.target_format = target_format
+        self.workers = max(1, workers)
+        self.total_files = total_files
+        self._lock = threading.Lock()
+        self._seen_files = 0
+        self._seen_bytes = 0
+        self._done_files = 0
+        self._done_bytes = 0
+        self._remaining_estimate = 0.0  # predicted seconds for queued files
+        self._estimated_total = 0.0     # predicted seconds for every file seen
+        # 3b. keyed by (path, target format)
+        self._estimates: Dict[Tuple[Path, str], float] = {}
+        self._running: Dict[Tuple[Path, str], Tuple[float, float]] = {}  # -> (start, estimate)
+        self._partial: Dict[Tuple[Path, str], int] = {}  # -> bytes done of a running file
+        self._percent: Dict[Tuple[Path, str], int] = {}
+        self._recent: Deque[Tuple[float, int]] = deque()
+        self._started_at = time.monotonic()
+    
+    def submitted(self, path: Path, size: int, source_format: str, target_format: Optional[str] = None) -> float:
+        """
+        3c. a file was queued for conversion, returns its predicted seconds
+        target_format defaults to the run's
+        """
+        target_format = target_format or self.target_format
+        estimate = self.history.estimate(source_format, target_format, size)
+        with self._lock:
+            self._seen_files += 1
+            self._seen_bytes += size
+            self._estimates[(path, target_format)] = estimate
+            self._remaining_estimate += estimate
+            self._estimated_total += estimate
+        return estimate
+    
+    def skipped(self, size: int):
+        """
+        3d. a file that never reaches the pool still counts as done
+        """
+        with self._lock:
+            self._seen_files += 1
+            self._seen_bytes += size
+            self._done_files += 1
+            self._done_bytes += size
+    
+    def started(self, event: FileStarted):
+        key = (event.path, event.target_format)
+        with self._lock:
+            estimate = self._estimates.pop(key, 0.0)
+            self._remaining_estimate -= estimate
+            self._running[key] = (time.monotonic(), estimate)
+    
+    def progress(self, event: FileProgress):
+        """
+        3e. a running file reported how far along it is
+        """
+        key = (event.path, event.target_format)
+        with self._lock:
+            if key in self._running:
+                self._partial[key] = event.size * event.percent // 100
+                self._percent[key] = event.percent
+    
+    def finished(self, event: FileFinished):
+        now = time.monotonic()
+        key = (event.path, event.target_format)
+        with self._lock:
+            self._partial.pop(key, None)
+            self._percent.pop(key, None)
+            if self._running.pop(key, None) is None:
+                self._remaining_estimate -= self._estimates.pop(key, 0.0)
+            self._done_files += 1
+            self._done_bytes += event.size
+            self._recent.append((now, event.size))
+    
+    def _left(self, key: Tuple[Path, str], elapsed: float, estimate: float) -> float:
+        """
+        3f. seconds a running file still needs, from its own percentage once
+        it has reported enough of it, from the history estimate before that
+        """
+        percent = self._percent.get(key, 0)
+        if percent >= 10:
+            return elapsed * (100 - percent) / percent
+        return max(0.0, estimate - elapsed)
+    
+    def snapshot(self) -> ProgressStats:
+        """
+        3g. current totals, rates and ETA
+        """
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and now - self._recent[0][0] > RATE_WINDOW:
+                self._recent.popleft()
+            
+            bytes_total = self._seen_bytes
+            unseen = 0
+            if self.total_files is not None:
+                unseen = max(0, self.total_files - self._seen_files)
+                if self._seen_files:
+                    bytes_total += unseen * self._seen_bytes // self._seen_files
+            
+            # 3h. rolling rates over RATE_WINDOW, or since the run started
+            span = max(min(RATE_WINDOW, now - self._started_at), 0.5)
+            files_per_sec = len(self._recent) / span
+            bytes_per_sec = sum(size for _, size in self._recent) / span
+            
+            eta = None
+            if self.total_files is not None:
+                work = self._remaining_estimate
+                for key, (start, est) in self._running.items():
+                    work += self._left(key, now - start, est)
+                if self._seen_files and unseen:
+                    work += unseen * self._estimated_total / self._seen_files
+                eta = work / self.workers
+            
+            return ProgressStats(
+                files_done=self._done_files,
+                files_total=self.total_files,
+                bytes_done=self._done_bytes + sum(self._partial.values()),
+                bytes_total=bytes_total,
+                files_per_sec=files_per_sec,
+                bytes_per_sec=bytes_per_sec,
+                eta_seconds=eta,
+            )
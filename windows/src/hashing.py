@@ -0,0 +1,27 @@
+"""
+EBook Converter Pro - content hashing
+Streamed file digests shared by the incremental check and the cache
+"""
+
+import hashlib
+from pathlib import Path
+
+
+# 1a. read size per chunk, big enough to keep syscalls cheap
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(path: Path, algorithm: str = "sha256", chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    """
+    1b. hex digest of a file, read in fixed size chunks so memory stays flat
+    """
+    digest = hashlib.new(algorithm)
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            digest.update(view[:n])
+    return digest.hexdigest()
@@ -0,0 +1,117 @@
+"""
+EBook Converter Pro - incremental conversion
+Decides whether an existing output is still up to date with its source
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from hashing import file_digest
+
+
+# 1a. supported modes, "mtime" compares timestamps and sizes, "hash" compares content
+INCREMENTAL_MODES = ("mtime", "hash")
+
+# 1b. lives in the output folder next to the converted files
+MANIFEST_NAME = ".ebook-converter-manifest.json"
+
+
+class ConversionManifest:
+    """
+    2a. remembers which source produced each output
+    keyed by output file name, saved as json in the output folder
+    """
+    
+    def __init__(self, output_folder: Path):
+        self.path = output_folder / MANIFEST_NAME
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = {}
+        self._dirty = False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                self._entries = data.get("outputs", {})
+        except (OSError, ValueError):
+            pass
+    
+    def _key(self, output_file: Path) -> str:
+        """
+        2b. outputs are stored relative to the manifest's folder
+        """
+        try:
+            return output_file.relative_to(self.path.parent).as_posix()
+        except ValueError:
+            return str(output_file)
+    
+    def get(self, output_file: Path) -> Optional[dict]:
+        with self._lock:
+            return self._entries.get(self._key(output_file))
+    
+    def record(self, output_file: Path, source: Path, digest: Optional[str] = None):
+        """
+        2c. stores the source state an output was built from
+        """
+        st = source.stat()
+        entry = {"source": str(source), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        if digest:
+            entry["sha256"] = digest
+        with self._lock:
+            self._entries[self._key(output_file)] = entry
+            self._dirty = True
+    
+    def save(self):
+        """
+        2d. writes the manifest atomically, only if something changed
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"version": 1, "outputs": dict(self._entries)}
+            self._dirty = False
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+
+def is_up_to_date(
+    source: Path,
+    output: Path,
+    mode: str,
+    manifest: Optional[ConversionManifest] = None,
+    digest: Optional[str] = None
+) -> bool:
+    """
+    3a. true when output exists and still matches source
+    "mtime": output is non-empty and not older than the source, and the
+             source size/mtime match what the manifest recorded (if any)
+    "hash":  the manifest recorded the same source sha256 for this output
+    """
+    try:
+        out_st = output.stat()
+        src_st = source.stat()
+    except OSError:
+        return False
+    if out_st.st_size == 0:
+        return False
+    
+    entry = manifest.get(output) if manifest else None
+    # 3b. an output recorded for another source is not this one's
+    if entry and entry.get("source", str(source)) != str(source):
+        return False
+    
+    if mode == "hash":
+        if not entry or "sha256" not in entry:
+            return False
+        return entry["sha256"] == (digest or file_digest(source))
+    
+    if out_st.st_mtime_ns < src_st.st_mtime_ns:
+        return False
+    # 3c. catches a source replaced by a different file with an older timestamp
+    if entry and (entry.get("size") != src_st.st_size or entry.get("mtime_ns") != src_st.st_mtime_ns):
+        return False
+    return True
@@ -0,0 +1,161 @@
+"""
+EBook Converter Pro - batch journal
+An append-only log of every job's state, kept in the output folder while
+a batch runs, so an interrupted batch can be resumed instead of started
+over. A job is one source and one target format, a multi-target batch
+resumes only the targets each file still owes. Records are fsynced in
+batches, a crash loses at most the last few and those jobs are simply
+converted again
+"""
+
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, TextIO, Tuple
+
+
+# 1a. journal file name, hidden so folder scans skip it
+JOURNAL_NAME = ".ebook-converter-journal.jsonl"
+JOURNAL_VERSION = 1
+
+# 1b. fsync after this many records or this many seconds, whichever first
+FSYNC_EVERY = 64
+FSYNC_INTERVAL = 1.0
+
+# 1c. outcomes that mean the job still has to be converted
+UNFINISHED_OUTCOMES = {"cancelled", "retry"}
+
+
+@dataclass
+class JournalState:
+    """
+    2a. what an interrupted batch left behind
+    settings are the ones the batch was started with, pending holds the
+    files with queued or in-flight jobs in the order they were queued and
+    targets the formats each of them still owes
+    """
+    settings: Dict[str, Any]
+    pending: List[Path] = field(default_factory=list)
+    targets: Dict[str, List[str]] = field(default_factory=dict)
+    known: Set[str] = field(default_factory=set)
+    scan_complete: bool = False
+
+
+def load_journal(output_folder: Path) -> Optional[JournalState]:
+    """
+    2b. replays the journal, None when there is nothing to resume
+    a torn last line from a crash is ignored
+    """
+    path = Path(output_folder) / JOURNAL_NAME
+    try:
+        f = open(path, "r", encoding="utf-8")
+    except OSError:
+        return None
+    state: Optional[JournalState] = None
+    open_jobs: Dict[Tuple[str, Optional[str]], None] = {}  # insertion ordered set
+    with f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            event = record.get("e")
+            if event == "run":
+                if state is None and record.get("v") == JOURNAL_VERSION:
+                    state = JournalState(settings=record.get("settings", {}))
+            elif state is None:
+                continue
+            elif event == "queued":
+                state.known.add(record["src"])
+                open_jobs[record["src"], record.get("to")] = None
+            elif event == "done":
+                job = (record["src"], record.get("to"))
+                if record.get("outcome") in UNFINISHED_OUTCOMES:
+                    open_jobs[job] = None
+                else:
+                    open_jobs.pop(job, None)
+            elif event == "scanned":
+                state.scan_complete = True
+    if state is None:
+        return None
+    targets: Dict[str, List[str]] = {}
+    for src, target in open_jobs:
+        targets.setdefault(src, []).append(target)
+    state.pending = [Path(src) for src in targets]
+    # 2c. records without a target (older journals) owe every target
+    state.targets = {src: owed for src, owed in targets.items() if None not in owed}
+    return state
+
+
+class Journal:
+    """
+    3a. writer side, shared by the coordinator and the pool threads
+    """
+    
+    def __init__(self, output_folder: Path, settings: Optional[Dict[str, Any]] = None):
+        """
+        3b. settings starts a new journal, without them an existing one is
+        continued (resume)
+        """
+        self.path = Path(output_folder) / JOURNAL_NAME
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file: Optional[TextIO] = open(self.path, "w" if settings is not None else "a", encoding="utf-8")
+        if settings is not None:
+            self._append({"e": "run", "v": JOURNAL_VERSION, "settings": settings}, sync=True)
+        else:
+            self._append({"e": "resumed", "t": time.time()}, sync=True)
+    
+    def _append(self, record: Dict[str, Any], sync: bool = False):
+        with self._lock:
+            if not self._file:
+                return
+            try:
+                self._file.write(json.dumps(record) + "\n")
+                self._unsynced += 1
+                now = time.monotonic()
+                if sync or self._unsynced >= FSYNC_EVERY or now - self._last_sync >= FSYNC_INTERVAL:
+                    self._sync(now)
+            except OSError:
+                # 3c. a full disk ends journaling, not the batch
+                self._file.close()
+                self._file = None
+    
+    def _sync(self, now: float):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = now
+    
+    def queued(self, source: Path, target: str):
+        self._append({"e": "queued", "src": str(source), "to": target})
+    
+    def started(self, source: Path, target: str):
+        self._append({"e": "started", "src": str(source), "to": target})
+    
+    def finished(self, source: Path, target: str, outcome: str):
+        self._append({"e": "done", "src": str(source), "to": target, "outcome": outcome})
+    
+    def scan_complete(self):
+        self._append({"e": "scanned"}, sync=True)
+    
+    def close(self, completed: bool):
+        """
+        3d. a completed batch needs no journal, an interrupted one keeps it
+        """
+        with self._lock:
+            if not self._file:
+                return
+            self._sync(time.monotonic())
+            self._file.close()
+            self._file = None
+        if completed:
+            try:
+                self.path.unlink()
+            except OSError:
+                pass
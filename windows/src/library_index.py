@@ -0,0 +1,316 @@
+"""
+EBook Converter Pro - library index
+SQLite record of every ebook seen under the scanned folders, so filter
+changes are queries and rescans only re-list folders that changed
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from formats import EBOOK_FORMATS, EXTENSION_FORMATS
+from paths import user_config_dir
+from sniffing import SniffedPath, detect_format
+
+
+# 1a. schema, bump SCHEMA_VERSION to rebuild old databases
+SCHEMA_VERSION = 2
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dirs_parent ON dirs(parent);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    format TEXT NOT NULL,
+    last_result TEXT,
+    last_target TEXT,
+    last_converted REAL
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files(dir);
+"""
+
+
+class LibraryIndex:
+    """
+    2a. one database for all libraries, paths are stored absolute
+    a folder whose mtime matches the stored one is not listed again,
+    its files and subfolders come from the database instead
+    a file's format is what detect_format found in it, not its extension
+    """
+    
+    def __init__(self, db_path: Optional[Path] = None):
+        self.db_path = Path(db_path) if db_path else user_config_dir() / "library.sqlite3"
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self._conn.executescript("DROP TABLE IF EXISTS dirs; DROP TABLE IF EXISTS files;")
+            self._conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+    
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+    
+    def scan(
+        self,
+        root: str,
+        source_formats: List[str],
+        max_depth: Optional[int] = None,
+        follow_symlinks: bool = False,
+        should_stop=lambda: False
+    ) -> Iterator[Path]:
+        """
+        3a. walks root like ConversionWorker.iter_folder, refreshing the index
+        yields files detected as one of source_formats in the same order, as
+        SniffedPath so convert_files doesn't sniff them again
+        """
+        formats = set(source_formats)
+        seen_dirs: Set[Tuple[int, int]] = set()
+        stack = [(os.path.abspath(root), None, 0)]
+        try:
+            while stack:
+                if should_stop():
+                    return
+                path, parent, depth = stack.pop()
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    self._forget_dir(path)
+                    continue
+                if (st.st_dev, st.st_ino) in seen_dirs:
+                    continue
+                seen_dirs.add((st.st_dev, st.st_ino))
+                
+                files, subdirs = self._list_dir(path, parent, st.st_mtime_ns, follow_symlinks)
+                for file_path, fmt in files:
+                    if fmt in formats:
+                        found = SniffedPath(file_path)
+                        found.detected = (fmt, "")
+                        yield found
+                
+                if max_depth is None or depth < max_depth:
+                    stack.extend((d, path, depth + 1) for d in reversed(subdirs))
+        finally:
+            with self._lock:
+                self._conn.commit()
+    
+    def refresh(
+        self,
+        root: str,
+        max_depth: Optional[int] = None,
+        follow_symlinks: bool = False
+    ) -> int:
+        """
+        3b. brings the index for root up to date, returns the ebook count
+        """
+        return sum(1 for _ in self.scan(root, list(EBOOK_FORMATS), max_depth, follow_symlinks))
+    
+    def _list_dir(
+        self,
+        path: str,
+        parent: Optional[str],
+        mtime_ns: int,
+        follow_symlinks: bool
+    ) -> Tuple[List[Tuple[str, str]], List[str]]:
+        """
+        3c. files and subfolders of one folder, from the index when unchanged
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT mtime_ns FROM dirs WHERE path = ?", (path,)).fetchone()
+            if row and row[0] == mtime_ns:
+                known = self._conn.execute(
+                    "SELECT path, size, mtime_ns, format FROM files WHERE dir = ?", (path,)
+                ).fetchall()
+                subdirs = [r[0] for r in self._conn.execute(
+                    "SELECT path FROM dirs WHERE parent = ?", (path,)
+                )]
+            else:
+                known = None
+        if known is not None:
+            return (
+                sorted(self._restat(known), key=lambda f: os.path.basename(f[0]).lower()),
+                sorted(subdirs, key=lambda d: os.path.basename(d).lower()),
+            )
+        
+        # 3d. folder changed (or is new), list it and rewrite its rows
+        # files are sniffed here, so unchanged folders never pay for it
+        files: List[Tuple[str, str]] = []
+        rows = []
+        subdirs: List[str] = []
+        try:
+            with os.scandir(path) as it:
+                entries = sorted(it, key=lambda e: e.name.lower())
+        except OSError:
+            entries = []
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            try:
+                if entry.is_file():
+                    fmt = EXTENSION_FORMATS.get(os.path.splitext(entry.name)[1].lower())
+                    if fmt:
+                        fmt = detect_format(Path(entry.path))[0]
+                    if fmt:
+                        est = entry.stat()
+                        files.append((entry.path, fmt))
+                        rows.append((entry.path, path, est.st_size, est.st_mtime_ns, fmt))
+                elif entry.is_dir(follow_symlinks=follow_symlinks):
+                    subdirs.append(entry.path)
+            except OSError:
+                continue
+        
+        with self._lock:
+            known = {r[0] for r in self._conn.execute("SELECT path FROM dirs WHERE parent = ?", (path,))}
+            for gone in known - set(subdirs):
+                self._forget_dir_locked(gone)
+            present = {r[0] for r in rows}
+            stale = [
+                (r[0],) for r in self._conn.execute("SELECT path FROM files WHERE dir = ?", (path,))
+                if r[0] not in present
+            ]
+            self._conn.executemany("DELETE FROM files WHERE path = ?", stale)
+            # 3e. keeps last_result for files that are still there
+            self._conn.executemany(
+                "INSERT INTO files (path, dir, size, mtime_ns, format) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET size = excluded.size, "
+                "mtime_ns = excluded.mtime_ns, format = excluded.format",
+                rows,
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO dirs (path, parent, mtime_ns) VALUES (?, ?, -1)",
+                [(d, path) for d in subdirs],
+            )
+            self._conn.execute(
+                "INSERT INTO dirs (path, parent, mtime_ns) VALUES (?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET parent = excluded.parent, mtime_ns = excluded.mtime_ns",
+                (path, parent, mtime_ns),
+            )
+        return files, subdirs
+    
+    def _restat(self, known: List[Tuple[str, int, int, str]]) -> List[Tuple[str, str]]:
+        """
+        3f. the indexed files of an unchanged folder, each checked by its own
+        stat: a file rewritten in place leaves the folder's mtime alone,
+        one whose size or mtime changed is sniffed again
+        """
+        files: List[Tuple[str, str]] = []
+        changed = []
+        gone = []
+        for file_path, size, mtime_ns, fmt in known:
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                gone.append((file_path,))
+                continue
+            if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+                fmt = detect_format(Path(file_path))[0]
+                if not fmt:
+                    gone.append((file_path,))
+                    continue
+                changed.append((st.st_size, st.st_mtime_ns, fmt, file_path))
+            files.append((file_path, fmt))
+        if changed or gone:
+            with self._lock:
+                self._conn.executemany("UPDATE files SET size = ?, mtime_ns = ?, format = ? WHERE path = ?", changed)
+                self._conn.executemany("DELETE FROM files WHERE path = ?", gone)
+        return files
+    
+    def _forget_dir(self, path: str):
+        with self._lock:
+            self._forget_dir_locked(path)
+    
+    def _forget_dir_locked(self, path: str):
+        """
+        3g. drops a folder and everything below it
+        """
+        prefix = _like_prefix(path)
+        self._conn.execute("DELETE FROM files WHERE dir = ? OR dir LIKE ? ESCAPE '\\'", (path, prefix))
+        self._conn.execute("DELETE FROM dirs WHERE path = ? OR path LIKE ? ESCAPE '\\'", (path, prefix))
+    
+    def query(
+        self,
+        root: str,
+        source_formats: List[str],
+        recursive: bool = False
+    ) -> List[Path]:
+        """
+        4a. indexed files under root, no filesystem access
+        sorted the same way as ConversionWorker.scan_folder
+        """
+        root = os.path.abspath(root)
+        marks = ",".join("?" * len(source_formats))
+        if not marks:
+            return []
+        sql = f"SELECT path FROM files WHERE format IN ({marks}) AND (dir = ?"
+        params: list = list(source_formats) + [root]
+        if recursive:
+            sql += " OR dir LIKE ? ESCAPE '\\'"
+            params.append(_like_prefix(root))
+        sql += ")"
+        with self._lock:
+            paths = [r[0] for r in self._conn.execute(sql, params)]
+        return sorted(
+            (Path(p) for p in paths),
+            key=lambda x: os.path.relpath(x, root).replace(os.sep, "/").lower()
+        )
+    
+    def is_indexed(self, root: str) -> bool:
+        """
+        4b. true once root has been scanned at least once
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT mtime_ns FROM dirs WHERE path = ?", (os.path.abspath(root),)
+            ).fetchone()
+        return bool(row) and row[0] != -1
+    
+    def record_result(self, source: Path, result: str, target_format: str):
+        """
+        4c. remembers how the last conversion of a file went
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE files SET last_result = ?, last_target = ?, last_converted = ? WHERE path = ?",
+                (result, target_format, time.time(), os.path.abspath(source)),
+            )
+    
+    def last_results(self, root: str) -> Dict[str, int]:
+        """
+        4d. counts of last conversion results under root
+        """
+        root = os.path.abspath(root)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT COALESCE(last_result, 'never'), COUNT(*) FROM files "
+                "WHERE dir = ? OR dir LIKE ? ESCAPE '\\' GROUP BY 1",
+                (root, _like_prefix(root)),
+            ).fetchall()
+        return dict(rows)
+    
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+
+def _like_prefix(path: str) -> str:
+    """
+    5a. LIKE pattern matching everything below path
+    """
+    escaped = path.rstrip(os.sep).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    sep = "\\\\" if os.sep == "\\" else os.sep
+    return escaped + sep + "%"
@@ -0,0 +1,81 @@
+"""
+EBook Converter Pro - session logs
+The log panel only keeps recent lines, the full log goes to a file
+"""
+
+import re
+import time
+from pathlib import Path
+from typing import Iterable, Optional, TextIO
+
+from paths import user_cache_dir
+
+
+# 1a. older session logs beyond this count are deleted
+KEEP_SESSION_LOGS = 10
+
+# 1b. full output of failed conversions, oldest deleted beyond this count
+KEEP_FAILURE_LOGS = 200
+
+
+class SessionLog:
+    """
+    2a. append-only text file for one app session
+    opened on first write, so sessions that log nothing leave no file
+    """
+    
+    def __init__(self, folder: Optional[Path] = None, keep: int = KEEP_SESSION_LOGS):
+        self.folder = Path(folder) if folder else user_cache_dir() / "logs"
+        self.path = self.folder / time.strftime("session-%Y%m%d-%H%M%S.log")
+        self.keep = keep
+        self._file: Optional[TextIO] = None
+    
+    def _open(self) -> TextIO:
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self._prune()
+        self._file = open(self.path, "a", encoding="utf-8", buffering=64 * 1024)
+        return self._file
+    
+    def _prune(self):
+        """
+        2b. keeps only the newest few session logs
+        """
+        logs = sorted(self.folder.glob("session-*.log"))
+        for old in logs[:max(0, len(logs) - self.keep + 1)]:
+            try:
+                old.unlink()
+            except OSError:
+                pass
+    
+    def write(self, lines: Iterable[str]):
+        f = self._file or self._open()
+        for line in lines:
+            f.write(line)
+            f.write("\n")
+    
+    def flush(self):
+        if self._file:
+            self._file.flush()
+    
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+def failure_log_path(source: Path, folder: Optional[Path] = None, keep: int = KEEP_FAILURE_LOGS) -> Path:
+    """
+    3a. a fresh file name for a failed conversion's output, prunes old ones
+    """
+    folder = Path(folder) if folder else user_cache_dir() / "logs" / "failed"
+    try:
+        logs = sorted(folder.glob("*.log"))
+    except OSError:
+        logs = []
+    for old in logs[:max(0, len(logs) - keep + 1)]:
+        try:
+            old.unlink()
+        except OSError:
+            pass
+    stem = re.sub(r"[^\w.-]+", "_", source.stem)[:80]
+    return folder / f"{time.strftime('%Y%m%d-%H%M%S')}-{stem}.log"
@@ -0,0 +1,483 @@
+"""
+EBook Converter Pro - native converters
+Pure Python backends for pairs where starting Calibre costs far more than
+the conversion itself: TXT <-> HTML, EPUB text extraction and unpacking
+HTMLZ and TXTZ, comics are in comics.py. Files are streamed in chunks,
+never read whole
+"""
+
+import codecs
+import html
+import itertools
+import re
+import shutil
+import zipfile
+from html.parser import HTMLParser
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, Callable, Iterator, List, Optional, TextIO
+from urllib.parse import quote
+
+import comics
+from epub import chapter_size, member_path, read_contents
+from registry import ConverterRegistry, NativeRequest, NativeUnsupported
+
+
+# 1a. bytes per read, and how far progress moves between reports
+CHUNK_SIZE = 256 * 1024
+PROGRESS_STEP = 5
+
+# 1b. tried in order when a text file has no BOM, cp1252 accepts nearly anything
+TEXT_ENCODINGS = ("utf-8", "cp1252")
+
+# 1c. an html file's declared charset, looked for near the top
+CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?([\w.:-]+)""", re.IGNORECASE)
+XML_ENCODING_RE = re.compile(rb"""^\s*<\?xml[^>]+encoding\s*=\s*["']([\w.:-]+)""")
+
+# 1d. references to rewrite when an HTMLZ's resources move into a folder
+REFERENCE_RE = re.compile(r"""(\b(?:src|href)\s*=\s*)(["'])([^"']+)\2""", re.IGNORECASE)
+
+BLOCK_TAGS = {
+    "p", "div", "hr", "h1", "h2", "h3", "h4", "h5", "h6", "li", "tr", "blockquote",
+    "pre", "section", "article", "header", "footer", "table", "ul", "ol", "dl", "dt", "dd",
+}
+SKIPPED_TAGS = {"script", "style", "head", "title"}
+SCRIPT_TAGS = {"script", "style"}
+
+# 1e. attributes holding links an EPUB's chapters need rewritten in one page
+LINK_ATTRS = {"href", "src", "xlink:href", "poster"}
+
+
+class _Progress:
+    """
+    2a. turns bytes done into on_progress calls every PROGRESS_STEP percent
+    """
+    
+    def __init__(self, request: NativeRequest, total: int, stage: str):
+        self.request = request
+        self.total = max(1, total)
+        self.stage = stage
+        self.reported = -PROGRESS_STEP
+    
+    def update(self, done: int):
+        self.request.check_stop()
+        percent = min(100, done * 100 // self.total)
+        if percent >= self.reported + PROGRESS_STEP:
+            self.reported = percent
+            self.request.on_progress(percent, self.stage)
+
+
+def _chunks(f: BinaryIO, progress: _Progress, done: int = 0) -> Iterator[bytes]:
+    for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+        done += len(chunk)
+        yield chunk
+        progress.update(done)
+
+
+def _decode(chunks: Iterator[bytes], encoding: str) -> Iterator[str]:
+    """
+    2b. incremental decode, a BOM picks the encoding by itself
+    """
+    decoder = None
+    for chunk in chunks:
+        if decoder is None:
+            if chunk.startswith(codecs.BOM_UTF8):
+                encoding, chunk = "utf-8", chunk[3:]
+            elif chunk.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+                encoding = "utf-16"
+            decoder = codecs.getincrementaldecoder(encoding)(errors="strict")
+        yield decoder.decode(chunk)
+    if decoder is not None:
+        yield decoder.decode(b"", final=True)
+
+
+def _with_encodings(convert, encodings):
+    """
+    2c. runs convert(encoding) until one decodes the whole file
+    """
+    for encoding in encodings:
+        try:
+            return convert(encoding)
+        except UnicodeDecodeError:
+            continue
+    raise NativeUnsupported("text encoding not recognised")
+
+
+def _lines(pieces: Iterator[str]) -> Iterator[str]:
+    """
+    2d. splits decoded pieces into lines without holding more than one
+    """
+    rest = ""
+    for piece in pieces:
+        rest += piece
+        *lines, rest = rest.split("\n")
+        yield from lines
+    if rest:
+        yield rest
+
+
+def txt_to_html(request: NativeRequest):
+    """
+    3a. paragraphs are separated by blank lines, line breaks inside them
+    are left to the browser to reflow
+    """
+    size = request.source.stat().st_size
+    
+    def convert(encoding: str):
+        progress = _Progress(request, size, "Converting text to HTML")
+        title = html.escape(request.output.stem)
+        with open(request.source, "rb") as src, open(request.dest, "w", encoding="utf-8", newline="\n") as out:
+            out.write(
+                "<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n"
+                f"<title>{title}</title>\n</head>\n<body>\n"
+            )
+            paragraph: List[str] = []
+            for line in _lines(_decode(_chunks(src, progress), encoding)):
+                line = line.rstrip("\r").strip()
+                if line:
+                    paragraph.append(html.escape(line))
+                elif paragraph:
+                    out.write("<p>" + "\n".join(paragraph) + "</p>\n")
+                    paragraph = []
+            if paragraph:
+                out.write("<p>" + "\n".join(paragraph) + "</p>\n")
+            out.write("</body>\n</html>\n")
+    
+    _with_encodings(convert, TEXT_ENCODINGS)
+
+
+class _TextExtractor(HTMLParser):
+    """
+    4a. html to plain text as it is fed, blocks become paragraphs
+    """
+    
+    def __init__(self, out: TextIO):
+        super().__init__(convert_charrefs=True)
+        self.out = out
+        self.skipping = 0
+        self.pre = 0
+        self.line: List[str] = []
+        self.blank = True  # nothing written yet, or the last thing was a break
+    
+    def _break(self, paragraph: bool = True):
+        text = " ".join("".join(self.line).split()) if not self.pre else "".join(self.line)
+        self.line = []
+        if text:
+            self.out.write(text + "\n")
+            self.blank = False
+        if paragraph and not self.blank:
+            self.out.write("\n")
+            self.blank = True
+    
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skipping += 1
+        elif tag == "br":
+            self._break(paragraph=False)
+        elif tag in BLOCK_TAGS:
+            self._break()
+            if tag == "pre":
+                self.pre += 1
+    
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self.skipping = max(0, self.skipping - 1)
+        elif tag in BLOCK_TAGS:
+            self._break()
+            if tag == "pre":
+                self.pre = max(0, self.pre - 1)
+    
+    def handle_data(self, data):
+        if not self.skipping:
+            self.line.append(data)
+    
+    def close(self):
+        super().close()
+        self._break()
+
+
+def _declared_encoding(head: bytes) -> Optional[str]:
+    """
+    4b. the charset an html or xhtml file declares in its first few KB
+    """
+    match = XML_ENCODING_RE.search(head) or CHARSET_RE.search(head)
+    if match:
+        try:
+            return codecs.lookup(match.group(1).decode("ascii")).name
+        except (LookupError, UnicodeDecodeError):
+            return None
+    return None
+
+
+def html_to_txt(request: NativeRequest):
+    size = request.source.stat().st_size
+    with open(request.source, "rb") as f:
+        declared = _declared_encoding(f.read(4096))
+    
+    def convert(encoding: str):
+        progress = _Progress(request, size, "Converting HTML to text")
+        with open(request.source, "rb") as src, open(request.dest, "w", encoding="utf-8", newline="\n") as out:
+            parser = _TextExtractor(out)
+            for piece in _decode(_chunks(src, progress), encoding):
+                parser.feed(piece)
+            parser.close()
+    
+    _with_encodings(convert, (declared,) + TEXT_ENCODINGS if declared else TEXT_ENCODINGS)
+
+
+def _member_text(archive: zipfile.ZipFile, name: str, progress: _Progress, done: int) -> Iterator[str]:
+    """
+    4c. a zip member decoded as it is read, in its declared encoding
+    """
+    with archive.open(name) as f:
+        chunks = _chunks(f, progress, done)
+        first = next(chunks, b"")
+        encoding = _declared_encoding(first[:4096]) or "utf-8"
+        yield from _decode(itertools.chain([first], chunks), encoding)
+
+
+def epub_to_txt(request: NativeRequest):
+    """
+    4d. the spine's chapters in reading order, each streamed from the zip
+    through the text extractor, nothing is unpacked to disk
+    """
+    with zipfile.ZipFile(request.source) as archive:
+        contents = read_contents(archive)
+        progress = _Progress(request, chapter_size(archive, contents), "Extracting text")
+        done = 0
+        with open(request.dest, "w", encoding="utf-8", newline="\n", buffering=CHUNK_SIZE) as out:
+            for chapter in contents.spine:
+                parser = _TextExtractor(out)
+                for piece in _member_text(archive, chapter, progress, done):
+                    parser.feed(piece)
+                parser.close()
+                done += archive.getinfo(chapter).file_size
+
+
+class _BodyWriter(HTMLParser):
+    """
+    4e. re-emits one chapter's body, ids get the chapter's prefix so they
+    stay unique in the joined page, and link() rewrites every link
+    """
+    
+    def __init__(self, out: TextIO, prefix: str, link: Callable[[str], str]):
+        super().__init__(convert_charrefs=True)
+        self.out = out
+        self.prefix = prefix
+        self.link = link
+        self.in_body = False
+        self.skipping = 0
+    
+    def _render(self, tag, attrs, end: str) -> str:
+        parts = [tag]
+        for name, value in attrs:
+            if value is None:
+                parts.append(name)
+                continue
+            if name == "id":
+                value = self.prefix + value
+            elif name in LINK_ATTRS:
+                value = self.link(value)
+            parts.append(f'{name}="{html.escape(value)}"')
+        return "<" + " ".join(parts) + end
+    
+    def _writing(self, tag) -> bool:
+        return self.in_body and not self.skipping and tag not in SCRIPT_TAGS
+    
+    def handle_starttag(self, tag, attrs):
+        if tag == "body":
+            self.in_body = True
+        elif self.in_body and tag in SCRIPT_TAGS:
+            self.skipping += 1
+        elif self._writing(tag):
+            self.out.write(self._render(tag, attrs, ">"))
+    
+    def handle_startendtag(self, tag, attrs):
+        if self._writing(tag):
+            self.out.write(self._render(tag, attrs, " />"))
+    
+    def handle_endtag(self, tag):
+        if tag == "body":
+            self.in_body = False
+        elif self.in_body and tag in SCRIPT_TAGS:
+            self.skipping = max(0, self.skipping - 1)
+        elif self._writing(tag):
+            self.out.write(f"</{tag}>")
+    
+    def handle_data(self, data):
+        if self.in_body and not self.skipping:
+            self.out.write(html.escape(data, quote=False))
+
+
+def epub_to_html(request: NativeRequest):
+    """
+    4f. one page with every chapter's body in a <div id="cN">, links between
+    chapters become anchors in the page, and images the chapters use are
+    copied to a "<name>_files" folder. the book's stylesheets are left out
+    """
+    files_dir = request.files_dest
+    with zipfile.ZipFile(request.source) as archive:
+        contents = read_contents(archive)
+        chapters = {path: n for n, path in enumerate(contents.spine, 1)}
+        names = set(archive.namelist())
+        copied = set()
+        
+        def link_for(chapter: str) -> Callable[[str], str]:
+            def link(url: str) -> str:
+                target = member_path(chapter, url)
+                if target is None:
+                    return url
+                fragment = url.split("#", 1)[1] if "#" in url else ""
+                if target in chapters:
+                    anchor = f"c{chapters[target]}"
+                    return f"#{anchor}-{fragment}" if fragment else f"#{anchor}"
+                if target not in names:
+                    return url
+                if target not in copied:
+                    dest = _safe_path(files_dir, target)
+                    if dest is None:
+                        return url
+                    dest.parent.mkdir(parents=True, exist_ok=True)
+                    with archive.open(target) as src, open(dest, "wb") as out:
+                        shutil.copyfileobj(src, out, CHUNK_SIZE)
+                    copied.add(target)
+                return quote(f"{request.files_name}/{target}")
+            return link
+        
+        progress = _Progress(request, chapter_size(archive, contents), "Extracting HTML")
+        title = html.escape(contents.title or request.output.stem)
+        done = 0
+        with open(request.dest, "w", encoding="utf-8", newline="\n", buffering=CHUNK_SIZE) as out:
+            out.write(
+                "<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n"
+                f"<title>{title}</title>\n</head>\n<body>\n"
+            )
+            for chapter, n in chapters.items():
+                out.write(f'<div id="c{n}">\n')
+                writer = _BodyWriter(out, f"c{n}-", link_for(chapter))
+                for piece in _member_text(archive, chapter, progress, done):
+                    writer.feed(piece)
+                writer.close()
+                out.write("\n</div>\n")
+                done += archive.getinfo(chapter).file_size
+            out.write("</body>\n</html>\n")
+
+
+def _member(archive: zipfile.ZipFile, preferred: str, suffixes) -> str:
+    """
+    5a. the main document of an HTMLZ/TXTZ, index.* or the first top level match
+    """
+    names = archive.namelist()
+    if preferred in names:
+        return preferred
+    for name in names:
+        if "/" not in name and name.lower().endswith(suffixes):
+            return name
+    raise NativeUnsupported(f"no {preferred} inside")
+
+
+def _safe_path(folder: Path, name: str) -> Optional[Path]:
+    """
+    5b. where an archive member may be written, None for absolute or ../ names
+    """
+    parts = PurePosixPath(name.replace("\\", "/")).parts
+    if not parts or parts[0] in ("/", "") or ".." in parts or ":" in parts[0]:
+        return None
+    return folder.joinpath(*parts)
+
+
+def _copy_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo, dest: Path, progress: _Progress, done: int) -> int:
+    with archive.open(info) as src, open(dest, "wb") as out:
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+            out.write(chunk)
+            done += len(chunk)
+            progress.update(done)
+    return done
+
+
+def _whole_tags(pieces: Iterator[str]) -> Iterator[str]:
+    """
+    5c. regroups decoded pieces so none of them ends inside a tag, the
+    links in a tag can then be rewritten piece by piece
+    """
+    rest = ""
+    for piece in pieces:
+        rest += piece
+        start = rest.rfind("<")
+        cut = len(rest) if start == -1 or ">" in rest[start:] else start
+        if cut:
+            yield rest[:cut]
+            rest = rest[cut:]
+    if rest:
+        yield rest
+
+
+def htmlz_to_html(request: NativeRequest):
+    """
+    5d. index.html becomes the output, images and css go to a "<name>_files"
+    folder next to it, like calibre lays out html, and links are rewritten
+    as the page streams through
+    """
+    with zipfile.ZipFile(request.source) as archive:
+        index = archive.getinfo(_member(archive, "index.html", (".html", ".htm", ".xhtml")))
+        resources = [
+            info for info in archive.infolist()
+            if not info.is_dir() and info.filename not in (index.filename, "metadata.opf")
+        ]
+        progress = _Progress(request, sum(info.file_size for info in archive.infolist()), "Unpacking HTMLZ")
+        
+        moved = set()
+        done = 0
+        for info in resources:
+            target = _safe_path(request.files_dest, info.filename)
+            if target is None:
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            done = _copy_member(archive, info, target, progress, done)
+            moved.add(info.filename)
+        
+        def relink(match):
+            url = match.group(3)
+            path = html.unescape(url).split("#", 1)[0]
+            if path in moved:
+                url = f"{request.files_name}/{url}"
+            return f"{match.group(1)}{match.group(2)}{url}{match.group(2)}"
+        
+        def convert(encoding: str):
+            with archive.open(index) as src, open(request.dest, "w", encoding="utf-8", newline="") as out:
+                for piece in _whole_tags(_decode(_chunks(src, progress, done), encoding)):
+                    out.write(REFERENCE_RE.sub(relink, piece) if moved else piece)
+        
+        _with_encodings(convert, ("utf-8", "cp1252"))
+    request.on_progress(100, "Unpacking HTMLZ")
+
+
+def txtz_to_txt(request: NativeRequest):
+    """
+    5e. the text of a TXTZ, its images have nowhere to go in plain text
+    """
+    with zipfile.ZipFile(request.source) as archive:
+        info = archive.getinfo(_member(archive, "index.txt", (".txt",)))
+        progress = _Progress(request, info.file_size, "Unpacking TXTZ")
+        _copy_member(archive, info, request.dest, progress, 0)
+
+
+def register(registry: ConverterRegistry):
+    """
+    6a. adds this module's backends to registry
+    """
+    registry.register("TXT", "HTML")(txt_to_html)
+    registry.register("HTML", "TXT")(html_to_txt)
+    registry.register("EPUB", "TXT")(epub_to_txt)
+    registry.register("EPUB", "HTML")(epub_to_html)
+    registry.register("HTMLZ", "HTML")(htmlz_to_html)
+    registry.register("TXTZ", "TXT")(txtz_to_txt)
+
+
+def default_registry() -> ConverterRegistry:
+    """
+    6b. a registry with every native backend that ships with the app
+    """
+    registry = ConverterRegistry()
+    register(registry)
+    comics.register(registry)
+    return registry
@@ -0,0 +1,38 @@
+"""
+EBook Converter Pro - per-user folders
+Where caches, settings and logs go on each OS
+"""
+
+import os
+import sys
+from pathlib import Path
+
+
+# 1a. folder name used under the platform's cache/config roots
+APP_DIR_NAME = "EBookConverterPro"
+
+
+def user_cache_dir() -> Path:
+    """
+    1b. disposable data, safe to delete at any time
+    """
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser(r"~\AppData\Local")
+        return Path(base) / APP_DIR_NAME / "Cache"
+    if sys.platform == "darwin":
+        return Path.home() / "Library" / "Caches" / APP_DIR_NAME
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return Path(base) / APP_DIR_NAME
+
+
+def user_config_dir() -> Path:
+    """
+    1c. small state files that should survive restarts
+    """
+    if sys.platform == "win32":
+        base = os.environ.get("APPDATA") or os.path.expanduser(r"~\AppData\Roaming")
+        return Path(base) / APP_DIR_NAME
+    if sys.platform == "darwin":
+        return Path.home() / "Library" / "Application Support" / APP_DIR_NAME
+    base = os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config")
+    return Path(base) / APP_DIR_NAME
@@ -0,0 +1,160 @@
+"""
+EBook Converter Pro - converter registry
+Which backend converts which (source, target) pair. Pairs simple enough
+to do in Python run in-process through a native backend, everything else
+goes to Calibre, which stays the fallback when a native backend fails
+"""
+
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from formats import EBOOK_FORMATS
+
+
+# 1a. name of the fallback in timings and logs
+CALIBRE_BACKEND = "calibre"
+
+
+class NativeCancelled(Exception):
+    """
+    1b. raised by a native backend that saw the run being stopped
+    """
+
+
+class NativeUnsupported(Exception):
+    """
+    1c. the backend can't handle this particular file, calibre should
+    """
+
+
+def companion_folder(output: Path) -> Path:
+    """
+    1d. the "<name>_files" folder of images and css next to an html output
+    """
+    return output.with_name(f"{output.stem}_files")
+
+
+@dataclass
+class NativeRequest:
+    """
+    2a. one conversion handed to a native backend
+    dest is the temp file to write, output the name it will be renamed to,
+    options holds the run's backend settings by backend family (e.g. "comic")
+    a backend whose output links to files of its own writes them to
+    files_dest, they are moved to files_name next to the output with it
+    """
+    source: Path
+    dest: Path
+    output: Path
+    options: Dict[str, Any] = field(default_factory=dict)
+    on_progress: Callable[[int, str], None] = lambda percent, stage: None
+    should_stop: Callable[[], bool] = lambda: False
+    
+    @property
+    def files_dest(self) -> Path:
+        return companion_folder(self.dest)
+    
+    @property
+    def files_name(self) -> str:
+        return companion_folder(self.output).name
+    
+    def check_stop(self):
+        if self.should_stop():
+            raise NativeCancelled()
+
+
+@dataclass(frozen=True)
+class NativeBackend:
+    """
+    2b. a converter for one (source, target) pair
+    convert writes request.dest or raises, any exception but NativeCancelled
+    sends the file to calibre instead
+    """
+    name: str
+    source_format: str
+    target_format: str
+    convert: Callable[[NativeRequest], None]
+
+
+class ConverterRegistry:
+    """
+    3a. native backends keyed by (source, target) format names
+    """
+    
+    def __init__(self):
+        self._backends: Dict[Tuple[str, str], NativeBackend] = {}
+    
+    def register(self, source_format: str, target_format: str, name: Optional[str] = None):
+        """
+        3b. decorator, registers convert(request) for the pair
+        a later registration for the same pair replaces the earlier one
+        """
+        source_format, target_format = source_format.upper(), target_format.upper()
+        if source_format not in EBOOK_FORMATS or target_format not in EBOOK_FORMATS:
+            raise ValueError(f"unknown format pair: {source_format} -> {target_format}")
+        
+        def decorator(convert: Callable[[NativeRequest], None]):
+            label = name or f"native {source_format.lower()}>{target_format.lower()}"
+            self._backends[(source_format, target_format)] = NativeBackend(
+                label, source_format, target_format, convert
+            )
+            return convert
+        
+        return decorator
+    
+    def lookup(self, source_format: str, target_format: str) -> Optional[NativeBackend]:
+        return self._backends.get((source_format.upper(), target_format.upper()))
+    
+    def pairs(self) -> List[Tuple[str, str]]:
+        return sorted(self._backends)
+    
+    @property
+    def target_formats(self) -> List[str]:
+        """
+        3c. formats some native backend can write
+        """
+        return sorted({target for _, target in self._backends})
+
+
+class BackendTimes:
+    """
+    4a. files, seconds and source bytes per backend for one run, so the
+    summary shows what the native paths saved
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: Dict[str, List[float]] = {}
+    
+    def record(self, backend: str, seconds: float, size: int):
+        with self._lock:
+            totals = self._totals.setdefault(backend, [0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += size
+    
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        4b. {backend: {"files", "seconds", "bytes"}}, slowest per file first
+        """
+        with self._lock:
+            items = sorted(self._totals.items(), key=lambda item: -item[1][1] / item[1][0])
+            return {
+                name: {"files": int(files), "seconds": seconds, "bytes": int(size)}
+                for name, (files, seconds, size) in items
+            }
+    
+    def describe(self) -> List[str]:
+        """
+        4c. one line per backend for the summary block
+        """
+        lines = []
+        for name, totals in self.summary().items():
+            per_file = totals["seconds"] / totals["files"]
+            lines.append(
+                f"{name}: {totals['files']} file(s) in {totals['seconds']:.1f} s, "
+                f"{per_file * 1000:.0f} ms per file"
+            )
+        return lines
@@ -0,0 +1,70 @@
+"""
+EBook Converter Pro - job scheduling tests
+
+    python -m unittest discover tests
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from scheduler import PACK_MAX_FILES, PACK_SECONDS, CostQueue, FairQueue
+
+
+class CostQueueTest(unittest.TestCase):
+    
+    def test_most_expensive_first_ties_in_order(self):
+        jobs = CostQueue()
+        for name, cost in [("a", 50.0), ("b", 300.0), ("c", 50.0), ("d", 120.0)]:
+            jobs.push(name, cost)
+        order = []
+        while jobs:
+            order.extend(jobs.pop_task(workers=4))
+        self.assertEqual(order, ["b", "d", "a", "c"])
+    
+    def test_small_jobs_are_packed(self):
+        jobs = CostQueue()
+        jobs.push("big", PACK_SECONDS * 10)
+        for n in range(40):
+            jobs.push(f"small{n}", 0.1)
+        self.assertEqual(jobs.pop_task(workers=1), ["big"])
+        # 3a. one slot takes a full pack, two share what is left
+        self.assertEqual(jobs.pop_task(workers=1), [f"small{n}" for n in range(PACK_MAX_FILES)])
+        self.assertEqual(len(jobs.pop_task(workers=2)), (40 - PACK_MAX_FILES) // 2)
+    
+    def test_pack_stops_at_its_budget(self):
+        jobs = CostQueue()
+        for n in range(5):
+            jobs.push(n, PACK_SECONDS * 0.3)
+        self.assertEqual(jobs.pop_task(workers=1), [0, 1, 2])
+
+
+class FairQueueTest(unittest.TestCase):
+    
+    def test_clients_take_turns(self):
+        jobs = FairQueue(limit=10)
+        for job in ["a1", "a2", "a3"]:
+            jobs.push("alice", job)
+        jobs.push("bob", "b1")
+        jobs.push("carol", "c1")
+        self.assertEqual([jobs.position("alice", "a3"), jobs.position("bob", "b1")], [4, 1])
+        self.assertEqual([jobs.pop() for _ in range(5)], ["a1", "b1", "c1", "a2", "a3"])
+        self.assertIsNone(jobs.pop())
+    
+    def test_bounds(self):
+        jobs = FairQueue(limit=3, per_client=2)
+        self.assertTrue(jobs.push("alice", 1))
+        self.assertTrue(jobs.push("alice", 2))
+        self.assertEqual(jobs.room_for("alice"), "too many queued jobs for this client")
+        self.assertFalse(jobs.push("alice", 3))
+        self.assertTrue(jobs.push("bob", 4))
+        self.assertEqual(jobs.room_for("carol"), "queue is full")
+        self.assertTrue(jobs.remove("alice", 1))
+        self.assertIsNone(jobs.room_for("carol"))
+        self.assertIsNone(jobs.position("alice", 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
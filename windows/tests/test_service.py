@@ -0,0 +1,135 @@
+"""
+EBook Converter Pro - HTTP service tests
+Runs the service on localhost against the stand-in ebook-convert and
+talks to it over HTTP: upload, status, download and the turns waiting
+jobs take between clients
+
+    python -m unittest discover tests
+"""
+
+import http.client
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from support import write_stub
+
+from history import ConversionHistory
+from service import ConversionService, ServiceServer
+
+
+# 1a. a fake PDF, the stub copies it to MOBI so that download must match it
+BOOK = b"%PDF-1.4\n" + bytes(range(256)) * 64
+TIMEOUT = 30.0
+
+
+class ServiceTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.folder = Path(tempfile.mkdtemp(prefix="ebook-service-test-"))
+        self.addCleanup(shutil.rmtree, self.folder, ignore_errors=True)
+        os.environ["STUB_DELAY"] = "0.4"
+        self.addCleanup(os.environ.pop, "STUB_DELAY", None)
+        
+        self.service = ConversionService(write_stub(self.folder), ["EPUB", "MOBI"], spool=self.folder / "spool")
+        self.service.history = ConversionHistory(self.folder / "history.json")
+        self.service.start()
+        self.server = ServiceServer(("127.0.0.1", 0), self.service, quiet=True)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.service.close)
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+    
+    def request(self, method: str, path: str, client: str = "alice", body: bytes = None):
+        """
+        2a. (status, body), the body parsed when it is json
+        """
+        connection = http.client.HTTPConnection(*self.server.server_address, timeout=TIMEOUT)
+        try:
+            connection.request(method, path, body=body, headers={"X-Client-Id": client})
+            response = connection.getresponse()
+            data = response.read()
+            if response.getheader("Content-Type") == "application/json":
+                data = json.loads(data)
+            return response.status, data
+        finally:
+            connection.close()
+    
+    def upload(self, name: str, client: str = "alice", target: str = "epub") -> str:
+        status, job = self.request("POST", f"/jobs?to={target}&name={name}", client, BOOK)
+        self.assertEqual(status, 202, job)
+        return job["id"]
+    
+    def wait(self, job_id: str, client: str = "alice", states=("done", "failed", "cancelled")) -> dict:
+        deadline = time.monotonic() + TIMEOUT
+        while time.monotonic() < deadline:
+            status, job = self.request("GET", f"/jobs/{job_id}", client)
+            self.assertEqual(status, 200, job)
+            if job["state"] in states:
+                return job
+            time.sleep(0.05)
+        self.fail(f"job {job_id} still {job['state']} after {TIMEOUT} seconds")
+    
+    def test_upload_status_download(self):
+        job_id = self.upload("book.pdf", target="mobi")
+        job = self.wait(job_id)
+        self.assertEqual(job["state"], "done", job)
+        self.assertEqual(job["to"], "MOBI")
+        self.assertEqual(job["percent"], 100)
+        self.assertEqual(job["output"], "book.mobi")
+        self.assertEqual(job["size"], len(BOOK))
+        
+        status, data = self.request("GET", job["download"])
+        self.assertEqual(status, 200)
+        self.assertEqual(data, BOOK)
+        
+        status, jobs = self.request("GET", "/jobs")
+        self.assertEqual([job["id"] for job in jobs["jobs"]], [job_id])
+        
+        # 3a. deleting a finished job removes it and its files, a second
+        # delete that found the job before the first took it does no harm
+        found = self.service.job("alice", job_id)
+        status, deleted = self.request("DELETE", f"/jobs/{job_id}")
+        self.assertEqual(deleted["state"], "deleted")
+        self.assertEqual(self.service.cancel(found)["state"], "deleted")
+        self.assertEqual(self.request("GET", f"/jobs/{job_id}")[0], 404)
+        self.assertEqual(list((self.folder / "spool").iterdir()), [])
+    
+    def test_failed_and_refused_jobs(self):
+        job = self.wait(self.upload("fail.pdf"))
+        self.assertEqual(job["state"], "failed")
+        self.assertTrue(job["error"])
+        self.assertEqual(self.request("GET", f"/jobs/{job['id']}/output")[0], 409)
+        
+        status, error = self.request("POST", "/jobs?to=docx&name=book.pdf", body=BOOK)
+        self.assertEqual(status, 400)
+        self.assertIn("EPUB", error["error"])
+        # 3b. one client can't see another's jobs
+        self.assertEqual(self.request("GET", f"/jobs/{job['id']}", client="bob")[0], 404)
+    
+    def test_clients_take_turns(self):
+        first = self.upload("a1.pdf")
+        self.wait(first, states=("running",))
+        alice = [self.upload(f"a{n}.pdf") for n in (2, 3, 4)]
+        bob = self.upload("b1.pdf", client="bob")
+        
+        # 3c. bob's one book goes after alice's next, not after all of them
+        positions = [self.request("GET", f"/jobs/{job_id}")[1]["position"] for job_id in alice]
+        self.assertEqual(positions, [0, 2, 3])
+        self.assertEqual(self.request("GET", f"/jobs/{bob}", client="bob")[1]["position"], 1)
+        
+        finished = {job_id: self.wait(job_id)["finished"] for job_id in [first, *alice]}
+        finished[bob] = self.wait(bob, client="bob")["finished"]
+        order = sorted(finished, key=finished.get)
+        self.assertEqual(order, [first, alice[0], bob, alice[1], alice[2]])
+
+
+if __name__ == "__main__":
+    unittest.main()